@@ -0,0 +1,192 @@
+"""
+Load shedding for the chat endpoints.
+
+SingleFlight coalesces identical concurrent work: the first caller with a key
+starts the work as a task, callers arriving while it runs await the same
+task, and everyone gets its result (or exception). The chat path coalesces
+retrieval on (generation, question, k, scope) and answering on (generation,
+prompt, k, structured, scope), so a burst of the same question costs one
+retrieval and one Gemini call. The task is cancelled only when every caller
+waiting on it has gone away.
+
+AdmissionQueue bounds the chat requests in progress: up to max_active run,
+up to max_queue more wait (FIFO) at most max_wait seconds for a slot, and
+anything beyond that is rejected at once with Overloaded (a 429 with
+Retry-After), so overload shows up as fast rejections instead of latency.
+Retry-After is estimated from the queue depth and recent slot hold times.
+max_active <= 0 turns admission control off.
+
+Both are per event loop (per server worker), like the LLM semaphore.
+"""
+
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(f"Server busy ({reason}); retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        # key -> [task, callers waiting on it]
+        self._flights: Dict[Hashable, list] = {}
+        # kind -> [calls, calls that joined a running flight]
+        self._counts: Dict[str, list] = {}
+
+    async def run(
+        self, kind: str, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        counts = self._counts.setdefault(kind, [0, 0])
+        counts[0] += 1
+        key = (kind, key)
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            counts[1] += 1
+        flight[1] += 1
+        try:
+            # shielded: one caller going away doesn't cancel the others' result
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                flight[0].cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: list) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            kind: {
+                "requests": calls,
+                "coalesced": joined,
+                "ratio": (joined / calls) if calls else 0.0,
+            }
+            for kind, (calls, joined) in self._counts.items()
+        }
+
+
+class AdmissionQueue:
+    def __init__(self, max_active: int, max_queue: int, max_wait: float) -> None:
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._hold_avg = 1.0  # seconds a slot is held, moving average
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new request."""
+        backlog = (self.waiting + 1) / max(1, self.max_active)
+        return max(1, min(60, math.ceil(self._hold_avg * backlog)))
+
+    async def acquire(self) -> None:
+        if self.max_active <= 0:  # admission control off
+            self.admitted += 1
+            return
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.waiting >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("queue full", self.retry_after())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            # release() hands its slot over by resolving the waiter
+            await asyncio.wait_for(waiter, self.max_wait)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # got the slot just as we gave up
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected["timeout"] += 1
+                raise Overloaded("queue wait timed out", self.retry_after()) from None
+            raise
+        self.admitted += 1
+
+    def release(self, held: float = 0.0) -> None:
+        if self.max_active <= 0:
+            return
+        if held:
+            self._hold_avg = 0.9 * self._hold_avg + 0.1 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes on; active unchanged
+                return
+        self.active -= 1
+
+    def ticket(self) -> "AdmissionTicket":
+        return AdmissionTicket(self)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        ticket = self.ticket()
+        await ticket.acquire()
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "hold_seconds_avg": round(self._hold_avg, 3),
+        }
+
+
+class AdmissionTicket:
+    """One admitted request; release() is idempotent, so a streaming
+    response can release from several places (whichever runs first)."""
+
+    __slots__ = ("queue", "t0")
+
+    def __init__(self, queue: AdmissionQueue) -> None:
+        self.queue = queue
+        self.t0 = 0.0
+
+    async def acquire(self) -> None:
+        await self.queue.acquire()
+        self.t0 = time.monotonic()
+
+    def release(self) -> None:
+        if self.t0:
+            held, self.t0 = time.monotonic() - self.t0, 0.0
+            self.queue.release(held)
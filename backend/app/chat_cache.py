@@ -0,0 +1,171 @@
+"""
+In-process caches for the chat path.
+
+- RetrievalCache: LRU + TTL map from (generation, normalized question, k,
+  scope) to the retrieved documents and the query vector, skipping the query
+  embedding and the vector search for repeated questions.
+- SemanticAnswerCache: returns a stored answer when a new query vector is
+  within a cosine threshold of a cached one asked with the same k and scope.
+
+Every entry carries the index generation it was produced under; the bot bumps
+the generation on reload(), so nothing computed against an old index is served.
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    q = re.sub(r"\s+", " ", question).strip().lower()
+    return q.rstrip("?!. ")
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class RetrievalCache(_Counters):
+    """Thread-safe LRU with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        generation: int, question: str, k: int, scope: Hashable = None
+    ) -> Tuple[int, str, int, Hashable]:
+        return (generation, normalize_question(question), k, scope)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or time.monotonic() - item[0] > self.ttl_seconds:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        return {**super().stats(), "entries": size, "max_entries": self.max_entries}
+
+
+class SemanticAnswerCache(_Counters):
+    """Bounded list of (query vector, answer); lookup is one matrix-vector product."""
+
+    def __init__(self, max_entries: int = 0, threshold: float = 0.95) -> None:
+        super().__init__()
+        self.max_entries = max_entries
+        self.threshold = threshold
+        # (generation, k, structured, retrieval scope) of every entry
+        self._scope: List[Tuple[int, int, bool, Hashable]] = []
+        self._vectors: List[np.ndarray] = []
+        self._answers: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def get(
+        self,
+        generation: int,
+        k: int,
+        structured: bool,
+        vector: List[float],
+        scope: Hashable = None,
+    ) -> Optional[str]:
+        if not self.enabled:
+            return None
+        scope = (generation, k, structured, scope)
+        with self._lock:
+            rows = [i for i, s in enumerate(self._scope) if s == scope]
+            if rows:
+                sims = np.stack([self._vectors[i] for i in rows]) @ self._unit(vector)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return self._answers[rows[best]]
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        generation: int,
+        k: int,
+        structured: bool,
+        vector: List[float],
+        answer: str,
+        scope: Hashable = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._scope.append((generation, k, structured, scope))
+            self._vectors.append(self._unit(vector))
+            self._answers.append(answer)
+            overflow = len(self._answers) - self.max_entries
+            if overflow > 0:
+                del self._scope[:overflow]
+                del self._vectors[:overflow]
+                del self._answers[:overflow]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scope.clear()
+            self._vectors.clear()
+            self._answers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._answers)
+        return {
+            **super().stats(),
+            "entries": size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+        }
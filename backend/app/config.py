@@ -1,4 +1,5 @@
 import os
+import json
 
 
 class Settings:
@@ -7,6 +8,109 @@ class Settings:
     DB_NAME: str = os.getenv("DB_NAME", "ragdb")
     KB_FOLDER: str = os.getenv("KB_FOLDER", "/data/knowledge_base")
     PERSIST_DIR: str = os.getenv("PERSIST_DIR", "/data/kb_chroma")
+    # Processes used to parse/split PDFs while indexing (1 = serial)
+    INDEX_WORKERS: int = int(os.getenv("INDEX_WORKERS", "1"))
+    # Chunks embedded + upserted per batch; bounds indexing memory
+    INDEX_BATCH_SIZE: int = int(os.getenv("INDEX_BATCH_SIZE", "128"))
+    # Files parsed ahead of the embedder by the worker pool (0 = 2 per worker)
+    INDEX_MAX_INFLIGHT_FILES: int = int(os.getenv("INDEX_MAX_INFLIGHT_FILES", "0"))
+    # "google" (Gemini API) or "local" (sentence-transformers on CPU)
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "google")
+    # Empty = the backend's default model
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    # Torch CPU threads for the local backend (0 = library default)
+    EMBEDDING_THREADS: int = int(os.getenv("EMBEDDING_THREADS", "0"))
+    # Max chunk vectors kept in the on-disk embedding cache (0 disables it)
+    EMBED_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+    # Threads for blocking retrieval work and cap on concurrent Gemini calls
+    CHAT_THREADS: int = int(os.getenv("CHAT_THREADS", "16"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    # Question -> retrieved docs cache (0 disables)
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+    RETRIEVAL_CACHE_TTL: float = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+    # Semantic answer cache, off by default (0 disables)
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "0"))
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    # "vector" or "hybrid" (BM25 + vector, reciprocal rank fusion)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "vector")
+    # Hybrid only: skip the embedding call when the best BM25 hit scores at
+    # least this many times the runner-up (0 disables the fast path)
+    LEXICAL_FAST_PATH_RATIO: float = float(os.getenv("LEXICAL_FAST_PATH_RATIO", "3"))
+    # Approximate token budget for retrieved context in the prompt (0 = no
+    # limit; k=6 chunks of CHUNK_SIZE=1500 chars are about 2250 tokens, so a
+    # budget below k * CHUNK_SIZE / 4 trims default requests) and the shingle
+    # similarity above which a chunk counts as a duplicate
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+    CONTEXT_DUP_THRESHOLD: float = float(os.getenv("CONTEXT_DUP_THRESHOLD", "0.8"))
+    # /chat/batch: LLM calls in flight per batch, retries of a failed call
+    # (exponential backoff) and the most questions accepted in one request
+    BATCH_LLM_CONCURRENCY: int = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+    BATCH_MAX_RETRIES: int = int(os.getenv("BATCH_MAX_RETRIES", "3"))
+    BATCH_MAX_QUESTIONS: int = int(os.getenv("BATCH_MAX_QUESTIONS", "5000"))
+    # /chat and /chat/stream admission: requests handled at once, requests
+    # waiting beyond that (FIFO) and how long they may wait before a 429 with
+    # Retry-After (CHAT_MAX_ACTIVE=0 turns admission control off)
+    CHAT_MAX_ACTIVE: int = int(os.getenv("CHAT_MAX_ACTIVE", "64"))
+    CHAT_MAX_QUEUE: int = int(os.getenv("CHAT_MAX_QUEUE", "256"))
+    CHAT_MAX_WAIT_SECONDS: float = float(os.getenv("CHAT_MAX_WAIT_SECONDS", "10"))
+    # Per-stage latency histograms on /metrics and Server-Timing headers on
+    # chat responses; PROFILE_SAMPLE_RATE > 0 cProfiles that fraction of
+    # retrievals into PROFILE_DIR (default PERSIST_DIR/profiles), newest N kept
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "1") == "1"
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "")
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", "20"))
+    # Dense search engine: "chroma" (HNSW), "flat" (exact search over mmap'd
+    # float32 vectors) or "int8" (quantized scan + exact re-scoring of
+    # FLAT_RESCORE x k candidates); see app/flat_index.py
+    VECTOR_ENGINE: str = os.getenv("VECTOR_ENGINE", "chroma")
+    FLAT_RESCORE: int = int(os.getenv("FLAT_RESCORE", "4"))
+    # Text splitter settings, in characters; CHUNK_SEPARATORS is a JSON list
+    # (empty = paragraph, line, sentence, word, character). Changing them
+    # re-splits every file on the next build, from cached page text
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", "1500"))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", "200"))
+    CHUNK_SEPARATORS: list = json.loads(os.getenv("CHUNK_SEPARATORS") or "[]")
+    # Size cap of the parsed-page cache in PERSIST_DIR/page_cache (0 disables)
+    PAGE_CACHE_MAX_MB: float = float(os.getenv("PAGE_CACHE_MAX_MB", "512"))
+    # Chunks at least this similar (MinHash estimate of word 5-shingle
+    # Jaccard) to a stored chunk are stored and embedded once (0 disables)
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+    # Recent (question, answer) pairs kept on each session document
+    HISTORY_WINDOW_PAIRS: int = int(os.getenv("HISTORY_WINDOW_PAIRS", "20"))
+    # Approximate token budget for chat history in the prompt
+    HISTORY_TOKEN_BUDGET: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+    # Superseded index generations kept for rollback, and how long (seconds)
+    # a switched-away generation survives before it may be deleted
+    GENERATION_KEEP: int = int(os.getenv("GENERATION_KEEP", "2"))
+    GENERATION_GRACE_SECONDS: float = float(os.getenv("GENERATION_GRACE_SECONDS", "300"))
+    # Incremental updates are overlays on the active generation holding only
+    # what changed; the next update folds a chain this many layers deep, or
+    # with more than INDEX_MAX_HIDDEN deleted/replaced chunks left in its
+    # lower layers, into one generation. Below 2, every update copies the
+    # active generation instead (see app/generations.py)
+    INDEX_MAX_LAYERS: int = int(os.getenv("INDEX_MAX_LAYERS", "8"))
+    INDEX_MAX_HIDDEN: int = int(os.getenv("INDEX_MAX_HIDDEN", "2000"))
+    # Apply incremental updates to the active generation instead of a new one
+    # on top of it (no rollback; queries may see a half-applied update). Only
+    # for a single server worker.
+    INDEX_IN_PLACE: bool = os.getenv("INDEX_IN_PLACE", "0") == "1"
+    # How often (seconds) a server worker checks whether another worker
+    # published a new index generation
+    INDEX_RELOAD_CHECK_SECONDS: float = float(os.getenv("INDEX_RELOAD_CHECK_SECONDS", "1"))
+    # Open the store, embed a probe and build the chains at startup; /readyz
+    # reports ready once this is done
+    WARMUP: bool = os.getenv("WARMUP", "1") == "1"
+    # Buffer last_activity_at bumps of messages without an answer (e.g. a
+    # failed chat) and bulk-flush them every N ms (0 = off). A chat turn's
+    # session update, which also appends to the history window, is always
+    # written immediately (see SessionActivityBuffer)
+    SESSION_WRITE_BEHIND_MS: int = int(os.getenv("SESSION_WRITE_BEHIND_MS", "0"))
+    # At startup, convert messages that still embed their sources to chunk
+    # references (in the background, in one server process; rewrites messages
+    # for good, see app/db/maintenance.py for the one-off command instead)
+    MIGRATE_INLINE_SOURCES: bool = os.getenv("MIGRATE_INLINE_SOURCES", "0") == "1"
 
 
 settings = Settings()
@@ -0,0 +1,136 @@
+"""
+Context packing: what actually goes into the prompt out of the retrieved chunks.
+
+1. Near-duplicates are dropped: a chunk whose word-shingle Jaccard similarity
+   to a better-ranked kept chunk is >= dup_threshold (repeated boilerplate
+   pages, the same text in two files, ...).
+2. Chunks that are neighbours in the same file are merged into one passage,
+   with the splitter's overlap between them written once.
+3. Passages are added in relevance order until the token budget is used up;
+   the passage that crosses the budget is cut to fit.
+
+Token counts use the same ~4 chars/token estimate as the chat history budget.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from .tokens import CHARS_PER_TOKEN, approx_tokens
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {hash(" ".join(words))}
+    return {hash(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def _position(doc: Any) -> Optional[Tuple[str, int]]:
+    # doc_ids are "<path>::<chunk index>::<uuid>" (see indexing.chunk_id)
+    parts = str(doc.metadata.get("doc_id", "")).rsplit("::", 2)
+    if len(parts) != 3:
+        return None
+    try:
+        return parts[0], int(parts[1])
+    except ValueError:
+        return None
+
+
+def _stitch(first: str, second: str, max_overlap: int = 400) -> str:
+    """first + second, with the text they overlap on written once."""
+    probe = second[:32]
+    if probe:
+        at = first.find(probe, max(0, len(first) - max_overlap))
+        while at != -1:
+            if second.startswith(first[at:]):
+                return first[:at] + second
+            at = first.find(probe, at + 1)
+    return f"{first}\n{second}"
+
+
+def _block_tokens(doc: Any) -> int:
+    src = doc.metadata.get("file_name") or doc.metadata.get("source") or "unknown"
+    return approx_tokens(f"[SOURCE: {src}]\n{doc.page_content}\n\n")
+
+
+def pack_context(
+    docs: List[Any], token_budget: int = 0, dup_threshold: float = 0.8
+) -> Tuple[List[Any], Dict[str, int]]:
+    """Docs to put in the prompt (same Document type, best first) and a report.
+
+    token_budget <= 0 means no budget; dup_threshold >= 1 disables dedup.
+    """
+    tokens_before = sum(_block_tokens(d) for d in docs)
+
+    # 1. near-duplicates
+    kept: List[Any] = []
+    kept_shingles: List[set] = []
+    for doc in docs:
+        sh = _shingles(doc.page_content)
+        similar = (len(sh & other) / len(sh | other) for other in kept_shingles)
+        if dup_threshold < 1 and any(sim >= dup_threshold for sim in similar):
+            continue
+        kept.append(doc)
+        kept_shingles.append(sh)
+    duplicates = len(docs) - len(kept)
+
+    # 2. merge neighbours: runs of consecutive chunk indexes of one file
+    rank = {id(d): i for i, d in enumerate(kept)}
+    by_file: Dict[str, List[Tuple[int, Any]]] = {}
+    groups: List[List[Any]] = []
+    for doc in kept:
+        pos = _position(doc)
+        if pos is None:
+            groups.append([doc])
+        else:
+            by_file.setdefault(pos[0], []).append((pos[1], doc))
+    for chunks in by_file.values():
+        chunks.sort(key=lambda c: c[0])
+        run = [chunks[0]]
+        for chunk in chunks[1:]:
+            if chunk[0] == run[-1][0] + 1:
+                run.append(chunk)
+            else:
+                groups.append([d for _, d in run])
+                run = [chunk]
+        groups.append([d for _, d in run])
+    groups.sort(key=lambda g: min(rank[id(d)] for d in g))
+
+    passages = []
+    for group in groups:
+        if len(group) == 1:
+            passages.append(group[0])
+            continue
+        text = group[0].page_content
+        for doc in group[1:]:
+            text = _stitch(text, doc.page_content)
+        first = group[0]
+        passages.append(type(first)(page_content=text, metadata=dict(first.metadata)))
+    merged = len(kept) - len(passages)
+
+    # 3. budget
+    packed: List[Any] = []
+    used = 0
+    truncated = 0
+    for doc in passages:
+        need = _block_tokens(doc)
+        if token_budget > 0 and used + need > token_budget:
+            room = token_budget - used - (need - approx_tokens(doc.page_content))
+            if room >= 50:  # a useful fragment still fits
+                cut = doc.page_content[: room * CHARS_PER_TOKEN]
+                packed.append(type(doc)(page_content=cut, metadata=dict(doc.metadata)))
+                used += _block_tokens(packed[-1])
+                truncated += 1
+            break
+        packed.append(doc)
+        used += need
+
+    return packed, {
+        "chunks_in": len(docs),
+        "chunks_out": len(packed),
+        "duplicates_dropped": duplicates,
+        "chunks_merged": merged,
+        "truncated": truncated,
+        "tokens_before": tokens_before,
+        "tokens_after": used,
+        "tokens_saved": tokens_before - used,
+    }
@@ -0,0 +1,62 @@
+"""
+One-off chat store maintenance.
+
+Usage (from backend/, with the server's MONGO_URI / DB_NAME):
+    python -m app.db.maintenance migrate-sources [--dry-run]
+    python -m app.db.maintenance gc-chunks [--dry-run] [--grace-hours H]
+
+migrate-sources converts messages that still embed their sources to chunk
+references (mongo_repo.migrate_inline_sources). The inline source lists are
+not kept: back up `messages` first, or look at --dry-run's report. gc-chunks
+deletes chunk store rows no message refers to (mongo_repo.gc_chunks).
+
+Each takes a lock in the database, so running one while another instance of
+it (or a server with MIGRATE_INLINE_SOURCES=1) is at work just exits.
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ..config import settings
+from . import mongo_repo as repo
+
+
+async def _run(args) -> int:
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    db = client[settings.DB_NAME]
+    try:
+        async with repo.maintenance_lock(db, args.command) as held:
+            if not held:
+                print(f"[maintenance] {args.command} is running elsewhere")
+                return 1
+            if args.command == "migrate-sources":
+                report = await repo.migrate_inline_sources(db, dry_run=args.dry_run)
+            else:
+                report = await repo.gc_chunks(
+                    db, grace_seconds=args.grace_hours * 3600, dry_run=args.dry_run
+                )
+    finally:
+        client.close()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.db.maintenance")
+    ap.add_argument("command", choices=["migrate-sources", "gc-chunks"])
+    ap.add_argument("--dry-run", action="store_true", help="report, write nothing")
+    ap.add_argument(
+        "--grace-hours",
+        type=float,
+        default=24.0,
+        help="gc-chunks: keep chunks stored this recently (at least 1)",
+    )
+    sys.exit(asyncio.run(_run(ap.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
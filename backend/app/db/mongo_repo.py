@@ -1,24 +1,53 @@
 # app/db/mongo_repo.py
+import os
+import json
+import time
+import base64
+import asyncio
+import socket
+import hashlib
 import datetime
-from typing import List, Tuple, Dict, Any, Optional
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Tuple, Dict, Any, Optional, Set
+import bson
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from ..config import settings
 
 _client: Optional[AsyncIOMotorClient] = None
 _db: Optional[AsyncIOMotorDatabase] = None
+_activity_buffer: Optional["SessionActivityBuffer"] = None
 
 
 async def init_mongo() -> AsyncIOMotorDatabase:
-    global _client, _db
+    global _client, _db, _activity_buffer
     if _db is None:
         _client = AsyncIOMotorClient(settings.MONGO_URI)
         _db = _client[settings.DB_NAME]
         await ensure_indexes(_db)
+        if settings.SESSION_WRITE_BEHIND_MS > 0:
+            _activity_buffer = SessionActivityBuffer(
+                _db, settings.SESSION_WRITE_BEHIND_MS / 1000
+            )
+            _activity_buffer.start()
     return _db
 
 
+async def close_mongo() -> None:
+    """Flush buffered session updates and close the client."""
+    global _client, _db, _activity_buffer
+    if _activity_buffer is not None:
+        await _activity_buffer.close()
+        _activity_buffer = None
+    if _client is not None:
+        _client.close()
+    _client = None
+    _db = None
+
+
 async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
     await db["sessions"].create_index([("last_activity_at", -1)])
     # Unique only when the field exists (prevents conflicts on missing field)
@@ -29,6 +58,13 @@ async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
         name="uniq_session_key_if_present",
     )
     await db["messages"].create_index([("session_id", 1), ("created_at", 1)])
+    # Keyset pagination: (sort key, _id) so pages are stable under ties
+    await db["sessions"].create_index([("last_activity_at", -1), ("_id", -1)])
+    await db["messages"].create_index(
+        [("session_id", 1), ("created_at", 1), ("_id", 1)]
+    )
+    # resolving source references: (doc_id, generation) -> chunk
+    await db["chunks"].create_index([("doc_id", 1), ("gens", 1)])
 
 
 def _is_valid_object_id(val: str) -> bool:
@@ -49,7 +85,12 @@ async def get_or_create_session(
     # No id provided → create new session
     if not session_id:
         res = await db["sessions"].insert_one(
-            {"created_at": now, "last_activity_at": now, "meta": {}}
+            {
+                "created_at": now,
+                "last_activity_at": now,
+                "meta": {},
+                "history_window": True,
+            }
         )
         return res.inserted_id
 
@@ -70,6 +111,7 @@ async def get_or_create_session(
                 "last_activity_at": now,
                 "meta": {},
                 "session_key": session_id,
+                "history_window": True,
             }
         },
         upsert=True,
@@ -84,68 +126,674 @@ async def save_message(
     role: str,
     content: str,
     sources: Optional[List[Dict[str, Any]]] = None,
+    question: Optional[str] = None,
 ) -> None:
+    """Insert a message and bump the session's activity time.
+
+    Passing `question` with an assistant message also appends the
+    (question, answer) pair to the session's capped `recent_pairs` window
+    in the same update, so history reads don't have to scan messages.
+    """
     now = datetime.datetime.utcnow()
+    refs = await _store_sources(db, sources)
     await db["messages"].insert_one(
         {
             "session_id": session_oid,
             "role": role,
             "content": content,
-            "sources": sources or [],
+            **refs,
             "created_at": now,
         }
     )
-    await db["sessions"].update_one(
-        {"_id": session_oid}, {"$set": {"last_activity_at": now}}
+    if role == "assistant" and question is not None:
+        pair = {"user": question, "assistant": content}
+        await db["sessions"].update_one(
+            {"_id": session_oid}, _session_update(now, [pair])
+        )
+    elif _activity_buffer is not None:
+        _activity_buffer.add(session_oid, now)
+    else:
+        await db["sessions"].update_one(
+            {"_id": session_oid}, _session_update(now, [])
+        )
+
+
+def _session_update(
+    at: datetime.datetime, pairs: List[Dict[str, str]]
+) -> Dict[str, Any]:
+    # $max keeps last_activity_at monotonic when a buffered bump lands late
+    update: Dict[str, Any] = {"$max": {"last_activity_at": at}}
+    if pairs:
+        update["$push"] = {
+            "recent_pairs": {"$each": pairs, "$slice": -settings.HISTORY_WINDOW_PAIRS}
+        }
+    return update
+
+
+async def save_turn(
+    db: AsyncIOMotorDatabase,
+    session_oid: ObjectId,
+    question: str,
+    answer: str,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    asked_at: Optional[datetime.datetime] = None,
+) -> None:
+    """Persist a whole chat turn: one insert_many for both messages plus one
+    session update (history window and activity time), after the chunk store
+    upsert of sources it hasn't seen yet. The update is never buffered: every
+    worker reads the window from Mongo."""
+    now = datetime.datetime.utcnow()
+    asked_at = min(asked_at or now, now)
+    refs = await _store_sources(db, sources)
+    await db["messages"].insert_many(
+        [
+            {
+                "session_id": session_oid,
+                "role": "user",
+                "content": question,
+                "sources": [],
+                "created_at": asked_at,
+            },
+            {
+                "session_id": session_oid,
+                "role": "assistant",
+                "content": answer,
+                **refs,
+                "created_at": now,
+            },
+        ],
+        ordered=True,
     )
+    pair = {"user": question, "assistant": answer}
+    await db["sessions"].update_one({"_id": session_oid}, _session_update(now, [pair]))
+
+
+# ---------- Source references ----------
+#
+# Assistant messages don't embed their sources (file name, path and a
+# 500-char snippet per retrieved chunk, the same text over and over). They
+# reference them: the index generation they were retrieved from plus their
+# doc_ids,
+#
+#     {"source_gen": "20260101T120000000000-1a2b3c4d", "source_ids": [...]}
+#
+# and each chunk is stored once in `chunks`, keyed by a hash of its doc_id and
+# content, with the generations it was cited from in `gens` (a doc_id can
+# name different text in different generations). Reads resolve the
+# references of a page of messages with one query. Sources without a doc_id
+# or generation (stores indexed before chunks had ids, messages written
+# before references) are stored under the INLINE_GEN pseudo-generation with
+# a content-derived doc_id. migrate_inline_sources() converts old messages;
+# gc_chunks() deletes chunks no message refers to any more. Both are one-off
+# maintenance runs (python -m app.db.maintenance), serialized by a lease in
+# the `locks` collection.
+
+INLINE_GEN = "inline"
+_CHUNK_FIELDS = ("file_name", "source", "snippet")
+_RESOLVE_BATCH = 500
+# (database, chunk key, generation) -> when this process upserted it. Entries
+# expire after _STORED_CHUNKS_TTL seconds: a cited chunk is upserted (and its
+# stored_at bumped) at least that often, which is what lets gc_chunks() tell
+# chunks nobody can be about to reference again.
+_stored_chunks: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+_STORED_CHUNKS_MAX = 100_000
+_STORED_CHUNKS_TTL = 3600.0
+
+
+def _chunk_key(doc_id: str, src: Dict[str, Any]) -> str:
+    h = hashlib.blake2b(digest_size=12)
+    for part in (doc_id, *(src.get(f) for f in _CHUNK_FIELDS)):
+        h.update(str(part or "").encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+def _source_refs(
+    sources: List[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, Dict[str, Any]]]]:
+    """Message fields referencing `sources`, plus the chunks they refer to
+    ({chunk key: (generation, chunk)})."""
+    gens = {s.get("generation") for s in sources}
+    gen = gens.pop() if len(gens) == 1 else None
+    if gen is None or not all(s.get("doc_id") for s in sources):
+        gen = INLINE_GEN
+    doc_ids: List[str] = []
+    chunks: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    for src in sources:
+        doc_id = src["doc_id"] if gen != INLINE_GEN else f"inline::{_chunk_key('', src)}"
+        chunk = {f: src.get(f) for f in _CHUNK_FIELDS}
+        chunk["doc_id"] = doc_id
+        chunks[_chunk_key(doc_id, src)] = (gen, chunk)
+        doc_ids.append(doc_id)
+    return {"source_gen": gen, "source_ids": doc_ids}, chunks
+
+
+async def _store_chunks(
+    db: AsyncIOMotorDatabase, chunks: Dict[str, Tuple[str, Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """Upsert chunks not yet stored for their generation; returns the ones
+    that were new to the store."""
+    fresh_after = time.monotonic() - _STORED_CHUNKS_TTL
+    todo = [
+        (key, gen, chunk)
+        for key, (gen, chunk) in chunks.items()
+        if _stored_chunks.get((db.name, key, gen), fresh_after) <= fresh_after
+    ]
+    if not todo:
+        return []
+    now = datetime.datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"_id": key},
+            {
+                "$setOnInsert": chunk,
+                "$addToSet": {"gens": gen},
+                "$max": {"stored_at": now},
+            },
+            upsert=True,
+        )
+        for key, gen, chunk in todo
+    ]
+    upserted: Set[int] = set()
+    try:
+        res = await db["chunks"].bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # two writers inserting the same new chunk: the loser's upsert is a
+        # duplicate key error and simply needs to run again as an update.
+        # The chunks the first attempt did insert are updates in the retry,
+        # so they are counted from its error details.
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+        upserted.update(u["index"] for u in e.details.get("upserted", []))
+        res = await db["chunks"].bulk_write(ops, ordered=False)
+    upserted.update(res.upserted_ids)
+    stored = time.monotonic()
+    for key, gen, _ in todo:
+        _stored_chunks.pop((db.name, key, gen), None)
+        _stored_chunks[(db.name, key, gen)] = stored
+    while len(_stored_chunks) > _STORED_CHUNKS_MAX:
+        _stored_chunks.popitem(last=False)
+    return [todo[i][2] for i in sorted(upserted)]
+
+
+async def _store_sources(
+    db: AsyncIOMotorDatabase, sources: Optional[List[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """Store the chunks of `sources`; returns the message fields for them."""
+    if not sources:
+        return {"sources": []}
+    refs, chunks = _source_refs(sources)
+    await _store_chunks(db, chunks)
+    return refs
+
+
+def _source_out(
+    chunk: Optional[Dict[str, Any]], doc_id: str, gen: str
+) -> Dict[str, Any]:
+    if gen == INLINE_GEN:
+        doc_id = gen = None
+    if chunk is None:  # not in the chunk store (e.g. deleted by hand)
+        name = os.path.basename(doc_id.rsplit("::", 2)[0]) if doc_id else None
+        return {
+            "file_name": name,
+            "source": None,
+            "snippet": None,
+            "doc_id": doc_id,
+            "generation": gen,
+        }
+    out = {f: chunk.get(f) for f in _CHUNK_FIELDS}
+    out.update(doc_id=doc_id, generation=gen)
+    return out
+
+
+async def resolve_sources(
+    db: AsyncIOMotorDatabase, messages: List[Dict[str, Any]]
+) -> None:
+    """Replace the source references of raw message documents with the
+    referenced chunks as `sources`, in place, with one chunk store query."""
+    wanted = {
+        (doc_id, m["source_gen"])
+        for m in messages
+        for doc_id in m.get("source_ids") or ()
+    }
+    found: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if wanted:
+        cur = db["chunks"].find(
+            {
+                "doc_id": {"$in": sorted({d for d, _ in wanted})},
+                "gens": {"$in": sorted({g for _, g in wanted})},
+            },
+            {"_id": 0, "doc_id": 1, "gens": 1, **{f: 1 for f in _CHUNK_FIELDS}},
+        )
+        async for chunk in cur:
+            for gen in chunk["gens"]:
+                if (chunk["doc_id"], gen) in wanted:
+                    found[(chunk["doc_id"], gen)] = chunk
+    for m in messages:
+        doc_ids = m.pop("source_ids", None)
+        gen = m.pop("source_gen", None)
+        if doc_ids is not None:
+            m["sources"] = [_source_out(found.get((d, gen)), d, gen) for d in doc_ids]
+
+
+async def migrate_inline_sources(
+    db: AsyncIOMotorDatabase, batch_size: int = 500, dry_run: bool = False
+) -> Dict[str, Any]:
+    """Convert messages that still embed their sources to references.
+
+    Walks the messages in _id order; a converted message no longer matches,
+    so an interrupted run just starts again. Sizes are BSON bytes: what the
+    messages' sources took before, what the references plus the chunks added
+    to the store take now. With dry_run nothing is written and the report
+    says what a run would do. The snippets are kept in `chunks`, but the
+    original per-message source lists are not: back up `messages` first.
+    """
+    migrated = chunks_added = bytes_before = bytes_after = 0
+    query: Dict[str, Any] = {"sources.0": {"$exists": True}}
+    counted: Set[str] = set()
+    while True:
+        rows = (
+            await db["messages"]
+            .find(query, {"sources": 1})
+            .sort("_id", 1)
+            .limit(batch_size)
+            .to_list(length=None)
+        )
+        if not rows:
+            break
+        chunks: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        ops = []
+        for m in rows:
+            refs, found = _source_refs(m["sources"])
+            chunks.update(found)
+            ops.append(
+                UpdateOne({"_id": m["_id"]}, {"$set": refs, "$unset": {"sources": ""}})
+            )
+            bytes_before += len(bson.encode({"sources": m["sources"]}))
+            bytes_after += len(bson.encode(refs))
+        if dry_run:
+            # earlier batches' chunks weren't stored either: count them once
+            new = [key for key in chunks if key not in counted]
+            have = set(await db["chunks"].distinct("_id", {"_id": {"$in": new}}))
+            added = [chunks[key][1] for key in new if key not in have]
+            counted.update(new)
+        else:
+            added = await _store_chunks(db, chunks)
+            await db["messages"].bulk_write(ops, ordered=False)
+        chunks_added += len(added)
+        bytes_after += sum(len(bson.encode(c)) for c in added)
+        migrated += len(rows)
+        query["_id"] = {"$gt": rows[-1]["_id"]}
+    saved = bytes_before - bytes_after
+    return {
+        "dry_run": dry_run,
+        "messages": migrated,
+        "chunks_added": chunks_added,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": saved,
+        # one assistant message per turn
+        "saved_per_10k_turns": round(saved / migrated * 10_000) if migrated else 0,
+    }
+
+
+async def gc_chunks(
+    db: AsyncIOMotorDatabase,
+    grace_seconds: float = 2 * _STORED_CHUNKS_TTL,
+    batch_size: int = 1000,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """Delete chunks that no message refers to (their messages were deleted,
+    or a save failed after its chunks were stored).
+
+    Chunks stored in the last grace_seconds are kept whether referenced or
+    not: a turn being saved right now stores its chunks before its messages,
+    and servers skip the upsert of chunks they stored less than
+    _STORED_CHUNKS_TTL ago, so grace_seconds must not be shorter than that.
+    """
+    if grace_seconds < _STORED_CHUNKS_TTL:
+        raise ValueError(f"grace_seconds must be at least {_STORED_CHUNKS_TTL:g}")
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=grace_seconds)
+    # chunks stored before stored_at existed count as old
+    old = {"$or": [{"stored_at": {"$lt": cutoff}}, {"stored_at": {"$exists": False}}]}
+    referenced = set()
+    cur = db["messages"].find(
+        {"source_ids.0": {"$exists": True}}, {"source_gen": 1, "source_ids": 1}
+    )
+    async for m in cur:
+        referenced.update((doc_id, m["source_gen"]) for doc_id in m["source_ids"])
+
+    scanned = deleted = 0
+    batch: List[str] = []
+
+    async def flush() -> int:
+        if not batch or dry_run:
+            return len(batch)
+        # re-checked: a chunk cited again since the scan has a new stored_at
+        res = await db["chunks"].delete_many({"_id": {"$in": batch}, **old})
+        return res.deleted_count
+
+    async for chunk in db["chunks"].find(old, {"doc_id": 1, "gens": 1}):
+        scanned += 1
+        if not any((chunk["doc_id"], g) in referenced for g in chunk["gens"]):
+            batch.append(chunk["_id"])
+        if len(batch) >= batch_size:
+            deleted += await flush()
+            batch = []
+    deleted += await flush()
+    return {
+        "dry_run": dry_run,
+        "referenced": len(referenced),
+        "scanned": scanned,
+        "deleted": deleted,
+    }
+
+
+# ---------- Maintenance lock ----------
+
+
+async def _acquire_lock(
+    db: AsyncIOMotorDatabase, name: str, owner: str, lease_seconds: float
+) -> bool:
+    """Take (or renew) the named lease; False while another owner holds an
+    unexpired one."""
+    now = datetime.datetime.utcnow()
+    try:
+        await db["locks"].find_one_and_update(
+            {"_id": name, "$or": [{"until": {"$lt": now}}, {"owner": owner}]},
+            {
+                "$set": {
+                    "owner": owner,
+                    "until": now + datetime.timedelta(seconds=lease_seconds),
+                }
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+@asynccontextmanager
+async def maintenance_lock(
+    db: AsyncIOMotorDatabase, name: str, lease_seconds: float = 60.0
+) -> AsyncIterator[bool]:
+    """Yields whether this process got the named lock (across servers and
+    hosts); it is renewed while held and expires lease_seconds after its
+    holder dies."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+    if not await _acquire_lock(db, name, owner, lease_seconds):
+        yield False
+        return
+
+    async def renew() -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                await _acquire_lock(db, name, owner, lease_seconds)
+            except Exception as e:  # retried; the lease outlasts a few misses
+                print(f"[maintenance] renewing lock {name!r} failed: {e}")
+
+    task = asyncio.create_task(renew())
+    try:
+        yield True
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await db["locks"].delete_one({"_id": name, "owner": owner})
+
+
+class SessionActivityBuffer:
+    """Write-behind buffer for session activity times (last_activity_at).
+
+    Bumps are merged per session and flushed with one bulk_write every
+    `interval` seconds and on close(). Only the activity time is buffered:
+    it orders the session list, where a few seconds of lag are harmless.
+    recent_pairs (the history window) is always written right away, since
+    other server workers read it from Mongo and can't see this buffer.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, interval: float) -> None:
+        self._db = db
+        self._interval = interval
+        self._pending: Dict[ObjectId, datetime.datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, session_oid: ObjectId, at: datetime.datetime) -> None:
+        self._pending[session_oid] = max(self._pending.get(session_oid, at), at)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            ops = [
+                UpdateOne({"_id": oid}, _session_update(at, []))
+                for oid, at in batch.items()
+            ]
+            try:
+                await self._db["sessions"].bulk_write(ops, ordered=False)
+            except Exception as e:
+                print(f"[session buffer] flush of {len(ops)} updates failed: {e}")
+                # put them back for the next attempt
+                for oid, at in batch.items():
+                    self.add(oid, at)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
 
 
 async def fetch_history_pairs(
     db: AsyncIOMotorDatabase, session_oid: ObjectId, limit_pairs: int
 ) -> List[Tuple[str, str]]:
-    cur = db["messages"].find({"session_id": session_oid}).sort("created_at", 1)
-    convo = await cur.to_list(length=2000)
+    """Last `limit_pairs` (user, assistant) pairs, oldest first.
+
+    Served from the session's rolling window when it covers the request,
+    otherwise from a newest-first, limited scan of the messages.
+    """
+    if limit_pairs <= 0:
+        return []
+
+    if limit_pairs <= settings.HISTORY_WINDOW_PAIRS:
+        s = await db["sessions"].find_one(
+            {"_id": session_oid},
+            {"history_window": 1, "recent_pairs": {"$slice": -limit_pairs}},
+        )
+        # Sessions created before the window existed fall through to messages
+        if s and s.get("history_window"):
+            return [(p["user"], p["assistant"]) for p in s.get("recent_pairs", [])]
+
+    cur = (
+        db["messages"]
+        .find({"session_id": session_oid}, {"role": 1, "content": 1, "_id": 0})
+        .sort("created_at", -1)
+        .limit(2 * limit_pairs + 2)  # + the pending user message / one stray
+    )
+    recent = await cur.to_list(length=None)
     pairs: List[Tuple[str, str]] = []
-    last_user: Optional[str] = None
-    for m in convo:
-        if m["role"] == "user":
-            last_user = m["content"]
-        elif m["role"] == "assistant" and last_user is not None:
-            pairs.append((last_user, m["content"]))
-            last_user = None
+    last_assistant: Optional[str] = None
+    for m in recent:  # newest first
+        if m["role"] == "assistant":
+            last_assistant = m["content"]
+        elif m["role"] == "user" and last_assistant is not None:
+            pairs.append((m["content"], last_assistant))
+            last_assistant = None
+    pairs.reverse()
     return pairs[-limit_pairs:]
 
 
-async def list_sessions(db: AsyncIOMotorDatabase) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    async for s in db["sessions"].find().sort("last_activity_at", -1):
-        out.append(
-            {
-                "session_id": str(s["_id"]),  # canonical id
-                "external_key": s.get("session_key"),  # if client used a UUID
-                "created_at": s.get("created_at"),
-                "last_activity_at": s.get("last_activity_at"),
-                "title": s.get("title"),
-            }
-        )
+# ---------- Keyset pagination ----------
+
+_SESSION_FIELDS = {"session_key": 1, "created_at": 1, "last_activity_at": 1, "title": 1}
+_MESSAGE_FIELDS = {"role": 1, "content": 1, "created_at": 1}
+_SOURCE_FIELDS = {"sources": 1, "source_gen": 1, "source_ids": 1}
+
+
+def encode_cursor(at: datetime.datetime, oid: ObjectId) -> str:
+    raw = json.dumps({"t": at.isoformat(), "id": str(oid)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _after(field: str, cursor: Optional[str], descending: bool) -> Dict[str, Any]:
+    if not cursor:
+        return {}
+    at, oid = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    return {"$or": [{field: {op: at}}, {field: at, "_id": {op: oid}}]}
+
+
+def _session_out(s: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": str(s["_id"]),  # canonical id
+        "external_key": s.get("session_key"),  # if client used a UUID
+        "created_at": s.get("created_at"),
+        "last_activity_at": s.get("last_activity_at"),
+        "title": s.get("title"),
+    }
+
+
+def _message_out(m: Dict[str, Any], include_sources: bool) -> Dict[str, Any]:
+    out = {
+        "role": m["role"],
+        "content": m["content"],
+        "created_at": m.get("created_at"),
+    }
+    if include_sources:
+        out["sources"] = m.get("sources", [])
     return out
 
 
-async def get_session_messages(
-    db: AsyncIOMotorDatabase, session_id: str
-) -> List[Dict[str, Any]]:
+def iter_sessions(
+    db: AsyncIOMotorDatabase, cursor: Optional[str] = None, limit: int = 0
+) -> AsyncIterator[Tuple[Dict[str, Any], str]]:
+    """Sessions newest-activity first as (session, cursor-after-it) pairs.
+
+    limit=0 streams everything after `cursor`, for exports. The cursor is
+    validated here, before iteration starts.
+    """
+    cur = (
+        db["sessions"]
+        .find(_after("last_activity_at", cursor, descending=True), _SESSION_FIELDS)
+        .sort([("last_activity_at", -1), ("_id", -1)])
+        .limit(limit)
+        .batch_size(500)
+    )
+    return _iter_rows(cur, _session_out, "last_activity_at")
+
+
+async def _iter_rows(cur, shape, sort_field: str):
+    async for row in cur:
+        yield shape(row), encode_cursor(row[sort_field], row["_id"])
+
+
+async def _shape_messages(
+    db: AsyncIOMotorDatabase, rows: List[Dict[str, Any]], include_sources: bool
+) -> List[Tuple[Dict[str, Any], str]]:
+    if include_sources:
+        await resolve_sources(db, rows)
+    return [
+        (_message_out(m, include_sources), encode_cursor(m["created_at"], m["_id"]))
+        for m in rows
+    ]
+
+
+async def _iter_messages(db: AsyncIOMotorDatabase, cur, include_sources: bool):
+    # sources are resolved a batch of rows at a time: one chunk store query each
+    batch: List[Dict[str, Any]] = []
+    async for row in cur:
+        batch.append(row)
+        if len(batch) >= _RESOLVE_BATCH:
+            for item in await _shape_messages(db, batch, include_sources):
+                yield item
+            batch = []
+    for item in await _shape_messages(db, batch, include_sources):
+        yield item
+
+
+def _session_oid(session_id: str) -> ObjectId:
     # Here we *expect* the canonical ObjectId string
     if not _is_valid_object_id(session_id):
         raise ValueError("Invalid session_id; must be a 24-char hex ObjectId")
-    oid = ObjectId(session_id)
+    return ObjectId(session_id)
+
+
+def iter_session_messages(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 0,
+    include_sources: bool = True,
+) -> AsyncIterator[Tuple[Dict[str, Any], str]]:
+    """A session's messages oldest first as (message, cursor-after-it) pairs."""
+    query = {"session_id": _session_oid(session_id)}
+    query.update(_after("created_at", cursor, descending=False))
+    fields = dict(_MESSAGE_FIELDS, **(_SOURCE_FIELDS if include_sources else {}))
+    cur = (
+        db["messages"]
+        .find(query, fields)
+        .sort([("created_at", 1), ("_id", 1)])
+        .limit(limit)
+        .batch_size(500)
+    )
+    return _iter_messages(db, cur, include_sources)
+
+
+async def _page(
+    items: AsyncIterator[Tuple[Dict[str, Any], str]], limit: int
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # callers ask for limit + 1 rows; the extra one only tells us there's more
     out: List[Dict[str, Any]] = []
-    async for m in db["messages"].find({"session_id": oid}).sort("created_at", 1):
-        out.append(
-            {
-                "role": m["role"],
-                "content": m["content"],
-                "sources": m.get("sources", []),
-                "created_at": m.get("created_at"),
-            }
-        )
-    return out
+    cursors: List[str] = []
+    async for item, cursor in items:
+        out.append(item)
+        cursors.append(cursor)
+    if len(out) > limit:
+        return out[:limit], cursors[limit - 1]
+    return out, None
+
+
+async def list_sessions(
+    db: AsyncIOMotorDatabase, limit: int = 50, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of sessions and the cursor for the next page (None at the end)."""
+    return await _page(iter_sessions(db, cursor, limit + 1), limit)
+
+
+async def get_session_messages(
+    db: AsyncIOMotorDatabase,
+    session_id: str,
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    include_sources: bool = True,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a session's messages and the cursor for the next page."""
+    items = iter_session_messages(db, session_id, cursor, limit + 1, include_sources)
+    return await _page(items, limit)
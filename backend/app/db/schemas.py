@@ -17,12 +17,29 @@ class ChatRequest(BaseModel):
     structured: bool = False
     use_history: bool = True
     history_limit: int = 8
+    # search only this collection (see /ingest-file) and/or only these files
+    collection: Optional[str] = None
+    files: Optional[List[str]] = None
+
+
+class ChatBatchRequest(BaseModel):
+    questions: List[str]
+    k: int = 6
+    structured: bool = False
+    # persist=True saves every answered question as a turn of this session
+    # (a new one when not given); False leaves the database untouched
+    session_id: Optional[str] = None
+    persist: bool = True
+    collection: Optional[str] = None
+    files: Optional[List[str]] = None
 
 
 class ChatResponse(BaseModel):
     session_id: str
     answer: str
     sources: List[Dict[str, Any]]
+    # context packing report (tokens before/after/saved); None for cached answers
+    context: Optional[Dict[str, int]] = None
 
 
 class MessageOut(BaseModel):
@@ -0,0 +1,382 @@
+"""
+Near-duplicate chunk detection at index time (MinHash + LSH).
+
+Every stored chunk gets a MinHash signature of its word 5-shingles (64
+values); the signature is cut into 8 bands of 8 values and chunks sharing a
+band are candidates. A candidate whose estimated Jaccard similarity (the
+fraction of equal signature values) reaches the threshold is a duplicate:
+
+    <generation>/dedup_sig.npy   uint32 signature of every stored chunk
+    <generation>/dedup_ids.json  doc_id of every row
+    <generation>/dedup_bands.npy the rows' band hashes (64-bit), sorted,
+                                 and the row of each
+
+Like the BM25 index it is synced to the manifest on every build (texts of
+missing rows are read back from Chroma); each layer of an overlay generation
+saves the rows of its own chunks, and a build loads them all (load_layers).
+Band lookups binary-search the sorted band hashes of every layer, which are
+memory-mapped like the signatures, so opening the index of a large corpus
+reads little more than its doc_ids.
+
+A duplicate chunk is neither embedded nor stored. The manifest records it as
+an alias of the stored chunk (entry "dup_of": {doc_id: stored doc_id}), and
+its file and page are appended to the stored chunk's duplicate_sources /
+duplicate_pages metadata. Chunks are only compared within a collection, so
+collection-scoped searches still see every text; a file filter only matches
+the file a chunk was stored for. When a stored chunk goes away (its file
+changed or was removed), files with aliases of it are indexed again (see
+KBManifest.reindex_orphans).
+"""
+
+import os
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .scopes import collection_of
+
+
+SIG_FILE = "dedup_sig.npy"
+IDS_FILE = "dedup_ids.json"
+BANDS_FILE = "dedup_bands.npy"
+DEDUP_FILES = (SIG_FILE, IDS_FILE, BANDS_FILE)
+
+_NUM_PERM = 64
+_BANDS = 8  # x 8 rows: P(candidate) is 0.99 at similarity 0.9, 0.2 at 0.7
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0x5EED)  # fixed: signatures are persisted
+_A = _rng.integers(1, 1 << 32, size=_NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, size=_NUM_PERM, dtype=np.uint64)
+# odd multipliers hashing a band's 4 64-bit words, its collection and band
+# number into one key (keys are saved in dedup_bands.npy: changing these
+# needs a new file name)
+_MIX = np.random.default_rng(0xBA2D).integers(
+    1, 1 << 63, size=_ROWS // 2 + 2, dtype=np.uint64
+) | np.uint64(1)
+
+
+def _shingle_hashes(text: str, size: int = 5) -> np.ndarray:
+    words = text.lower().split()
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+    # crc32, not hash(): signatures must be equal across processes
+    return np.fromiter(
+        {zlib.crc32(g.encode("utf-8")) for g in grams}, dtype=np.uint64
+    )
+
+
+def minhash(text: str) -> np.ndarray:
+    """uint32 MinHash signature; (a*x + b) stays below 2**64 for 32-bit a, b, x."""
+    x = _shingle_hashes(text)
+    mixed = (_A[:, None] * x[None, :] + _B[:, None]) % _PRIME
+    return (mixed.min(axis=1) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def _band_keys(sigs: np.ndarray, collections: np.ndarray) -> np.ndarray:
+    """(rows, _BANDS) uint64 hash of every band of every signature, together
+    with the row's collection number; equal bands of one collection get equal
+    keys (arithmetic wraps around mod 2**64)."""
+    words = np.ascontiguousarray(sigs, dtype=np.uint32).view(np.uint64)
+    words = words.reshape(len(sigs), _BANDS, _ROWS // 2)
+    half = _ROWS // 2
+    keys = (words * _MIX[:half]).sum(axis=2, dtype=np.uint64)
+    keys += collections.astype(np.uint64)[:, None] * _MIX[half]
+    keys += np.arange(_BANDS, dtype=np.uint64) * _MIX[half + 1]
+    return keys
+
+
+class DedupIndex:
+    def __init__(
+        self,
+        doc_ids: Optional[List[str]] = None,
+        signatures: Optional[np.ndarray] = None,
+        threshold: float = 0.9,
+        kb_folder: Optional[str] = None,
+    ) -> None:
+        self.threshold = threshold
+        # chunks only match within their collection (scopes.collection_of)
+        self.kb_folder = kb_folder
+        self._file_collection: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self._row_of: Dict[str, int] = {}  # live rows
+        self._dead: Set[int] = set()  # discarded or shadowed rows
+        # rows come in blocks, one per loaded layer: (first row, signatures,
+        # band keys sorted with their block rows, shape (2, rows * _BANDS));
+        # rows added after that are in _new_sigs, their keys in _recent
+        self._blocks: List[Tuple[int, np.ndarray, np.ndarray]] = []
+        self._frozen = 0
+        self._new_sigs: List[np.ndarray] = []
+        self._recent: Dict[int, List[int]] = {}
+        if doc_ids:
+            self._add_block(list(doc_ids), np.asarray(signatures, dtype=np.uint32))
+
+    def _collection_of(self, doc_id: str) -> int:
+        fpath = doc_id.rsplit("::", 2)[0]
+        if fpath not in self._file_collection:
+            name = collection_of(fpath, self.kb_folder)
+            self._file_collection[fpath] = zlib.crc32(name.encode("utf-8"))
+        return self._file_collection[fpath]
+
+    def _sorted_bands(self, doc_ids: List[str], sigs: np.ndarray) -> np.ndarray:
+        collections = np.fromiter(
+            (self._collection_of(d) for d in doc_ids),
+            dtype=np.uint64,
+            count=len(doc_ids),
+        )
+        keys = _band_keys(sigs, collections).ravel()
+        order = np.argsort(keys, kind="stable")
+        return np.stack([keys[order], (order // _BANDS).astype(np.uint64)])
+
+    def _add_block(
+        self,
+        doc_ids: List[str],
+        sigs: np.ndarray,
+        bands: Optional[np.ndarray] = None,
+        dead: Iterable[int] = (),
+    ) -> None:
+        """Append rows (before any _add); `dead` are block rows not to match."""
+        start = len(self.doc_ids)
+        if bands is None:
+            bands = self._sorted_bands(doc_ids, sigs)
+        self._blocks.append((start, sigs, bands))
+        dead = {start + i for i in dead}
+        self._dead |= dead
+        for row, doc_id in enumerate(doc_ids, start):
+            if row not in dead:
+                self._row_of[doc_id] = row
+        self.doc_ids += doc_ids
+        self._frozen = len(self.doc_ids)
+
+    def _sig(self, row: int) -> np.ndarray:
+        if row >= self._frozen:
+            return self._new_sigs[row - self._frozen]
+        for start, sigs, _ in reversed(self._blocks):
+            if row >= start:
+                return sigs[row - start]
+        raise IndexError(row)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    @classmethod
+    def load(
+        cls, directory: str, threshold: float = 0.9, kb_folder: Optional[str] = None
+    ) -> Optional["DedupIndex"]:
+        """The generation's index, or None if it has none (yet)."""
+        return cls.load_layers([directory], None, threshold, kb_folder)
+
+    @classmethod
+    def load_layers(
+        cls,
+        directories: List[str],
+        live: Optional[Set[str]],
+        threshold: float = 0.9,
+        kb_folder: Optional[str] = None,
+    ) -> Optional["DedupIndex"]:
+        """The rows of an overlay generation's layers (directories top first,
+        see generations.py) for the chunks in `live` (its manifest; None: all),
+        each from the topmost layer that has it; None if no layer has an
+        index. Rows a layer is missing are added back by sync()."""
+        index = cls(threshold=threshold, kb_folder=kb_folder)
+        taken: Set[str] = set()
+        found = False
+        for directory in directories:
+            rows = cls._read(directory)
+            if rows is None:
+                continue
+            found = True
+            doc_ids, sigs, bands = rows
+            if len(directories) > 1:
+                dead = [
+                    i
+                    for i, doc_id in enumerate(doc_ids)
+                    if doc_id in taken or (live is not None and doc_id not in live)
+                ]
+                taken.update(doc_ids)
+            else:
+                dead = []
+            index._add_block(doc_ids, sigs, bands, dead)
+        return index if found else None
+
+    @staticmethod
+    def _read(
+        directory: str,
+    ) -> Optional[Tuple[List[str], np.ndarray, Optional[np.ndarray]]]:
+        try:
+            with open(os.path.join(directory, IDS_FILE), encoding="utf-8") as fh:
+                doc_ids = json.load(fh)
+            # mapped: a build only reads the rows that are candidates
+            sigs = np.load(os.path.join(directory, SIG_FILE), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"[dedup] Ignoring unreadable index in {directory}: {e}")
+            return None
+        if sigs.shape != (len(doc_ids), _NUM_PERM):
+            print(f"[dedup] Ignoring inconsistent index in {directory}")
+            return None
+        try:
+            bands = np.load(os.path.join(directory, BANDS_FILE), mmap_mode="r")
+        except (OSError, ValueError):
+            bands = None  # written before band keys were saved: recomputed
+        if bands is not None and bands.shape != (2, len(doc_ids) * _BANDS):
+            bands = None
+        return doc_ids, sigs, bands
+
+    def save(self, directory: str, only: Optional[Set[str]] = None) -> None:
+        """Write the index (with `only`: the rows of those chunks, the ones an
+        overlay layer stores itself)."""
+        rows = sorted(
+            row
+            for doc_id, row in self._row_of.items()
+            if only is None or doc_id in only
+        )
+        doc_ids = [self.doc_ids[row] for row in rows]
+        sigs = (
+            np.stack([self._sig(row) for row in rows])
+            if rows
+            else np.zeros((0, _NUM_PERM), dtype=np.uint32)
+        )
+        arrays = {SIG_FILE: sigs, BANDS_FILE: self._sorted_bands(doc_ids, sigs)}
+        for name, array in arrays.items():
+            with open(os.path.join(directory, f"{name}.tmp"), "wb") as fh:
+                np.save(fh, array)
+        ids_path = os.path.join(directory, IDS_FILE)
+        with open(f"{ids_path}.tmp", "w", encoding="utf-8") as fh:
+            json.dump(doc_ids, fh)
+        for name in (BANDS_FILE, SIG_FILE, IDS_FILE):
+            path = os.path.join(directory, name)
+            os.replace(f"{path}.tmp", path)
+
+    # -------------------------------
+    # Maintenance
+    # -------------------------------
+    def sync(
+        self,
+        expected_ids: List[str],
+        fetch_texts: Callable[[List[str]], Dict[str, str]],
+        batch_size: int = 512,
+    ) -> Dict[str, int]:
+        """Make the rows match expected_ids (the chunks in the store)."""
+        expected = set(expected_ids)
+        stale = [doc_id for doc_id in self._row_of if doc_id not in expected]
+        self.discard(stale)
+        missing = [doc_id for doc_id in expected_ids if doc_id not in self._row_of]
+        added = 0
+        for start in range(0, len(missing), batch_size):
+            for doc_id, text in fetch_texts(missing[start : start + batch_size]).items():
+                self._add(doc_id, minhash(text))
+                added += 1
+        return {"added": added, "removed": len(stale), "docs": len(self)}
+
+    def discard(self, doc_ids: Iterable[str]) -> None:
+        for doc_id in doc_ids:
+            row = self._row_of.pop(doc_id, None)
+            if row is not None:
+                self._dead.add(row)
+
+    def _add(self, doc_id: str, sig: np.ndarray) -> None:
+        row = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self._new_sigs.append(sig)
+        self._row_of[doc_id] = row
+        collection = self._collection_of(doc_id)
+        for key in _band_keys(sig[None, :], np.array([collection]))[0]:
+            self._recent.setdefault(int(key), []).append(row)
+
+    def _candidates(self, collection: int, sig: np.ndarray) -> Iterable[int]:
+        """Live rows of the collection sharing a band key with sig."""
+        for key in _band_keys(sig[None, :], np.array([collection]))[0]:
+            rows = list(self._recent.get(int(key), []))
+            for start, _, bands in self._blocks:
+                lo = np.searchsorted(bands[0], key, side="left")
+                hi = np.searchsorted(bands[0], key, side="right")
+                rows += (bands[1, lo:hi].astype(np.int64) + start).tolist()
+            for row in rows:
+                # (a hash collision could pair rows of different collections)
+                if row not in self._dead and (
+                    self._collection_of(self.doc_ids[row]) == collection
+                ):
+                    yield row
+
+    # -------------------------------
+    # Lookup
+    # -------------------------------
+    def match(self, doc_id: str, text: str) -> Optional[str]:
+        """doc_id of a stored near-duplicate of the text (in doc_id's
+        collection); None if there is none, and the chunk is added."""
+        if doc_id in self._row_of:  # same chunk again (e.g. a retried file)
+            return None
+        sig = minhash(text)
+        best, best_sim = None, self.threshold
+        seen = set()
+        for row in self._candidates(self._collection_of(doc_id), sig):
+            if row in seen:
+                continue
+            seen.add(row)
+            sim = float(np.mean(self._sig(row) == sig))
+            if sim >= best_sim:
+                best, best_sim = self.doc_ids[row], sim
+        if best is None:
+            self._add(doc_id, sig)
+        return best
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+
+# -------------------------------
+# Stored chunks' duplicate metadata
+# -------------------------------
+def _update_duplicates(
+    store: Any,
+    doc_ids: List[str],
+    change: Callable[[str, List[str], List[int]], Tuple[List[str], List[int]]],
+) -> List[str]:
+    got = store.get(ids=doc_ids, include=["metadatas"])
+    if not got["ids"]:
+        return []
+    metadatas = []
+    for doc_id, meta in zip(got["ids"], got["metadatas"]):
+        meta = dict(meta or {})
+        sources, pages = change(
+            doc_id,
+            list(meta.get("duplicate_sources") or []),
+            list(meta.get("duplicate_pages") or []),
+        )
+        if sources:
+            meta.update(duplicate_sources=sources, duplicate_pages=pages)
+        else:
+            # Chroma rejects empty lists; None deletes the key on update
+            meta.update(duplicate_sources=None, duplicate_pages=None)
+        metadatas.append(meta)
+    store.update_metadatas(list(got["ids"]), metadatas)
+    return list(got["ids"])
+
+
+def add_duplicates(store: Any, found: Dict[str, List[Tuple[str, int]]]) -> List[str]:
+    """Append (source, page) of each duplicate to its stored chunk; returns
+    the ids of the chunks whose metadata changed."""
+
+    def change(doc_id, sources, pages):
+        for source, page in found[doc_id]:
+            sources.append(source)
+            pages.append(page)
+        return sources, pages
+
+    return _update_duplicates(store, list(found), change)
+
+
+def remove_duplicates(store: Any, doc_ids: List[str], source: str) -> List[str]:
+    """Drop the duplicates of `source` from the given stored chunks; returns
+    the ids of the chunks whose metadata changed."""
+
+    def change(doc_id, sources, pages):
+        kept = [(s, p) for s, p in zip(sources, pages) if s != source]
+        return [s for s, _ in kept], [p for _, p in kept]
+
+    return _update_duplicates(store, sorted(set(doc_ids)), change)
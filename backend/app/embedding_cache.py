@@ -0,0 +1,177 @@
+"""
+Persistent, content-addressed cache for chunk embeddings.
+
+Vectors are stored in SQLite keyed by (embedding model name, sha256 of the
+chunk text), so rebuilding, resetting or re-chunking the knowledge base only
+calls the embedding API for text it has never seen. The cache is bounded by
+entry count and evicts least-recently-used rows.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import List, Dict, Any, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from . import metrics
+
+
+EMBED_CACHE_FILE = "embed_cache.sqlite3"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors with LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str, max_entries: int = 200_000) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_vectors_last_used ON vectors(last_used)"
+        )
+        self._conn.commit()
+        # row count kept up to date by put_many/_evict_locked, so writes don't
+        # count the table (a full index scan); recounted before evicting, which
+        # picks up rows other processes sharing the file added
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if not hashes:
+            return found
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite caps bound parameters; 900 stays under every default
+            for start in range(0, len(unique), 900):
+                batch = unique[start : start + 900]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM vectors "
+                    f"WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[h] = vec.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE vectors SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            # rows already there were stored meanwhile by another writer, for
+            # the same text; ignoring them leaves rowcount = rows added
+            added = self._conn.executemany(
+                "INSERT OR IGNORE INTO vectors (model, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (model, h, array("f", vec).tobytes(), now)
+                    for h, vec in items.items()
+                ],
+            ).rowcount
+            self._count += added
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        if self.max_entries <= 0 or self._count <= self.max_entries:
+            return
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM vectors WHERE rowid IN ("
+                " SELECT rowid FROM vectors ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._count -= overflow
+            self.evictions += overflow
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model so document vectors go through an EmbeddingCache.
+
+    Query embeddings are passed straight through; they are rarely repeated
+    verbatim and are cached at a higher level.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache: EmbeddingCache):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        cached = self.cache.get_many(self.model_name, hashes)
+
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        if missing:
+            with metrics.stage("embed_documents"):
+                vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+
+def open_cache(persist_directory: str, max_entries: int) -> Optional[EmbeddingCache]:
+    """Cache living in the persist dir (kept across rebuilds); None if disabled."""
+    if max_entries <= 0:
+        return None
+    return EmbeddingCache(os.path.join(persist_directory, EMBED_CACHE_FILE), max_entries)
@@ -0,0 +1,98 @@
+"""
+Embedding backends.
+
+- "google": Gemini embeddings over the network (the original behaviour)
+- "local":  sentence-transformers on CPU, large batches, NumPy-normalized
+
+Every index records the backend/model tag it was built with (see KBManifest);
+the bot refuses to query or extend an index with a different tag, since
+vectors from different models live in unrelated spaces.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+DEFAULT_MODELS = {
+    "google": "models/embedding-001",
+    "local": "sentence-transformers/all-MiniLM-L6-v2",
+}
+
+
+class EmbeddingMismatchError(ValueError):
+    """The index was built with a different embedding backend/model."""
+
+
+def embedding_tag(backend: str, model: str) -> str:
+    return f"{backend}:{model}"
+
+
+class LocalSentenceTransformerEmbeddings(Embeddings):
+    """sentence-transformers encoder with batched, L2-normalized output."""
+
+    def __init__(
+        self, model_name: str, batch_size: int = 64, num_threads: int = 0
+    ) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:  # pragma: no cover - optional dependency
+            raise ImportError(
+                "EMBEDDING_BACKEND=local needs the sentence-transformers package"
+            ) from e
+
+        if num_threads > 0:
+            import torch
+
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vecs = self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        np.maximum(norms, 1e-12, out=norms)
+        return vecs / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def make_embeddings(
+    backend: str,
+    model: str,
+    api_key: Optional[str] = None,
+    batch_size: int = 64,
+    num_threads: int = 0,
+) -> Embeddings:
+    if backend == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+        return GoogleGenerativeAIEmbeddings(model=model, google_api_key=api_key)
+    if backend == "local":
+        return LocalSentenceTransformerEmbeddings(model, batch_size, num_threads)
+    raise ValueError(f"Unknown embedding backend: {backend!r}")
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Batched embed_query: one model call for many questions where the
+    backend supports it, one embed_query per text otherwise."""
+    base = getattr(embeddings, "underlying", embeddings)  # unwrap CachedEmbeddings
+    if isinstance(base, LocalSentenceTransformerEmbeddings):
+        return base.embed_documents(texts)  # no query/document distinction
+    if type(base).__name__ == "GoogleGenerativeAIEmbeddings":
+        return base.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return [embeddings.embed_query(t) for t in texts]
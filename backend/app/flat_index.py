@@ -0,0 +1,391 @@
+"""
+Exact (brute-force) vector search over memory-mapped NumPy arrays, as an
+alternative to Chroma's HNSW for knowledge bases of up to a few hundred
+thousand chunks.
+
+    <generation>/flat_f32.npy      unit-normalized float32 vectors, one row per chunk
+    <generation>/flat_i8.npy       int8 copy (quantized engine only) ...
+    <generation>/flat_scale.npy    ... and its per-row float32 scale
+    <generation>/flat_ids.json     doc_id of every row
+    <generation>/flat_docs.jsonl   sidecar: {"id", "text", "metadata"} per row
+    <generation>/flat_offsets.npy  byte offset of every sidecar line
+
+Like the BM25 index it is derived from the generation's Chroma store (the
+embeddings Chroma keeps are read back, nothing is embedded again) and synced
+to the manifest after every build. Searches don't go through Chroma: scores
+are a blocked matrix product over the mmap'd rows with an argpartition top-k,
+and the sidecar lines of the hits are sliced out of the mmap'd sidecar.
+
+Each layer of an overlay generation has the rows of its own chunks
+(LayeredFlatIndex searches them together).
+
+The int8 engine scans the quantized rows (a quarter of the bytes) for
+`rescore` x k candidates per query, then re-scores those exactly against
+the float32 rows, so only the candidates' float32 pages are touched.
+"""
+
+import os
+import json
+import mmap
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+F32_FILE = "flat_f32.npy"
+I8_FILE = "flat_i8.npy"
+SCALE_FILE = "flat_scale.npy"
+DOCS_FILE = "flat_docs.jsonl"
+OFFSETS_FILE = "flat_offsets.npy"
+IDS_FILE = "flat_ids.json"
+FLAT_FILES = (F32_FILE, I8_FILE, SCALE_FILE, DOCS_FILE, OFFSETS_FILE, IDS_FILE)
+
+# rows scored per matrix product; bounds the temporary score matrix
+_BLOCK_ROWS = 65536
+# int8 blocks are widened to float32 before the product: keep that copy small
+# enough to stay in cache (a 65536-row copy makes the scan slower than float32)
+_I8_BLOCK_ROWS = 4096
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8: row ~= q * scale."""
+    scale = np.abs(vectors).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(vectors / scale[:, None]).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indexes of the k best scores of each column, best first."""
+    k = min(k, scores.shape[0])
+    part = np.argpartition(-scores, k - 1, axis=0)[:k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=0), axis=0)
+    return np.take_along_axis(part, order, axis=0)
+
+
+class FlatIndex:
+    def __init__(
+        self,
+        directory: str,
+        doc_ids: List[str],
+        vectors: np.ndarray,
+        offsets: np.ndarray,
+        quantized: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> None:
+        self.directory = directory
+        self.doc_ids = doc_ids
+        self.vectors = vectors  # (n, dim) float32, mmap'd
+        self.offsets = offsets
+        self.quantized = quantized  # (int8 rows, scales) or None
+        self._row_of = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        self._docs: Any = b""
+        with open(os.path.join(directory, DOCS_FILE), "rb") as fh:
+            if os.fstat(fh.fileno()).st_size:
+                # slicing the map (no shared file position) is thread-safe
+                self._docs = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    @classmethod
+    def load(cls, directory: str, quantized: bool = False) -> Optional["FlatIndex"]:
+        """The generation's index, or None if it has none (or not quantized)."""
+        try:
+            vectors = np.load(os.path.join(directory, F32_FILE), mmap_mode="r")
+            offsets = np.load(os.path.join(directory, OFFSETS_FILE))
+            with open(os.path.join(directory, IDS_FILE), encoding="utf-8") as fh:
+                doc_ids = json.load(fh)
+            q = None
+            if quantized:
+                q = (
+                    np.load(os.path.join(directory, I8_FILE), mmap_mode="r"),
+                    np.load(os.path.join(directory, SCALE_FILE)),
+                )
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"[flat] Ignoring unreadable index in {directory}: {e}")
+            return None
+        if not (len(doc_ids) == vectors.shape[0] == len(offsets)) or (
+            q is not None and q[0].shape != vectors.shape
+        ):
+            print(f"[flat] Ignoring inconsistent index in {directory}")
+            return None
+        return cls(directory, doc_ids, vectors, offsets, q)
+
+    @staticmethod
+    def _has_quantized(directory: str, rows: int) -> bool:
+        try:
+            q = np.load(os.path.join(directory, I8_FILE), mmap_mode="r")
+            scales = np.load(os.path.join(directory, SCALE_FILE), mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        return len(q) == len(scales) == rows
+
+    @classmethod
+    def sync(
+        cls,
+        directory: str,
+        expected_ids: List[str],
+        fetch: Callable[[List[str]], Dict[str, Any]],
+        quantized: bool = False,
+        batch_size: int = 1024,
+        refresh: Iterable[str] = (),
+    ) -> Dict[str, int]:
+        """Rewrite the index to hold exactly expected_ids (in that order) if it
+        doesn't already, or if rows in `refresh` (chunks whose metadata
+        changed) are stale. Rows of ids it already has are copied over; the
+        rest come from fetch(ids) -> Chroma-style {"ids", "embeddings",
+        "documents", "metadatas"}."""
+        old = cls.load(directory)
+        old_ids = set(old.doc_ids) if old is not None else set()
+        refresh = old_ids.intersection(refresh)
+        if old is not None and not refresh and old.doc_ids == list(expected_ids):
+            current = not quantized or cls._has_quantized(directory, len(old))
+            if current:
+                old.close()
+                return {"added": 0, "removed": 0, "refreshed": 0, "docs": len(old)}
+        missing = [d for d in expected_ids if d not in old_ids or d in refresh]
+        fetched: Dict[str, Tuple[np.ndarray, str]] = {}
+        dim = old.vectors.shape[1] if old is not None and len(old) else 0
+        for start in range(0, len(missing), batch_size):
+            got = fetch(missing[start : start + batch_size])
+            for doc_id, vec, text, meta in zip(
+                got["ids"], got["embeddings"], got["documents"], got["metadatas"]
+            ):
+                line = json.dumps({"id": doc_id, "text": text, "metadata": meta or {}})
+                fetched[doc_id] = (np.asarray(vec, dtype=np.float32), line)
+                dim = dim or len(vec)
+        ids = [d for d in expected_ids if d in old_ids or d in fetched]
+
+        tmp = {name: os.path.join(directory, f"{name}.tmp") for name in FLAT_FILES}
+        vectors = np.lib.format.open_memmap(
+            tmp[F32_FILE], mode="w+", dtype=np.float32, shape=(len(ids), dim)
+        )
+        offsets = np.zeros(len(ids), dtype=np.int64)
+        with open(tmp[DOCS_FILE], "wb") as docs:
+            for row, doc_id in enumerate(ids):
+                if doc_id in fetched:
+                    vec, line = fetched[doc_id]
+                    vectors[row] = _normalize(vec[None, :])[0]
+                    data = line.encode("utf-8") + b"\n"
+                else:
+                    old_row = old._row_of[doc_id]
+                    vectors[row] = old.vectors[old_row]
+                    data = old._read_line(old_row)
+                offsets[row] = docs.tell()
+                docs.write(data)
+        vectors.flush()
+        with open(tmp[OFFSETS_FILE], "wb") as fh:
+            np.save(fh, offsets)
+        with open(tmp[IDS_FILE], "w", encoding="utf-8") as fh:
+            json.dump(ids, fh)
+        written = [F32_FILE, DOCS_FILE, OFFSETS_FILE, IDS_FILE]
+        if quantized:
+            q = np.lib.format.open_memmap(
+                tmp[I8_FILE], mode="w+", dtype=np.int8, shape=(len(ids), dim)
+            )
+            scales = np.ones(len(ids), dtype=np.float32)
+            for start in range(0, len(ids), _BLOCK_ROWS):
+                stop = min(start + _BLOCK_ROWS, len(ids))
+                q[start:stop], scales[start:stop] = quantize(vectors[start:stop])
+            q.flush()
+            with open(tmp[SCALE_FILE], "wb") as fh:
+                np.save(fh, scales)
+            written += [I8_FILE, SCALE_FILE]
+            del q
+        del vectors
+        if old is not None:
+            old.close()
+        for name in written:
+            os.replace(tmp[name], os.path.join(directory, name))
+        refreshed = len(refresh.intersection(fetched))
+        return {
+            "added": len(fetched) - refreshed,
+            "removed": len(old_ids - set(ids)),
+            "refreshed": refreshed,
+            "docs": len(ids),
+        }
+
+    def close(self) -> None:
+        if isinstance(self._docs, mmap.mmap):
+            self._docs.close()
+
+    # -------------------------------
+    # Search
+    # -------------------------------
+    def mask(self, keep: Callable[[str], bool]) -> Optional[np.ndarray]:
+        """Row mask for search_many(rows=...); None when every row is kept."""
+        rows = np.fromiter((keep(d) for d in self.doc_ids), bool, len(self.doc_ids))
+        return None if rows.all() else rows
+
+    def _scan(
+        self, queries: np.ndarray, k: int, rows: Optional[np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Best k (row indexes, scores) per query, as (k, n_queries) arrays,
+        over the int8 rows when quantized, else the float32 rows."""
+        best_idx = np.zeros((0, len(queries)), dtype=np.int64)
+        best = np.zeros((0, len(queries)), dtype=np.float32)
+        qt = queries.T
+        block_rows = _BLOCK_ROWS if self.quantized is None else _I8_BLOCK_ROWS
+        for start in range(0, len(self), block_rows):
+            stop = min(start + block_rows, len(self))
+            if self.quantized is not None:
+                q, scale = self.quantized
+                block = q[start:stop].astype(np.float32)
+                scores = (block @ qt) * scale[start:stop, None]
+            else:
+                scores = self.vectors[start:stop] @ qt
+            if rows is not None:
+                scores[~rows[start:stop]] = -np.inf
+            top = _top_k(scores, k)
+            best_idx = np.concatenate([best_idx, top + start])
+            best = np.concatenate([best, np.take_along_axis(scores, top, axis=0)])
+            if len(best) > k:
+                keep = _top_k(best, k)
+                best_idx = np.take_along_axis(best_idx, keep, axis=0)
+                best = np.take_along_axis(best, keep, axis=0)
+        return best_idx, best
+
+    def search_many(
+        self,
+        queries: List[List[float]],
+        k: int,
+        rows: Optional[np.ndarray] = None,
+        rescore: int = 4,
+    ) -> List[List[Tuple[str, float]]]:
+        """Top-k (doc_id, cosine similarity) per query, best first."""
+        if not len(self) or k <= 0:
+            return [[] for _ in queries]
+        q = _normalize(np.asarray(queries, dtype=np.float32))
+        depth = k * max(1, rescore) if self.quantized is not None else k
+        idx, scores = self._scan(q, depth, rows)
+        out = []
+        for j in range(len(q)):
+            valid = np.isfinite(scores[:, j])  # masked-out rows score -inf
+            cand, cand_scores = idx[valid, j], scores[valid, j]
+            if self.quantized is not None and len(cand):
+                # exact re-scoring of the candidates against the float32 rows
+                cand = np.sort(cand)  # in file order: sequential mmap reads
+                cand_scores = np.asarray(self.vectors[cand]) @ q[j]
+                best = np.argsort(-cand_scores)[:k]
+                cand, cand_scores = cand[best], cand_scores[best]
+            out.append(
+                [(self.doc_ids[r], float(s)) for r, s in zip(cand[:k], cand_scores)]
+            )
+        return out
+
+    # -------------------------------
+    # Documents (Chroma-compatible get)
+    # -------------------------------
+    def _read_line(self, row: int) -> bytes:
+        start = int(self.offsets[row])
+        stop = int(self.offsets[row + 1]) if row + 1 < len(self.offsets) else None
+        return self._docs[start:stop]
+
+    def get(self, ids: Iterable[str], include: Iterable[str] = ()) -> Dict[str, Any]:
+        """Same shape as Chroma's collection.get (ids, documents, metadatas)."""
+        out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        for doc_id in ids:
+            row = self._row_of.get(doc_id)
+            if row is None:
+                continue
+            item = json.loads(self._read_line(row))
+            out["ids"].append(doc_id)
+            out["documents"].append(item["text"])
+            out["metadatas"].append(item["metadata"])
+        return out
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+class LayeredFlatIndex:
+    """The flat indexes of an overlay generation's layers (top first, see
+    generations.py) searched as one. A row only counts in the topmost layer
+    that has its chunk, and only if the generation's manifest (`live`) lists
+    it; row masks span the layers' rows end to end."""
+
+    def __init__(self, layers: List[FlatIndex], live: Set[str]) -> None:
+        self.layers = layers
+        self._layer_of: Dict[str, int] = {}
+        valid = []
+        for depth, layer in enumerate(layers):
+            rows = np.fromiter(
+                (d in live and d not in self._layer_of for d in layer.doc_ids),
+                bool,
+                len(layer),
+            )
+            for doc_id, ok in zip(layer.doc_ids, rows):
+                if ok:
+                    self._layer_of[doc_id] = depth
+            valid.append(rows)
+        self._valid = np.concatenate(valid) if valid else np.zeros(0, dtype=bool)
+        self._starts = np.cumsum([0] + [len(layer) for layer in layers])
+
+    @classmethod
+    def load(
+        cls, directories: List[str], live: Set[str], quantized: bool = False
+    ) -> Optional["LayeredFlatIndex"]:
+        """None if a layer has no (or no quantized) index."""
+        layers = []
+        for directory in directories:
+            layer = FlatIndex.load(directory, quantized)
+            if layer is None:
+                for opened in layers:
+                    opened.close()
+                return None
+            layers.append(layer)
+        return cls(layers, live)
+
+    def close(self) -> None:
+        for layer in self.layers:
+            layer.close()
+
+    def mask(self, keep: Callable[[str], bool]) -> np.ndarray:
+        rows = np.fromiter(
+            (keep(d) for layer in self.layers for d in layer.doc_ids),
+            bool,
+            len(self._valid),
+        )
+        return rows & self._valid
+
+    def search_many(
+        self,
+        queries: List[List[float]],
+        k: int,
+        rows: Optional[np.ndarray] = None,
+        rescore: int = 4,
+    ) -> List[List[Tuple[str, float]]]:
+        """Top-k (doc_id, cosine similarity) per query over all layers."""
+        rows = self._valid if rows is None else rows
+        merged: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        for depth, layer in enumerate(self.layers):
+            layer_rows = rows[self._starts[depth] : self._starts[depth + 1]]
+            if not layer_rows.any():
+                continue
+            for found, hits in zip(
+                merged, layer.search_many(queries, k, layer_rows, rescore)
+            ):
+                found.extend(hits)
+        return [sorted(found, key=lambda h: -h[1])[:k] for found in merged]
+
+    def get(self, ids: Iterable[str], include: Iterable[str] = ()) -> Dict[str, Any]:
+        by_layer: Dict[int, List[str]] = {}
+        for doc_id in ids:
+            if doc_id in self._layer_of:
+                by_layer.setdefault(self._layer_of[doc_id], []).append(doc_id)
+        out: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        for depth, layer_ids in by_layer.items():
+            got = self.layers[depth].get(layer_ids, include)
+            for key in out:
+                out[key].extend(got[key])
+        return out
+
+    def __len__(self) -> int:
+        return len(self._layer_of)
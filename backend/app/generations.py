@@ -0,0 +1,467 @@
+"""
+Versioned index generations under PERSIST_DIR.
+
+    PERSIST_DIR/
+        ACTIVE                      id of the generation queries use (+ a nonce)
+        index.lock                  held by whichever process is indexing
+        generations/<id>/           a Chroma store (complete, or an overlay: see
+                                    below) + its kb_manifest.json, BM25 index
+                                    (lexical.py), flat vector index
+                                    (flat_index.py) and near-duplicate index
+                                    (dedup.py)
+        generations/<id>/BUILDING   present until the build finished and was activated
+        generations/<id>/RETIRED    timestamp of when it stopped being active
+        generations/<id>/FOLDED     present once a fold (below) copied its layers in
+        embed_cache.sqlite3         shared by all generations
+        page_cache/                 parsed PDF pages, shared (page_cache.py)
+
+Every build writes a new generation next to the live one and then switches
+ACTIVE with an atomic rename, so queries never see a half-built or deleted
+store and the vectors of an active generation are never modified. Old
+generations are kept for rollback and garbage-collected once they are past a
+grace period and no longer in use.
+
+A rebuild starts empty. An incremental update starts as an overlay on the
+active generation, which costs a hard link whatever the size of the corpus:
+
+        generations/<id>/LAYERS     {"lower": [ids below, nearest first],
+                                     "hidden": rows the manifest no longer
+                                     reads from them}
+
+Its own Chroma store, BM25, flat and dedup files only hold the chunks the
+update wrote (plus copies of lower chunks whose metadata it changed); the
+manifest, hard-linked from the base and only ever replaced whole, lists every
+chunk of the generation. Reads go through all layers and take a chunk from
+the topmost layer that has it (overlay.py). Lower layers are never written,
+and are kept as long as a generation stacked on them is. Deleted and replaced
+chunks stay behind in the lower layers as hidden rows, which searches
+over-fetch to skip; once a chain is INDEX_MAX_LAYERS deep or carries more
+than INDEX_MAX_HIDDEN hidden rows, the next update folds it instead: it
+copies the bottom generation (hard links for the files that are only replaced
+whole, a reflink on btrfs or XFS or else a copy for Chroma's sqlite file and
+HNSW segments, which are modified in place) and applies the layers above to
+it. With INDEX_MAX_LAYERS below 2 every update is such a copy; single-worker
+deployments can write into the active generation with INDEX_IN_PLACE (see
+EnhancedPDFRAGChatbot).
+
+ACTIVE doubles as the cross-process change marker: it gets a fresh nonce on
+every switch, and server workers sharing PERSIST_DIR compare it to the value
+they last saw to find out that another process published a new index.
+
+A store created before generations existed (Chroma files directly in
+PERSIST_DIR) shows up as the read-only generation "legacy".
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import datetime
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+from .kb_manifest import MANIFEST_FILE
+
+
+ACTIVE_FILE = "ACTIVE"
+GENERATIONS_DIR = "generations"
+BUILDING_MARKER = "BUILDING"
+RETIRED_MARKER = "RETIRED"
+FOLDED_MARKER = "FOLDED"
+LAYERS_FILE = "LAYERS"
+LOCK_FILE = "index.lock"
+LEGACY_ID = "legacy"
+_FICLONE = 0x40049409  # linux/fs.h: share the source file's extents
+
+
+def _clone_or_copy(src: str, dst: str) -> str:
+    """Copy src to dst as a reflink where the filesystem supports it."""
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return "reflink"
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def _link_or_copy(src: str, dst: str) -> str:
+    try:
+        os.link(src, dst)
+        return "link"
+    except OSError:  # other filesystem, or no hard links
+        return _clone_or_copy(src, dst)
+
+
+def release_chroma_client(path: str) -> None:
+    """Chroma keeps one shared client per path; a cached client keeps a handle
+    on the sqlite file and fails with 'readonly database' once it's deleted."""
+    try:
+        from chromadb.api.client import SharedSystemClient
+
+        system = SharedSystemClient._identifier_to_system.pop(path, None)
+        if system is not None:
+            system.stop()
+    except Exception as e:  # pragma: no cover - depends on chromadb version
+        print(f"[generations] Could not release chroma client for {path}: {e}")
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
+
+class GenerationStore:
+    def __init__(
+        self, persist_directory: str, keep: int = 2, grace_seconds: float = 300.0
+    ) -> None:
+        self.root = persist_directory
+        self.keep = keep
+        self.grace_seconds = grace_seconds
+        self.base = os.path.join(self.root, GENERATIONS_DIR)
+        os.makedirs(self.base, exist_ok=True)
+        # bytes per method ("link", "reflink", "copy") and seconds of the last
+        # create(base=...)
+        self.last_copy: Optional[Dict[str, float]] = None
+
+    # -------------------------------
+    # Lookup
+    # -------------------------------
+    def path_for(self, gen_id: str) -> str:
+        if gen_id == LEGACY_ID:
+            return self.root
+        return os.path.join(self.base, gen_id)
+
+    def _has_legacy(self) -> bool:
+        return os.path.exists(os.path.join(self.root, "chroma.sqlite3"))
+
+    def marker(self) -> Optional[str]:
+        """Contents of ACTIVE; changes whenever any process switches generations."""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE), encoding="utf-8") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def active_id(self) -> Optional[str]:
+        marker = self.marker()
+        if marker is None:
+            return LEGACY_ID if self._has_legacy() else None
+        return marker.split("\n", 1)[0].strip() or None
+
+    def exists(self, gen_id: str) -> bool:
+        if gen_id == LEGACY_ID:
+            return self._has_legacy()
+        return os.path.isdir(self.path_for(gen_id))
+
+    def _building_kind(self, gen_id: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path_for(gen_id), BUILDING_MARKER)) as fh:
+                return fh.read().strip()
+        except OSError:
+            return None
+
+    def is_building(self, gen_id: str) -> bool:
+        return os.path.exists(os.path.join(self.path_for(gen_id), BUILDING_MARKER))
+
+    def ids(self) -> List[str]:
+        """All generation ids, oldest first (ids sort by creation time)."""
+        found = sorted(
+            name
+            for name in os.listdir(self.base)
+            if os.path.isdir(os.path.join(self.base, name))
+        )
+        return ([LEGACY_ID] if self._has_legacy() else []) + found
+
+    def _layer_info(self, gen_id: str) -> Dict[str, Any]:
+        if gen_id == LEGACY_ID:
+            return {}
+        try:
+            with open(os.path.join(self.path_for(gen_id), LAYERS_FILE)) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+
+    def layers(self, gen_id: str) -> List[str]:
+        """gen_id followed by the generations it is an overlay on, nearest first."""
+        return [gen_id] + list(self._layer_info(gen_id).get("lower", []))
+
+    def hidden_rows(self, gen_id: str) -> int:
+        """Upper bound on the rows of gen_id's lower layers that reads skip
+        (chunks deleted or replaced since); 0 for a single-layer generation."""
+        return int(self._layer_info(gen_id).get("hidden", 0))
+
+    def record_hidden(self, gen_id: str, hidden: int) -> None:
+        info = self._layer_info(gen_id)
+        if info and info.get("hidden") != hidden:
+            info["hidden"] = hidden
+            _write_atomic(
+                os.path.join(self.path_for(gen_id), LAYERS_FILE), json.dumps(info)
+            )
+
+    def is_folded(self, gen_id: str) -> bool:
+        return os.path.exists(os.path.join(self.path_for(gen_id), FOLDED_MARKER))
+
+    def mark_folded(self, gen_id: str) -> None:
+        _write_atomic(os.path.join(self.path_for(gen_id), FOLDED_MARKER), "")
+
+    def _retired_at(self, gen_id: str) -> Optional[float]:
+        try:
+            with open(os.path.join(self.path_for(gen_id), RETIRED_MARKER)) as fh:
+                return float(fh.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    def create(self, base: Optional[str] = None, overlay: bool = False) -> str:
+        """Start a new generation: empty, a copy of `base`, or with `overlay`
+        an empty layer on top of `base`. An unfinished build of the same kind
+        is returned instead so it can be resumed."""
+        self.last_copy = None
+        kind = f"{'overlay' if overlay else 'copy'}:{base}" if base else "new"
+        for gen_id in reversed(self.ids()):
+            if gen_id != LEGACY_ID and self._building_kind(gen_id) == kind:
+                return gen_id
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        gen_id = f"{stamp}-{uuid.uuid4().hex[:6]}"
+        path = self.path_for(gen_id)
+        if base is None:
+            os.makedirs(path)
+        elif overlay:
+            self._start_overlay(base, path)
+        else:
+            self._copy_store(self.path_for(base), path)
+        _write_atomic(os.path.join(path, BUILDING_MARKER), kind)
+        return gen_id
+
+    def _start_overlay(self, base: str, dst: str) -> None:
+        stats = {"link": 0, "reflink": 0, "copy": 0}
+        t0 = time.perf_counter()
+        os.makedirs(dst)
+        manifest = os.path.join(self.path_for(base), MANIFEST_FILE)
+        if os.path.exists(manifest):
+            how = _link_or_copy(manifest, os.path.join(dst, MANIFEST_FILE))
+            stats[how] += os.path.getsize(manifest)
+        info = {"lower": self.layers(base), "hidden": self.hidden_rows(base)}
+        _write_atomic(os.path.join(dst, LAYERS_FILE), json.dumps(info))
+        self.last_copy = dict(stats, seconds=round(time.perf_counter() - t0, 3))
+
+    def _copy_store(self, src: str, dst: str) -> None:
+        from .lexical import LEXICAL_FILES  # (imports scikit-learn)
+        from .flat_index import FLAT_FILES
+        from .dedup import DEDUP_FILES
+
+        replaced_whole = {MANIFEST_FILE, *LEXICAL_FILES, *FLAT_FILES, *DEDUP_FILES}
+        stats = {"link": 0, "reflink": 0, "copy": 0}
+        t0 = time.perf_counter()
+
+        def copy(s: str, d: str) -> None:
+            link = os.path.dirname(s) == src and os.path.basename(s) in replaced_whole
+            how = _link_or_copy(s, d) if link else _clone_or_copy(s, d)
+            stats[how] += os.path.getsize(s)
+
+        shutil.copytree(
+            src,
+            dst,
+            ignore=lambda d, names: self._not_store_files(d, names) if d == src else [],
+            copy_function=copy,
+        )
+        self.last_copy = dict(stats, seconds=round(time.perf_counter() - t0, 3))
+
+    @staticmethod
+    def _not_store_files(directory: str, names: List[str]) -> List[str]:
+        # Copy Chroma's chroma.sqlite3 and its per-segment directories (named
+        # by uuid), the manifest, the BM25, flat and dedup indexes; nothing
+        # else at the top of a generation or the legacy root (markers,
+        # embedding cache, ...)
+        from .lexical import LEXICAL_FILES  # (imports scikit-learn)
+        from .flat_index import FLAT_FILES
+        from .dedup import DEDUP_FILES
+
+        def is_store(name: str) -> bool:
+            if name in ("chroma.sqlite3", MANIFEST_FILE):
+                return True
+            if name in LEXICAL_FILES or name in FLAT_FILES or name in DEDUP_FILES:
+                return True
+            try:
+                uuid.UUID(name)
+            except ValueError:
+                return False
+            return os.path.isdir(os.path.join(directory, name))
+
+        return [n for n in names if not is_store(n)]
+
+    def activate(self, gen_id: str) -> Optional[str]:
+        """Atomically point ACTIVE at gen_id; returns the previous active id."""
+        if not self.exists(gen_id):
+            raise ValueError(f"Unknown index generation: {gen_id}")
+        previous = self.active_id()
+        path = self.path_for(gen_id)
+        if gen_id != LEGACY_ID:
+            for marker in (BUILDING_MARKER, RETIRED_MARKER):
+                try:
+                    os.remove(os.path.join(path, marker))
+                except FileNotFoundError:
+                    pass
+        _write_atomic(
+            os.path.join(self.root, ACTIVE_FILE), f"{gen_id}\n{uuid.uuid4().hex}\n"
+        )
+        if previous and previous != gen_id and previous != LEGACY_ID:
+            _write_atomic(
+                os.path.join(self.path_for(previous), RETIRED_MARKER), str(time.time())
+            )
+        return previous
+
+    def gc(self, in_use: Iterable[str] = (), lock_held: bool = False) -> List[str]:
+        """Delete retired/abandoned generations beyond the `keep` most recently
+        retired, once past the grace period, not in use and not a lower layer
+        of a generation that stays. Returns deleted ids.
+
+        A generation that is still BUILDING is only abandoned if no build is
+        running: the caller holds the build lock (lock_held) or it can be
+        taken right now, and is then held while deleting so no build resumes
+        it meanwhile. Otherwise unfinished builds are left alone.
+        """
+        if lock_held:
+            return self._gc(in_use, abandoned_builds=True)
+        with self._try_build_lock() as idle:
+            return self._gc(in_use, abandoned_builds=idle)
+
+    def _gc(self, in_use: Iterable[str], abandoned_builds: bool) -> List[str]:
+        busy = set(in_use) | {self.active_id()}
+        since: Dict[str, float] = {}
+        for gen_id in self.ids():
+            if gen_id in busy or gen_id == LEGACY_ID:
+                continue
+            if not abandoned_builds and self.is_building(gen_id):
+                continue
+            # abandoned builds have no RETIRED marker: use their last modification
+            retired = self._retired_at(gen_id)
+            since[gen_id] = retired or os.path.getmtime(self.path_for(gen_id))
+        newest_first = sorted(since, key=since.get, reverse=True)
+        now = time.time()
+        doomed = [
+            gen_id
+            for gen_id in newest_first[self.keep :]
+            if now - since[gen_id] >= self.grace_seconds
+        ]
+        # overlays read through their lower layers: keep those of every
+        # generation that stays
+        needed = {
+            lower
+            for gen_id in self.ids()
+            if gen_id not in doomed
+            for lower in self.layers(gen_id)[1:]
+        }
+        deleted = []
+        for gen_id in doomed:
+            if gen_id in needed:
+                continue
+            path = self.path_for(gen_id)
+            release_chroma_client(path)
+            shutil.rmtree(path, ignore_errors=True)
+            deleted.append(gen_id)
+        return deleted
+
+    @contextmanager
+    def build_lock(self, on_wait: Optional[Callable[[], None]] = None) -> Iterator[None]:
+        """Exclusive across every process (and thread) sharing PERSIST_DIR, so
+        only one of several server workers indexes at a time."""
+        with open(os.path.join(self.root, LOCK_FILE), "a") as fh:
+            if fcntl is None:  # pragma: no cover
+                yield
+                return
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if on_wait is not None:
+                    on_wait()
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _try_build_lock(self) -> Iterator[bool]:
+        """Hold the build lock for the block if it is free; yields whether it is."""
+        with open(os.path.join(self.root, LOCK_FILE), "a") as fh:
+            if fcntl is None:  # pragma: no cover
+                yield False
+                return
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def describe(self, refs: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        active = self.active_id()
+        out = []
+        for gen_id in reversed(self.ids()):
+            out.append(
+                {
+                    "id": gen_id,
+                    "active": gen_id == active,
+                    "building": gen_id != LEGACY_ID and self.is_building(gen_id),
+                    "retired_at": self._retired_at(gen_id),
+                    "layers": len(self.layers(gen_id)),
+                    "in_flight_queries": (refs or {}).get(gen_id, 0),
+                }
+            )
+        return out
+
+
+class IndexHandle:
+    """An open store for one generation plus the queries currently using it.
+
+    reload() retires the handle; the last query to release a retired handle
+    closes it, so queries that started before a switch finish on the old store.
+    """
+
+    def __init__(
+        self, gen_id: Optional[str], path: str, vectorstore: Any, lexical: Any = None
+    ) -> None:
+        self.gen_id = gen_id
+        self.path = path
+        # the generation's layers (ids, top first; see GenerationStore.layers),
+        # the chunks its manifest lists (None for a single layer) and the
+        # lower layers' hidden rows
+        self.layers: List[str] = [gen_id] if gen_id is not None else []
+        self.live: Optional[Set[str]] = None
+        self.hidden = 0
+        # overlay.LayeredStore; None when no index has been built yet
+        self.vectorstore = vectorstore
+        self.lexical = lexical  # LexicalIndex, when hybrid retrieval is on
+        # FlatIndex (LayeredFlatIndex for overlays), with the flat/int8 engines
+        self.flat = None
+        # named collections opened so far (None: not in this generation) and
+        # BM25 / flat index row masks per scope
+        self.collections: Dict[str, Any] = {}
+        self.lexical_masks: Dict[Any, Any] = {}
+        self.flat_masks: Dict[Any, Any] = {}
+        # manifest's duplicate aliases {fpath: {doc_id: stored doc_id}} and KB
+        # folder, loaded on the first scoped question, and (paths, stored ids)
+        # per file scope
+        self.dup_of: Optional[Dict[str, Dict[str, str]]] = None
+        self.kb_folder: Optional[str] = None
+        self.scope_aliases: Dict[Any, Any] = {}
+        self.refs = 0
+        self.retired = False
@@ -0,0 +1,260 @@
+"""
+Streaming indexing pipeline.
+
+    discover files -> load pages -> split -> batch N chunks -> embed + upsert
+
+With a DedupIndex, chunks that near-duplicate a stored chunk of the same
+collection are recorded as aliases of it instead of being embedded and
+stored (see dedup.py).
+
+Each stage is a generator pulling from the previous one, and only a single
+batch of chunks (plus the files the parser pool is working ahead on) is held
+in memory at a time, so peak memory depends on INDEX_BATCH_SIZE, not on the
+size of the corpus. After every committed batch the manifest is updated
+(throttled on disk) with each file's committed doc_ids, which makes an
+interrupted build resumable from its last checkpoint.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import uuid
+import hashlib
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from . import metrics
+from .dedup import DedupIndex, add_duplicates, remove_duplicates
+from .kb_manifest import IndexPlan, KBManifest
+
+if TYPE_CHECKING:
+    from langchain.docstore.document import Document
+
+
+# (path, chunks, error); chunks may be lazy and may raise while iterated
+FileChunks = Tuple[str, Iterable["Document"], Optional[str]]
+
+
+def chunk_id(fpath: str, index: int, text: str) -> str:
+    return f"{fpath}::{index}::{uuid.uuid5(uuid.NAMESPACE_URL, text[:200])}"
+
+
+class Chunking(NamedTuple):
+    """Text splitter settings (RecursiveCharacterTextSplitter, lengths in
+    characters). The manifest records their tag(); building with different
+    settings re-splits every file (from the page cache, see page_cache.py)."""
+
+    chunk_size: int = 1500
+    chunk_overlap: int = 200
+    separators: Tuple[str, ...] = ("\n\n", "\n", ".", " ", "")
+
+    def tag(self) -> str:
+        seps = hashlib.sha1(json.dumps(self.separators).encode()).hexdigest()[:8]
+        return f"recursive:{self.chunk_size}:{self.chunk_overlap}:{seps}"
+
+
+class StreamingIndexer:
+    """Drains a stream of parsed files into a vector store in fixed-size batches."""
+
+    def __init__(
+        self,
+        vectorstore: Any,
+        manifest: KBManifest,
+        plan: IndexPlan,
+        report: Dict[str, Any],
+        batch_size: int = 128,
+        checkpoint_seconds: float = 2.0,
+        notify: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+        store_for: Optional[Callable[[str], Any]] = None,
+        dedup: Optional[DedupIndex] = None,
+    ) -> None:
+        self.vectorstore = vectorstore
+        # store of a file's collection (see scopes.py); default: vectorstore
+        self.store_for = store_for or (lambda fpath: vectorstore)
+        self.manifest = manifest
+        self.plan = plan
+        self.report = report
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_seconds = checkpoint_seconds
+        self.notify = notify or (lambda event, data: None)
+        self.dedup = dedup
+
+        self._batch: List[Document] = []
+        self._batch_ids: List[str] = []
+        self._batch_paths: List[str] = []
+        # duplicates found since the last commit: (doc_id, stored doc_id, path, page)
+        self._dups: List[Tuple[str, str, str, int]] = []
+        # files with chunks assigned but not yet recorded as complete
+        self._file_ids: Dict[str, List[str]] = {}
+        self._file_dups: Dict[str, Dict[str, str]] = {}
+        self._file_done: Dict[str, bool] = {}
+        # stored chunks whose duplicate metadata this run changed
+        self.duplicates_changed: Set[str] = set()
+        self._last_checkpoint = time.monotonic()
+
+    # -------------------------------
+    # Stages
+    # -------------------------------
+    def _iter_chunks(self, files: Iterable[FileChunks]) -> Iterator[Tuple[str, Document]]:
+        """Flatten files into (path, chunk) with stable ids; skip committed ones."""
+        for fpath, chunks, error in files:
+            if error:
+                self._fail(fpath, error)
+                continue
+            committed = self.plan.resume.get(fpath, [])
+            self._file_ids[fpath] = list(committed)
+            resumed = fpath in self.plan.resume
+            self._file_dups[fpath] = self.manifest.dup_of(fpath) if resumed else {}
+            self._file_done[fpath] = False
+            done = len(committed) + len(self._file_dups[fpath])
+            try:
+                for i, ch in enumerate(chunks):
+                    if i < done:
+                        continue  # already in the store from an interrupted run
+                    ch.metadata["doc_id"] = chunk_id(fpath, i, ch.page_content)
+                    yield fpath, ch
+            except Exception as e:
+                self._fail(fpath, f"{type(e).__name__}: {e}")
+                continue
+            self._file_done[fpath] = True
+
+    def run(self, files: Iterable[FileChunks]) -> None:
+        try:
+            for fpath, ch in self._iter_chunks(files):
+                doc_id = ch.metadata["doc_id"]
+                stored = None
+                if self.dedup is not None:
+                    with metrics.stage("index_dedup"):
+                        stored = self.dedup.match(doc_id, ch.page_content)
+                if stored is not None:
+                    page = ch.metadata.get("page")
+                    page = page if isinstance(page, int) else -1
+                    self._dups.append((doc_id, stored, fpath, page))
+                    self._file_dups[fpath][doc_id] = stored
+                    continue
+                self._batch.append(ch)
+                self._batch_ids.append(doc_id)
+                self._batch_paths.append(fpath)
+                self._file_ids[fpath].append(doc_id)
+                if len(self._batch) >= self.batch_size:
+                    self._commit()
+            self._commit()
+        except BaseException:
+            # keep whatever was committed so the next run resumes from there
+            self._checkpoint_committed()
+            raise
+        self.manifest.save()
+
+    # -------------------------------
+    # Commit / checkpoint
+    # -------------------------------
+    def _commit(self) -> None:
+        if self._batch:
+            groups: Dict[int, Tuple[Any, List[Document], List[str]]] = {}
+            batch = zip(self._batch, self._batch_ids, self._batch_paths)
+            for doc, doc_id, fpath in batch:
+                store = self.store_for(fpath)
+                _, docs, ids = groups.setdefault(id(store), (store, [], []))
+                docs.append(doc)
+                ids.append(doc_id)
+            for store, docs, ids in groups.values():
+                with metrics.stage("index_upsert"):
+                    store.add_documents(docs, ids=ids)
+            self.report["chunks_added"] += len(self._batch_ids)
+            self._batch = []
+            self._batch_ids = []
+            self._batch_paths = []
+        if self._dups:
+            found: Dict[int, Tuple[Any, Dict[str, List[Tuple[str, int]]]]] = {}
+            for _, stored, fpath, page in self._dups:
+                store = self.store_for(fpath)
+                _, by_id = found.setdefault(id(store), (store, {}))
+                by_id.setdefault(stored, []).append((fpath, page))
+            for store, by_id in found.values():
+                self.duplicates_changed.update(add_duplicates(store, by_id))
+            self.report["chunks_deduplicated"] += len(self._dups)
+            self._dups = []
+        self._finish_files()
+        # partially indexed files are checkpointed as incomplete
+        for fpath, ids in self._file_ids.items():
+            self.manifest.record(
+                fpath,
+                self.plan.fingerprints[fpath],
+                ids,
+                complete=False,
+                dup_of=self._file_dups[fpath],
+            )
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+            self.manifest.save()
+            self._last_checkpoint = time.monotonic()
+
+    def _checkpoint_committed(self) -> None:
+        pending = set(self._batch_ids) | {doc_id for doc_id, *_ in self._dups}
+        for fpath, ids in self._file_ids.items():
+            committed = [i for i in ids if i not in pending]
+            dups = self._file_dups[fpath]
+            self.manifest.record(
+                fpath,
+                self.plan.fingerprints[fpath],
+                committed,
+                complete=False,
+                dup_of={i: c for i, c in dups.items() if i not in pending},
+            )
+        self.manifest.save()
+
+    def _finish_files(self) -> None:
+        # (called with no duplicates pending)
+        in_flight = set(self._batch_paths)
+        for fpath in [f for f, done in self._file_done.items() if done]:
+            if fpath in in_flight:
+                continue
+            ids = self._file_ids.pop(fpath)
+            dups = self._file_dups.pop(fpath)
+            del self._file_done[fpath]
+            self.manifest.record(fpath, self.plan.fingerprints[fpath], ids, dup_of=dups)
+            self.notify("file", {"file": fpath, "chunks": len(ids), "error": None})
+
+    def _fail(self, fpath: str, error: str) -> None:
+        # drop the file's uncommitted chunks and delete what was already written;
+        # leaving it out of the manifest makes the next run retry it
+        keep = [i for i, p in enumerate(self._batch_paths) if p != fpath]
+        pending = set(self._batch_ids) - {self._batch_ids[i] for i in keep}
+        self._batch = [self._batch[i] for i in keep]
+        self._batch_ids = [self._batch_ids[i] for i in keep]
+        self._batch_paths = [self._batch_paths[i] for i in keep]
+
+        assigned = self._file_ids.pop(fpath, None)
+        if assigned is None:
+            assigned = self.plan.resume.get(fpath, [])
+        written = [i for i in assigned if i not in pending]
+        if written:
+            self.store_for(fpath).delete(ids=written)
+        # duplicates of the file already recorded on stored chunks
+        dups = self._file_dups.pop(fpath, None)
+        if dups is None:
+            dups = self.manifest.dup_of(fpath) if fpath in self.plan.resume else {}
+        pending_dups = {d for d, _, p, _ in self._dups if p == fpath}
+        self._dups = [d for d in self._dups if d[2] != fpath]
+        recorded = [c for d, c in dups.items() if d not in pending_dups]
+        if recorded:
+            self.duplicates_changed.update(
+                remove_duplicates(self.store_for(fpath), recorded, fpath)
+            )
+        if self.dedup is not None:
+            self.dedup.discard(assigned)
+        self._file_done.pop(fpath, None)
+        self.manifest.remove(fpath)
+        self.report["errors"].append({"file": fpath, "error": error})
+        self.notify("file", {"file": fpath, "chunks": 0, "error": error})
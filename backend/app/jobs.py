@@ -0,0 +1,205 @@
+"""
+Background queue for knowledge-base indexing jobs.
+
+Indexing is CPU/network heavy and blocking, so the API hands it to a single
+dedicated worker thread and returns a job id immediately. One worker means
+jobs never overlap; submitting a job identical to one still waiting in the
+queue returns the queued job instead of adding another (coalescing).
+
+With several server workers each has its own queue; the build itself takes a
+lock in PERSIST_DIR so only one worker indexes at a time. Given a state_dir,
+job snapshots are written there so any worker can answer /jobs/{id}.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class IndexJob:
+    kind: str
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"  # queued | waiting (for another worker) | running | done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    files_total: int = 0
+    files_done: int = 0
+    chunks_added: int = 0
+    current_file: Optional[str] = None
+    errors: List[Dict[str, str]] = field(default_factory=list)
+    report: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    # called after every progress event (used to persist snapshots)
+    listener: Optional[Callable[["IndexJob"], None]] = field(
+        default=None, repr=False, compare=False
+    )
+
+    # Called from the indexer, see EnhancedPDFRAGChatbot.build_vectorstore_from_folder
+    def on_progress(self, event: str, data: Dict[str, Any]) -> None:
+        if event == "waiting":
+            self.status = "waiting"
+        elif event == "plan":
+            self.status = "running"
+            self.files_total = data["files_total"]
+        elif event == "file":
+            self.files_done += 1
+            self.current_file = data["file"]
+            self.chunks_added += data["chunks"]
+            if data.get("error"):
+                self.errors.append({"file": data["file"], "error": data["error"]})
+        if self.listener is not None:
+            self.listener(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        rate = (lambda n: n / elapsed if elapsed else 0.0)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_s": elapsed,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "current_file": self.current_file,
+            "chunks_added": self.chunks_added,
+            "files_per_s": rate(self.files_done),
+            "chunks_per_s": rate(self.chunks_added),
+            "errors": self.errors,
+            "error": self.error,
+            "report": self.report,
+        }
+
+
+class IndexJobQueue:
+    """FIFO of IndexJobs drained by one daemon thread."""
+
+    def __init__(
+        self,
+        runner: Callable[[IndexJob], Dict[str, Any]],
+        max_history: int = 100,
+        state_dir: Optional[str] = None,
+    ) -> None:
+        self._runner = runner
+        self._max_history = max_history
+        self._state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._jobs: "OrderedDict[str, IndexJob]" = OrderedDict()
+        self._queue: "queue.Queue[IndexJob]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, kind: str, **params: Any) -> IndexJob:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == "queued" and job.kind == kind and job.params == params:
+                    return job
+            job = IndexJob(kind=kind, params=params, listener=self._save)
+            self._jobs[job.id] = job
+            self._trim_locked()
+            self._ensure_worker_locked()
+        self._save(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IndexJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[IndexJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    # -------------------------------
+    # Snapshots shared between workers
+    # -------------------------------
+    def _save(self, job: IndexJob) -> None:
+        if not self._state_dir:
+            return
+        path = os.path.join(self._state_dir, f"{job.id}.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(job.to_dict(), fh, default=str)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[index job {job.id}] could not save snapshot: {e}")
+
+    def snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's to_dict(), whichever worker it was submitted to."""
+        job = self.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if not self._state_dir or not job_id.isalnum():
+            return None
+        path = os.path.join(self._state_dir, f"{job_id}.json")
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        """Recent jobs of all workers, newest first."""
+        found = {job.id: job.to_dict() for job in self.list()}
+        if self._state_dir:
+            names = [n for n in os.listdir(self._state_dir) if n.endswith(".json")]
+            for name in names:
+                job_id = name[: -len(".json")]
+                if job_id not in found:
+                    data = self.snapshot(job_id)
+                    if data is not None:
+                        found[job_id] = data
+        rows = sorted(found.values(), key=lambda d: d["created_at"], reverse=True)
+        return rows[: self._max_history]
+
+    def _trim_locked(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "failed")]
+        for job_id in finished[: max(0, len(self._jobs) - self._max_history)]:
+            del self._jobs[job_id]
+            if self._state_dir:
+                try:
+                    os.remove(os.path.join(self._state_dir, f"{job_id}.json"))
+                except OSError:
+                    pass
+
+    def _ensure_worker_locked(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._work, name="index-worker", daemon=True
+            )
+            self._thread.start()
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            self._save(job)
+            try:
+                job.report = self._runner(job)
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+                print(f"[index job {job.id}] failed: {job.error}")
+            finally:
+                job.current_file = None
+                job.finished_at = time.time()
+                self._save(job)
+                self._queue.task_done()
@@ -0,0 +1,225 @@
+"""
+Persisted manifest of indexed knowledge-base files.
+
+For every PDF that made it into the vector store we remember its content hash,
+size, mtime and the doc_ids of the chunks it produced. Diffing the manifest
+against the folder tells the indexer which files are new, changed or gone, so
+only those need to be parsed, embedded or deleted.
+
+Files are checkpointed while they are being indexed ("complete": false plus
+the doc_ids committed so far), so an interrupted build resumes where the last
+committed batch ended instead of starting the file over.
+"""
+
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional
+
+
+MANIFEST_FILE = "kb_manifest.json"
+_MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def iter_pdf_files(kb_folder: str) -> List[str]:
+    """All PDFs under kb_folder, sorted so indexing order is deterministic."""
+    found: List[str] = []
+    for root, _, files in os.walk(kb_folder):
+        for fname in files:
+            if fname.lower().endswith(".pdf"):
+                found.append(os.path.join(root, fname))
+    return sorted(found)
+
+
+@dataclass
+class IndexPlan:
+    """Result of diffing the knowledge-base folder against the manifest."""
+
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    # path -> doc_ids already committed, for interrupted files (also in `added`)
+    resume: Dict[str, List[str]] = field(default_factory=dict)
+    # path -> {"sha256", "size", "mtime"} for every file still on disk
+    fingerprints: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def to_embed(self) -> List[str]:
+        return self.added + self.updated
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+
+class KBManifest:
+    """JSON manifest stored next to the Chroma files in the persist directory."""
+
+    def __init__(
+        self,
+        path: str,
+        entries: Optional[Dict[str, Dict[str, Any]]] = None,
+        embedding: Optional[str] = None,
+        chunking: Optional[str] = None,
+        kb_folder: Optional[str] = None,
+    ):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = entries or {}
+        # backend:model tag of the vectors in the store (None = not recorded)
+        self.embedding = embedding
+        # splitter settings the chunks were made with (None = not recorded)
+        self.chunking = chunking
+        # folder the files' collections are relative to (None = not recorded,
+        # see scopes.collection_of)
+        self.kb_folder = kb_folder
+
+    @classmethod
+    def load(cls, persist_directory: str) -> "KBManifest":
+        path = os.path.join(persist_directory, MANIFEST_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            # A corrupt manifest only costs a full re-embed; ids are stable so
+            # upserts overwrite whatever is already in the store.
+            print(f"[manifest] Ignoring unreadable manifest {path}: {e}")
+            return cls(path)
+        if data.get("version") != _MANIFEST_VERSION:
+            return cls(path)
+        return cls(
+            path,
+            data.get("files", {}),
+            data.get("embedding"),
+            data.get("chunking"),
+            data.get("kb_folder"),
+        )
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        data = {
+            "version": _MANIFEST_VERSION,
+            "embedding": self.embedding,
+            "chunking": self.chunking,
+            "kb_folder": self.kb_folder,
+            "files": self.entries,
+        }
+        with open(tmp, "w", encoding="utf-8") as fh:
+            # dumps, not dump: dump streams through the pure-Python encoder,
+            # several times slower on the manifest of a large corpus
+            fh.write(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    # -------------------------------
+    # Diffing
+    # -------------------------------
+    def diff(self, kb_folder: str, chunking: Optional[str] = None) -> IndexPlan:
+        """With `chunking` (the configured splitter tag) different from the
+        recorded one, every indexed file counts as updated: it is split again."""
+        plan = IndexPlan()
+        on_disk = iter_pdf_files(kb_folder)
+        rechunk = chunking is not None and self.chunking not in (None, chunking)
+
+        for fpath in on_disk:
+            st = os.stat(fpath)
+            prev = self.entries.get(fpath)
+            # Cheap check first: same size and mtime means we trust the old hash
+            if prev and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime:
+                digest = prev["sha256"]
+            else:
+                digest = file_sha256(fpath)
+            plan.fingerprints[fpath] = {
+                "sha256": digest,
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+            }
+            if prev is None:
+                plan.added.append(fpath)
+            elif prev["sha256"] != digest or rechunk:
+                plan.updated.append(fpath)
+            elif not prev.get("complete", True):
+                # same content, interrupted mid-file: pick up after its last batch
+                plan.added.append(fpath)
+                plan.resume[fpath] = list(prev["doc_ids"])
+            else:
+                # (touched but identical: refresh mtime, nothing to re-embed)
+                plan.unchanged.append(fpath)
+
+        present = set(on_disk)
+        plan.removed = sorted(p for p in self.entries if p not in present)
+        return plan
+
+    # -------------------------------
+    # Mutation
+    # -------------------------------
+    def doc_ids(self, fpath: str) -> List[str]:
+        entry = self.entries.get(fpath)
+        return list(entry["doc_ids"]) if entry else []
+
+    def dup_of(self, fpath: str) -> Dict[str, str]:
+        """doc_id -> stored doc_id, for the file's chunks that were not stored
+        because they duplicate a stored chunk (see dedup.py)."""
+        entry = self.entries.get(fpath)
+        return dict(entry.get("dup_of", {})) if entry else {}
+
+    def record(
+        self,
+        fpath: str,
+        fingerprint: Dict[str, Any],
+        doc_ids: List[str],
+        complete: bool = True,
+        dup_of: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.entries[fpath] = {
+            **fingerprint,
+            "doc_ids": list(doc_ids),
+            "complete": complete,
+        }
+        if dup_of:
+            self.entries[fpath]["dup_of"] = dict(dup_of)
+
+    def reindex_orphans(self, plan: IndexPlan) -> List[str]:
+        """Move files with duplicates of chunks that this plan deletes (or
+        that are gone already) to plan.updated, until none are left; returns
+        the moved files. Deleting their chunks can orphan further files."""
+        stored = {i for fpath in self.entries for i in self.doc_ids(fpath)}
+        for fpath in plan.updated + plan.removed:
+            stored.difference_update(self.doc_ids(fpath))
+        moved: List[str] = []
+        while True:
+            orphaned = [
+                fpath
+                for fpath in plan.unchanged + list(plan.resume)
+                if any(c not in stored for c in self.dup_of(fpath).values())
+            ]
+            if not orphaned:
+                return moved
+            for fpath in orphaned:
+                if fpath in plan.resume:
+                    del plan.resume[fpath]
+                    plan.added.remove(fpath)
+                else:
+                    plan.unchanged.remove(fpath)
+                plan.updated.append(fpath)
+                stored.difference_update(self.doc_ids(fpath))
+                moved.append(fpath)
+
+    def touch(self, fpath: str, fingerprint: Dict[str, Any]) -> None:
+        entry = self.entries.get(fpath)
+        if entry is not None:
+            entry.update(fingerprint)
+
+    def remove(self, fpath: str) -> None:
+        self.entries.pop(fpath, None)
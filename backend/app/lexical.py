@@ -0,0 +1,199 @@
+"""
+BM25 keyword index over the chunks of one index generation.
+
+Term counts come from scikit-learn's HashingVectorizer (no vocabulary to keep
+in sync, so rows for new chunks can be appended and rows of deleted chunks
+dropped independently) and live in a SciPy sparse matrix, one row per chunk:
+
+    <generation>/bm25_tf.npz    chunk x hashed-term counts (CSR)
+    <generation>/bm25_ids.json  doc_id of every row
+
+BM25 weights are derived from the counts on the first search and kept as a
+CSC matrix, so scoring a query is a sum over the few columns of its terms.
+Only doc_ids are stored; the chunk text and metadata stay in Chroma. The
+index spans all collections (see scopes.py); scoped searches mask its rows.
+Each layer of an overlay generation has the rows of its own chunks; they are
+merged when the generation is opened (load_layers).
+"""
+
+import os
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+TF_FILE = "bm25_tf.npz"
+IDS_FILE = "bm25_ids.json"
+LEXICAL_FILES = (TF_FILE, IDS_FILE)
+
+# words plus identifier-like tokens such as "gpt-4o", "v1.2", "user_id"
+_TOKEN_PATTERN = r"(?u)\b\w[\w.\-]*\w\b|\b\w\b"
+_VECTORIZER = HashingVectorizer(
+    n_features=2**20,
+    token_pattern=_TOKEN_PATTERN,
+    alternate_sign=False,
+    norm=None,
+    dtype=np.float32,
+)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    def __init__(
+        self,
+        doc_ids: Optional[List[str]] = None,
+        tf: Optional[sp.csr_matrix] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self.doc_ids: List[str] = doc_ids or []
+        if tf is None:
+            tf = sp.csr_matrix((0, _VECTORIZER.n_features), dtype=np.float32)
+        self.tf = tf
+        self.k1 = k1
+        self.b = b
+        self._weights: Optional[sp.csc_matrix] = None
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    @classmethod
+    def load(cls, directory: str) -> Optional["LexicalIndex"]:
+        """The generation's index, or None if it has none (yet)."""
+        try:
+            with open(os.path.join(directory, IDS_FILE), encoding="utf-8") as fh:
+                doc_ids = json.load(fh)
+            tf = sp.load_npz(os.path.join(directory, TF_FILE)).tocsr()
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"[bm25] Ignoring unreadable index in {directory}: {e}")
+            return None
+        if tf.shape[0] != len(doc_ids):
+            print(f"[bm25] Ignoring inconsistent index in {directory}")
+            return None
+        return cls(doc_ids, tf)
+
+    @classmethod
+    def load_layers(
+        cls, directories: List[str], live: Optional[Set[str]] = None
+    ) -> Optional["LexicalIndex"]:
+        """One index over the layers of an overlay generation (directories top
+        first, see generations.py): each chunk's row comes from the topmost
+        layer that has it, and only chunks in `live` (its manifest) count.
+        None if a layer has no index."""
+        if len(directories) == 1:
+            return cls.load(directories[0])
+        doc_ids: List[str] = []
+        blocks = []
+        taken: Set[str] = set()
+        for directory in directories:
+            layer = cls.load(directory)
+            if layer is None:
+                return None
+            keep = [
+                i
+                for i, doc_id in enumerate(layer.doc_ids)
+                if doc_id not in taken and (live is None or doc_id in live)
+            ]
+            taken.update(layer.doc_ids)
+            doc_ids += [layer.doc_ids[i] for i in keep]
+            blocks.append(layer.tf[keep])
+        return cls(doc_ids, sp.vstack(blocks, format="csr"))
+
+    def save(self, directory: str) -> None:
+        tf_path = os.path.join(directory, TF_FILE)
+        ids_path = os.path.join(directory, IDS_FILE)
+        # np.savez appends ".npz" to names without it
+        sp.save_npz(f"{tf_path}.tmp.npz", self.tf)
+        with open(f"{ids_path}.tmp", "w", encoding="utf-8") as fh:
+            json.dump(self.doc_ids, fh)
+        os.replace(f"{tf_path}.tmp.npz", tf_path)
+        os.replace(f"{ids_path}.tmp", ids_path)
+
+    # -------------------------------
+    # Maintenance
+    # -------------------------------
+    def sync(
+        self,
+        expected_ids: List[str],
+        fetch_texts: Callable[[List[str]], Dict[str, str]],
+        batch_size: int = 512,
+    ) -> Dict[str, int]:
+        """Make the rows match expected_ids: drop rows of ids no longer in the
+        store and add rows for missing ids, whose texts come from fetch_texts."""
+        expected = set(expected_ids)
+        keep = [i for i, doc_id in enumerate(self.doc_ids) if doc_id in expected]
+        removed = len(self.doc_ids) - len(keep)
+        if removed:
+            self.tf = self.tf[keep]
+            self.doc_ids = [self.doc_ids[i] for i in keep]
+
+        present = set(self.doc_ids)
+        missing = [doc_id for doc_id in expected_ids if doc_id not in present]
+        added = 0
+        blocks = [self.tf]
+        for start in range(0, len(missing), batch_size):
+            texts = fetch_texts(missing[start : start + batch_size])
+            ids = list(texts)
+            blocks.append(_VECTORIZER.transform([texts[i] for i in ids]))
+            self.doc_ids += ids
+            added += len(ids)
+        if added:
+            self.tf = sp.vstack(blocks, format="csr")
+        if added or removed:
+            self._weights = None
+        return {"added": added, "removed": removed, "docs": len(self.doc_ids)}
+
+    # -------------------------------
+    # Scoring
+    # -------------------------------
+    def _bm25_weights(self) -> sp.csc_matrix:
+        if self._weights is None:
+            tf = self.tf.tocsr(copy=True)
+            n_docs = tf.shape[0]
+            doc_len = np.asarray(tf.sum(axis=1)).ravel()
+            avg_len = doc_len.mean() if n_docs else 1.0
+            df = np.bincount(tf.indices, minlength=tf.shape[1])
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+            rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+            norm = self.k1 * (1 - self.b + self.b * doc_len[rows] / max(avg_len, 1e-9))
+            tf.data = idf[tf.indices] * tf.data * (self.k1 + 1) / (tf.data + norm)
+            self._weights = tf.tocsc()
+        return self._weights
+
+    def mask(self, keep: Callable[[str], bool]) -> Optional[np.ndarray]:
+        """Row mask for search(rows=...); None when every row is kept."""
+        rows = np.fromiter((keep(d) for d in self.doc_ids), bool, len(self.doc_ids))
+        return None if rows.all() else rows
+
+    def search(
+        self, query: str, k: int, rows: Optional[np.ndarray] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, score) with a positive score, best first; only rows
+        where the `rows` mask is set compete (statistics stay corpus-wide)."""
+        if not self.doc_ids:
+            return []
+        terms = np.unique(_VECTORIZER.transform([query]).indices)
+        if terms.size == 0:
+            return []
+        scores = np.asarray(self._bm25_weights()[:, terms].sum(axis=1)).ravel()
+        if rows is not None:
+            scores = np.where(rows, scores, 0.0)
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
@@ -1,91 +1,335 @@
-import os, uuid, shutil
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import os, time, uuid, json, shutil, asyncio, datetime
+from contextlib import aclosing
+import anyio
+from typing import Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from .config import settings
-from .db.schemas import ChatRequest, ChatResponse
+from .db.schemas import ChatBatchRequest, ChatRequest, ChatResponse
 
 from app.db.mongo_repo import (
     init_mongo,
+    close_mongo,
     get_or_create_session,
     save_message,
+    save_turn,
     fetch_history_pairs,
     list_sessions,
     get_session_messages,
+    iter_sessions,
+    iter_session_messages,
+    maintenance_lock,
+    migrate_inline_sources,
 )
 from .ml_service import EnhancedPDFRAGChatbot
+from .embeddings import EmbeddingMismatchError
+from .admission import AdmissionQueue, Overloaded
+from .jobs import IndexJob, IndexJobQueue
+from .tokens import approx_tokens
+from .scopes import DEFAULT_COLLECTION, Scope, collection_dir
+from . import metrics
 
 
 app = FastAPI(title="PDF RAG Chatbot API")
 
+metrics.configure(
+    enabled=settings.METRICS_ENABLED,
+    profile_rate=settings.PROFILE_SAMPLE_RATE,
+    profile_dir=settings.PROFILE_DIR or os.path.join(settings.PERSIST_DIR, "profiles"),
+    profile_keep=settings.PROFILE_KEEP,
+)
+# Server-Timing header on /chat* responses (no-op when metrics are off)
+app.add_middleware(metrics.ServerTimingMiddleware)
+
 
 # Global resources
 bot = EnhancedPDFRAGChatbot(
-    persist_directory=settings.PERSIST_DIR, api_key=settings.GEM_API_KEY
+    persist_directory=settings.PERSIST_DIR,
+    api_key=settings.GEM_API_KEY,
+    index_workers=settings.INDEX_WORKERS,
+    index_batch_size=settings.INDEX_BATCH_SIZE,
+    index_max_inflight=settings.INDEX_MAX_INFLIGHT_FILES,
+    embedding_backend=settings.EMBEDDING_BACKEND,
+    embedding_model=settings.EMBEDDING_MODEL or None,
+    embedding_batch_size=settings.EMBEDDING_BATCH_SIZE,
+    embedding_threads=settings.EMBEDDING_THREADS,
+    embedding_cache_size=settings.EMBED_CACHE_MAX_ENTRIES,
+    chat_threads=settings.CHAT_THREADS,
+    llm_concurrency=settings.LLM_MAX_CONCURRENCY,
+    retrieval_cache_size=settings.RETRIEVAL_CACHE_SIZE,
+    retrieval_cache_ttl=settings.RETRIEVAL_CACHE_TTL,
+    answer_cache_size=settings.ANSWER_CACHE_SIZE,
+    answer_cache_threshold=settings.ANSWER_CACHE_THRESHOLD,
+    generation_keep=settings.GENERATION_KEEP,
+    generation_grace_seconds=settings.GENERATION_GRACE_SECONDS,
+    reload_check_seconds=settings.INDEX_RELOAD_CHECK_SECONDS,
+    retrieval_mode=settings.RETRIEVAL_MODE,
+    lexical_fast_path_ratio=settings.LEXICAL_FAST_PATH_RATIO,
+    context_token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    context_dup_threshold=settings.CONTEXT_DUP_THRESHOLD,
+    vector_engine=settings.VECTOR_ENGINE,
+    flat_rescore=settings.FLAT_RESCORE,
+    chunk_size=settings.CHUNK_SIZE,
+    chunk_overlap=settings.CHUNK_OVERLAP,
+    chunk_separators=settings.CHUNK_SEPARATORS or None,
+    page_cache_mb=settings.PAGE_CACHE_MAX_MB,
+    dedup_threshold=settings.DEDUP_THRESHOLD,
+    index_in_place=settings.INDEX_IN_PLACE,
+    index_max_layers=settings.INDEX_MAX_LAYERS,
+    index_max_hidden=settings.INDEX_MAX_HIDDEN,
+)
+
+
+def _run_index_job(job: IndexJob):
+    if job.kind == "rebuild":
+        return bot.rebuild_knowledge_base(
+            kb_folder=settings.KB_FOLDER, on_progress=job.on_progress
+        )
+    return bot.build_vectorstore_from_folder(
+        kb_folder=settings.KB_FOLDER,
+        reset=job.params.get("reset", False),
+        on_progress=job.on_progress,
+    )
+
+
+# Single worker: index builds are serialized, identical queued requests coalesce.
+# Across server processes builds serialize on a lock in PERSIST_DIR and job
+# state is shared through snapshot files.
+index_jobs = IndexJobQueue(
+    _run_index_job, state_dir=os.path.join(settings.PERSIST_DIR, "jobs")
+)
+
+
+# Bounds /chat and /chat/stream requests in progress (429 beyond the queue)
+admission = AdmissionQueue(
+    max_active=settings.CHAT_MAX_ACTIVE,
+    max_queue=settings.CHAT_MAX_QUEUE,
+    max_wait=settings.CHAT_MAX_WAIT_SECONDS,
 )
 
 
 a_sync_db = None
+# None until the startup warm-up finished (see /readyz)
+warmup_report = None
+# result of the startup source reference migration (see /stats)
+migration_report = None
+
+
+@app.exception_handler(EmbeddingMismatchError)
+async def _embedding_mismatch(_, exc: EmbeddingMismatchError):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+@app.exception_handler(Overloaded)
+async def _overloaded(_, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 
 @app.on_event("startup")
 async def _startup():
-    global a_sync_db
+    global a_sync_db, warmup_report
     a_sync_db = await init_mongo()
+    if settings.WARMUP:
+        # in the background: the server answers /healthz meanwhile
+        app.state.warmup_task = asyncio.create_task(_warm_up())
+    else:
+        warmup_report = {"skipped": True}
+    if settings.MIGRATE_INLINE_SOURCES:
+        app.state.migration_task = asyncio.create_task(_migrate_sources())
+
+
+async def _warm_up():
+    global warmup_report
+    t0 = time.perf_counter()
+    report = await asyncio.to_thread(bot.warm_up)
+    report["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    print(f"[warm-up] done in {report['total_ms']}ms")
+    warmup_report = report
+
+
+async def _migrate_sources():
+    global migration_report
+    try:
+        # one server process migrates; the others report it as skipped
+        async with maintenance_lock(a_sync_db, "migrate-sources") as held:
+            if not held:
+                migration_report = {"skipped": "running in another process"}
+                return
+            migration_report = await migrate_inline_sources(a_sync_db)
+    except Exception as e:  # the server works either way; old messages still read
+        print(f"[migrate] source reference migration failed: {e}")
+        migration_report = {"error": str(e)}
+        return
+    if migration_report["messages"]:
+        print(f"[migrate] sources converted to references: {migration_report}")
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # flushes any write-behind session updates
+    await close_mongo()
 
 
 # ---------- Helpers ----------
 
 
-def _build_enriched_question(history_pairs, new_q: str) -> str:
-    if not history_pairs:
+def _build_enriched_question(
+    history_pairs, new_q: str, token_budget: int = settings.HISTORY_TOKEN_BUDGET
+) -> str:
+    # newest pairs first until the budget is spent, then back to chronological
+    hist_lines = []
+    used = 0
+    for u, a in reversed(history_pairs):
+        line = f"User: {u}\nAssistant: {a}"
+        used += approx_tokens(line)
+        if used > token_budget:
+            break
+        hist_lines.append(line)
+    if not hist_lines:
         return new_q
-    hist_lines = [f"User: {u}\nAssistant: {a}" for (u, a) in history_pairs]
-    history_str = "\n\n".join(hist_lines)
+    history_str = "\n\n".join(reversed(hist_lines))
     return (
         "Use the chat history to keep continuity. If the answer isn’t in the provided context, say you don’t know.\n"
         f"CHAT HISTORY:\n{history_str}\n\nNEW QUESTION: {new_q}"
     )
 
 
+def _scope(req) -> Scope:
+    try:
+        return Scope.of(req.collection, req.files)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def _json_default(o):
+    if isinstance(o, (datetime.datetime, datetime.date)):
+        return o.isoformat()
+    return str(o)
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+def _ndjson(rows) -> StreamingResponse:
+    async def lines():
+        async for item, _ in rows:
+            yield json.dumps(item, default=_json_default) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def _releasing(events, ticket):
+    """Stream `events`; the admission slot is freed however the stream ends
+    (including errors raised while it cleans up)."""
+    try:
+        async with aclosing(events):
+            async for event in events:
+                yield event
+    finally:
+        ticket.release()
+
+
+async def _load_history(session_oid, req: ChatRequest):
+    if not req.use_history:
+        return []
+    with metrics.stage("mongo_history"):
+        return await fetch_history_pairs(a_sync_db, session_oid, req.history_limit)
+
+
 # ---------- KB mgmt ----------
 
 
-@app.post("/index")
+@app.post("/index", status_code=202)
 async def index_kb(reset: bool = False):
     if not os.path.isdir(settings.KB_FOLDER):
         raise HTTPException(
             400, f"Knowledge base folder not found: {settings.KB_FOLDER}"
         )
-    bot.build_vectorstore_from_folder(kb_folder=settings.KB_FOLDER, reset=reset)
-    bot.reload()
-    return {"status": "ok", "action": "index", "reset": reset}
+    job = index_jobs.submit("index", reset=reset)
+    return {"status": job.status, "action": "index", "reset": reset, "job_id": job.id}
 
 
-@app.post("/rebuild")
+@app.post("/rebuild", status_code=202)
 async def rebuild_kb():
     if not os.path.isdir(settings.KB_FOLDER):
         raise HTTPException(
             400, f"Knowledge base folder not found: {settings.KB_FOLDER}"
         )
-    bot.rebuild_knowledge_base(kb_folder=settings.KB_FOLDER)
-    bot.reload()
-    return {"status": "ok", "action": "rebuild"}
-
-
-@app.post("/ingest-file")
-async def ingest_file(file: UploadFile = File(...), reset: bool = False):
+    job = index_jobs.submit("rebuild")
+    return {"status": job.status, "action": "rebuild", "job_id": job.id}
+
+
+@app.post("/ingest-file", status_code=202)
+async def ingest_file(
+    file: UploadFile = File(...),
+    reset: bool = False,
+    collection: str = DEFAULT_COLLECTION,
+):
+    """Add a PDF to the knowledge base and queue an index update. With
+    `collection`, it goes to that named collection, searched only by
+    questions that ask for it."""
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(400, "Only .pdf files are supported.")
-    os.makedirs(settings.KB_FOLDER, exist_ok=True)
-    safe_name = f"{uuid.uuid4()}_{file.filename}"
-    dest_path = os.path.join(settings.KB_FOLDER, safe_name)
+    try:
+        dest_dir = collection_dir(settings.KB_FOLDER, collection)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    os.makedirs(dest_dir, exist_ok=True)
+    safe_name = f"{uuid.uuid4()}_{os.path.basename(file.filename)}"
+    dest_path = os.path.join(dest_dir, safe_name)
     try:
         with open(dest_path, "wb") as buf:
             shutil.copyfileobj(file.file, buf)
     finally:
         file.file.close()
-    bot.build_vectorstore_from_folder(kb_folder=settings.KB_FOLDER, reset=reset)
-    bot.reload()
-    return {"status": "ok", "added": safe_name, "reset": reset}
+    job = index_jobs.submit("index", reset=reset)
+    return {
+        "status": job.status,
+        "added": safe_name,
+        "collection": collection,
+        "reset": reset,
+        "job_id": job.id,
+    }
+
+
+@app.get("/collections")
+async def api_list_collections():
+    return await asyncio.to_thread(bot.list_collections)
+
+
+@app.get("/jobs")
+async def api_list_jobs():
+    return index_jobs.snapshots()
+
+
+@app.get("/jobs/{job_id}")
+async def api_get_job(job_id: str):
+    job = index_jobs.snapshot(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job
+
+
+@app.get("/generations")
+async def api_list_generations():
+    return bot.list_generations()
+
+
+@app.post("/generations/{gen_id}/activate")
+async def api_activate_generation(gen_id: str):
+    try:
+        await asyncio.to_thread(bot.activate_generation, gen_id)
+    except EmbeddingMismatchError:
+        raise
+    except ValueError as e:
+        raise HTTPException(404, str(e))
+    return {"status": "ok", "active": gen_id}
 
 
 # ---------- Chat ----------
@@ -95,56 +339,354 @@ async def ingest_file(file: UploadFile = File(...), reset: bool = False):
 async def chat(req: ChatRequest):
     if a_sync_db is None:
         raise HTTPException(500, "Database not initialized")
+    async with admission.slot():
+        return await _chat(req)
+
+
+async def _chat(req: ChatRequest):
+
+    asked_at = datetime.datetime.utcnow()
+    scope = _scope(req)
 
     # get/create a session
     try:
-        session_oid = await get_or_create_session(a_sync_db, req.session_id)
+        with metrics.stage("mongo_session"):
+            session_oid = await get_or_create_session(a_sync_db, req.session_id)
     except ValueError as e:
         raise HTTPException(404, str(e))
 
-    # store user message
-    await save_message(a_sync_db, session_oid, "user", req.question)
-
-    # build question with history
-    history_pairs = (
-        await fetch_history_pairs(a_sync_db, session_oid, req.history_limit)
-        if req.use_history
-        else []
+    # load history and retrieve context concurrently
+    history_pairs, (docs, query_vector) = await asyncio.gather(
+        _load_history(session_oid, req),
+        bot.aretrieve_with_vector(req.question, req.k, scope),
     )
 
     enriched_q = _build_enriched_question(history_pairs, req.question)
 
-    # ask RAG
-    answer, sources = bot.chat(
-        question=req.question, k=req.k, structured=req.structured
+    # ask RAG (retrieval used the bare question, the LLM sees the history);
+    # the semantic answer cache only applies to history-free questions and
+    # identical concurrent prompts share one LLM call
+    answer, packing = await bot.aanswer_for(
+        req.question,
+        docs,
+        query_vector,
+        req.k,
+        req.structured,
+        prompt_question=enriched_q,
+        scope=scope,
     )
+    sources = bot.sources_from_docs(docs)
+
+    # store the question and answer together (one insert_many + one update)
+    with metrics.stage("mongo_save"):
+        await save_turn(
+            a_sync_db, session_oid, req.question, answer, sources, asked_at=asked_at
+        )
+
+    return {
+        "session_id": str(session_oid),
+        "answer": answer,
+        "sources": sources,
+        "context": packing,
+    }
 
-    # store assistant response
-    await save_message(a_sync_db, session_oid, "assistant", answer, sources)
 
-    return {"session_id": str(session_oid), "answer": answer, "sources": sources}
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-Sent Events version of /chat.
+
+    Events: `sources` once retrieval is done, then `token` deltas, then `done`
+    (or `error`). The turn is saved when the stream ends, even if the client
+    disconnects midway; disconnecting cancels the LLM call.
+    """
+    asked_at = datetime.datetime.utcnow()
+    if a_sync_db is None:
+        raise HTTPException(500, "Database not initialized")
+    scope = _scope(req)
+
+    try:
+        with metrics.stage("mongo_session"):
+            session_oid = await get_or_create_session(a_sync_db, req.session_id)
+    except ValueError as e:
+        raise HTTPException(404, str(e))
+
+    # admitted before the response starts, so a rejection is still a 429;
+    # the slot is held until the stream ends
+    ticket = admission.ticket()
+    await ticket.acquire()
+
+    async def events():
+        history = asyncio.ensure_future(_load_history(session_oid, req))
+        sources = []
+        parts = []
+        completed = False
+        try:
+            docs = await bot.aretrieve(req.question, req.k, scope)
+            sources = bot.sources_from_docs(docs)
+            yield _sse("sources", {"session_id": str(session_oid), "sources": sources})
+
+            history_pairs = await history
+            enriched_q = _build_enriched_question(history_pairs, req.question)
+            context_docs, packing = bot.pack_context(docs)
+
+            stream = bot.astream_answer(
+                enriched_q, context_docs, structured=req.structured
+            )
+            async with aclosing(stream):
+                async for delta in stream:
+                    parts.append(delta)
+                    yield _sse("token", {"delta": delta})
+            completed = True
+            yield _sse(
+                "done",
+                {
+                    "session_id": str(session_oid),
+                    "answer": "".join(parts),
+                    "context": packing,
+                },
+            )
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            if not history.done():
+                history.cancel()
+            elif not history.cancelled():
+                history.exception()  # a failure nobody awaited counts as seen
+            # shielded: on disconnect this scope is already cancelled
+            with anyio.CancelScope(shield=True):
+                if parts:
+                    with metrics.stage("mongo_save"):
+                        await save_turn(
+                            a_sync_db,
+                            session_oid,
+                            req.question,
+                            "".join(parts),
+                            sources,
+                            asked_at=asked_at,
+                        )
+                else:
+                    await save_message(a_sync_db, session_oid, "user", req.question)
+            if not completed:
+                print(f"[chat/stream] session {session_oid} ended before completion")
+
+    return StreamingResponse(
+        _releasing(events(), ticket),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # also if the stream never started (client gone before the first byte)
+        background=BackgroundTask(ticket.release),
+    )
+
+
+@app.post("/chat/batch")
+async def chat_batch(req: ChatBatchRequest):
+    """Answer many independent questions (no chat history) in one request.
+
+    Responds with NDJSON, one line per question in completion order:
+    {"index", "question", "answer", "sources", "context", "cached", "error"},
+    plus "session_id" when the turn was saved. Retrieval is batched and LLM
+    calls run BATCH_LLM_CONCURRENCY at a time, retried on failure.
+    """
+    if req.persist and a_sync_db is None:
+        raise HTTPException(500, "Database not initialized")
+    if not req.questions:
+        raise HTTPException(400, "No questions given")
+    if len(req.questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            400, f"At most {settings.BATCH_MAX_QUESTIONS} questions per batch"
+        )
+    scope = _scope(req)
+
+    session_oid = None
+    if req.persist:
+        try:
+            with metrics.stage("mongo_session"):
+                session_oid = await get_or_create_session(a_sync_db, req.session_id)
+        except ValueError as e:
+            raise HTTPException(404, str(e))
+
+    async def lines():
+        asked_at = datetime.datetime.utcnow()
+        results = bot.achat_batch(
+            req.questions,
+            k=req.k,
+            structured=req.structured,
+            concurrency=settings.BATCH_LLM_CONCURRENCY,
+            max_retries=settings.BATCH_MAX_RETRIES,
+            scope=scope,
+        )
+        async with aclosing(results):
+            async for result in results:
+                if session_oid is not None and result["error"] is None:
+                    with metrics.stage("mongo_save"):
+                        await save_turn(
+                            a_sync_db,
+                            session_oid,
+                            result["question"],
+                            result["answer"],
+                            result["sources"],
+                            asked_at=asked_at,
+                        )
+                    result["session_id"] = str(session_oid)
+                yield json.dumps(result, default=_json_default) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ---------- Sessions ----------
 
 
 @app.get("/sessions")
-async def api_list_sessions():
+async def api_list_sessions(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """Sessions by last activity. Pass the `X-Next-Cursor` response header back
+    as `cursor` for the next page; `format=ndjson` streams all of them."""
     if a_sync_db is None:
         raise HTTPException(500, "Database not initialized")
-    return await list_sessions(a_sync_db)
+    try:
+        if format == "ndjson":
+            return _ndjson(iter_sessions(a_sync_db, cursor))
+        items, next_cursor = await list_sessions(a_sync_db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
 
 
 @app.get("/sessions/{session_id}/messages")
-async def api_get_session_messages(session_id: str):
+async def api_get_session_messages(
+    session_id: str,
+    response: Response,
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    include_sources: bool = True,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """A session's messages, oldest first, paginated like /sessions."""
     if a_sync_db is None:
         raise HTTPException(500, "Database not initialized")
-    return await get_session_messages(a_sync_db, session_id)
+    try:
+        if format == "ndjson":
+            rows = iter_session_messages(
+                a_sync_db, session_id, cursor, include_sources=include_sources
+            )
+            return _ndjson(rows)
+        items, next_cursor = await get_session_messages(
+            a_sync_db, session_id, limit, cursor, include_sources
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
+
+# ---------- Health ----------
+
+
+@app.get("/healthz")
+async def healthz():
+    # liveness: the event loop is serving requests
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # readiness: Mongo is connected and the warm-up has finished
+    ready = a_sync_db is not None and warmup_report is not None
+    body = {"ready": ready, "warmup": warmup_report}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
 
 
 # ---------- Debug ----------
 
 
+@app.get("/stats")
+async def stats():
+    return {
+        "caches": bot.cache_stats(),
+        "retrieval": bot.retrieval_stats(),
+        "admission": admission.stats(),
+        "coalescing": bot.coalescing_stats(),
+        "source_migration": migration_report,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_metrics():
+    """Prometheus text format: stage latency histograms plus the cache,
+    retrieval, admission and coalescing counters of /stats."""
+    caches = bot.cache_stats()
+    retrieval = bot.retrieval_stats()
+    queue = admission.stats()
+    flights = bot.coalescing_stats()
+    kinds = {k: v for k, v in flights.items() if k != "in_flight"}
+    names = ("retrieval", "answer", "embedding", "pages")
+    named = {n: caches[n] for n in names if caches[n]}
+    extra = (
+        metrics.counter_lines(
+            "rag_cache_hits_total",
+            "Cache hits since start.",
+            "cache",
+            {n: c["hits"] for n, c in named.items()},
+        )
+        + metrics.counter_lines(
+            "rag_cache_misses_total",
+            "Cache misses since start.",
+            "cache",
+            {n: c["misses"] for n, c in named.items()},
+        )
+        + metrics.counter_lines(
+            "rag_retrievals_total",
+            "Retrievals since start, by how they were served.",
+            "mode",
+            retrieval["counts"],
+        )
+        + metrics.counter_lines(
+            "rag_context_tokens_total",
+            "Context tokens since start, before and after packing.",
+            "kind",
+            {k: v for k, v in retrieval["context"].items() if k != "requests"},
+        )
+        + metrics.gauge_lines(
+            "rag_admission_requests",
+            "Chat requests admitted to or waiting for a slot, right now.",
+            "state",
+            {"active": queue["active"], "waiting": queue["waiting"]},
+        )
+        + metrics.counter_lines(
+            "rag_admission_rejected_total",
+            "Chat requests rejected with 429 since start.",
+            "reason",
+            queue["rejected"],
+        )
+        + metrics.gauge_lines(
+            "rag_coalesced_ratio",
+            "Fraction of calls that joined an identical call in flight.",
+            "kind",
+            {k: c["ratio"] for k, c in kinds.items()},
+        )
+        + metrics.counter_lines(
+            "rag_coalesced_calls_total",
+            "Calls that joined an identical call in flight, since start.",
+            "kind",
+            {k: c["coalesced"] for k, c in kinds.items()},
+        )
+    )
+    return PlainTextResponse(
+        metrics.render(extra), media_type="text/plain; version=0.0.4"
+    )
+
+
 @app.get("/fs-check")
 async def fs_check():
     return {
@@ -152,6 +694,7 @@ async def fs_check():
         "kb_exists": os.path.isdir(settings.KB_FOLDER),
         "kb_path": settings.KB_FOLDER,
         "persist_path": settings.PERSIST_DIR,
+        "embedding_cache": bot.embedding_cache_stats(),
         "kb_list": (
             sorted(os.listdir(settings.KB_FOLDER))
             if os.path.isdir(settings.KB_FOLDER)
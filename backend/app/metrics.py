@@ -0,0 +1,299 @@
+"""
+Per-stage latency instrumentation.
+
+    with metrics.stage("vector_search"):
+        ...
+
+records the block's duration in the `rag_stage_seconds{stage=...}` histogram
+(and counts exceptions in `rag_stage_errors_total`). Stages of the chat path:
+mongo_session, mongo_history, retrieve (= lexical + embed_query +
+vector_search + fuse), context_pack, llm, mongo_save; of indexing:
+index_parse, index_split (in-process parsing only; with a parser pool the
+wait for it is index_parse_wait), embed_documents, index_upsert (includes
+embedding), index_delete, index_lexical.
+
+render() returns everything in the Prometheus text format for /metrics; no
+client library needed. ServerTimingMiddleware also sums the stages of each
+request into a Server-Timing header. The per-request timings travel in a
+contextvar, so blocking work has to run in a copied context
+(asyncio.to_thread, or contextvars.copy_context().run in an executor).
+
+profiled(name) runs a random `profile_rate` fraction of the wrapped calls
+under cProfile and dumps the stats to profile_dir (newest profile_keep kept);
+open them with `python -m pstats` or snakeviz.
+
+With configure(enabled=False), stage() returns a shared no-op context
+manager and profiled() does nothing unless profiling is on.
+"""
+
+import os
+import time
+import bisect
+import random
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# seconds; from a cached retrieval (~1ms) to a slow LLM answer
+_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+_enabled = True
+_profile_rate = 0.0
+_profile_dir = ""
+_profile_keep = 20
+_NOOP = nullcontext()
+_profile_seq = itertools.count()
+
+# stage -> [seconds, calls] of the current request (None outside of one)
+_timings: "contextvars.ContextVar[Optional[Dict[str, List[float]]]]" = (
+    contextvars.ContextVar("rag_stage_timings", default=None)
+)
+
+
+def configure(
+    enabled: bool = True,
+    profile_rate: float = 0.0,
+    profile_dir: str = "",
+    profile_keep: int = 20,
+) -> None:
+    global _enabled, _profile_rate, _profile_dir, _profile_keep
+    _enabled = enabled
+    _profile_rate = profile_rate if profile_dir else 0.0
+    _profile_dir = profile_dir
+    _profile_keep = profile_keep
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+# -------------------------------
+# Metric types
+# -------------------------------
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label: str) -> None:
+        self.name, self.help_text, self.label = name, help_text, label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for value, total in items:
+            lines.append(f'{self.name}{{{self.label}="{_label(value)}"}} {total:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label: str,
+        buckets: Tuple[float, ...] = _BUCKETS,
+    ) -> None:
+        self.name, self.help_text, self.label = name, help_text, label
+        self.buckets = buckets
+        # label value -> per-bucket counts (+ one for +Inf), then the sum
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += seconds
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        name = self.name
+        lines = [f"# HELP {name} {self.help_text}", f"# TYPE {name} histogram"]
+        for value, series in items:
+            label = f'{self.label}="{_label(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label}}} {series[-1]:.6f}")
+            lines.append(f"{name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Time spent per request/indexing stage.", "stage"
+)
+STAGE_ERRORS = Counter(
+    "rag_stage_errors_total", "Stages that ended with an exception.", "stage"
+)
+_METRICS: List[Any] = [STAGE_SECONDS, STAGE_ERRORS]
+
+
+def _read_lines(
+    kind: str, name: str, help_text: str, label: str, values: Dict[str, float]
+) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for value, number in sorted(values.items()):
+        lines.append(f'{name}{{{label}="{_label(value)}"}} {number:g}')
+    return lines
+
+
+def gauge_lines(
+    name: str, help_text: str, label: str, values: Dict[str, float]
+) -> List[str]:
+    """Exposition lines for values read at scrape time (e.g. cache stats)."""
+    return _read_lines("gauge", name, help_text, label, values)
+
+
+def counter_lines(
+    name: str, help_text: str, label: str, values: Dict[str, float]
+) -> List[str]:
+    """Same, for totals that only grow (e.g. cache hits since start); name
+    them *_total."""
+    return _read_lines("counter", name, help_text, label, values)
+
+
+def render(extra: Optional[List[str]] = None) -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines += metric.render()
+    return "\n".join(lines + (extra or [])) + "\n"
+
+
+# -------------------------------
+# Stages
+# -------------------------------
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.perf_counter() - self.t0
+        STAGE_SECONDS.observe(self.name, seconds)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.name)
+        timings = _timings.get()
+        if timings is not None:
+            entry = timings.setdefault(self.name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+
+def stage(name: str) -> Any:
+    return _Stage(name) if _enabled else _NOOP
+
+
+def server_timing(
+    timings: Dict[str, List[float]], total: Optional[float] = None
+) -> str:
+    parts = [f"{name};dur={t[0] * 1000:.1f}" for name, t in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware adding a Server-Timing header to responses of paths
+    starting with one of `prefixes`. Streaming responses send their headers
+    first, so they only show the stages that finished before the body."""
+
+    def __init__(self, app: Any, prefixes: Tuple[str, ...] = ("/chat",)) -> None:
+        self.app = app
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            not _enabled
+            or scope["type"] != "http"
+            or not scope["path"].startswith(self.prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, List[float]] = {}
+        token = _timings.set(timings)
+        t0 = time.perf_counter()
+
+        async def send_with_timing(message) -> None:
+            if message["type"] == "http.response.start":
+                header = server_timing(timings, time.perf_counter() - t0)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+
+
+# -------------------------------
+# Sampled profiling
+# -------------------------------
+@contextmanager
+def _profile(name: str) -> Iterator[None]:
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(_profile_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%dT%H%M%S")
+            fname = f"{name}-{stamp}-{os.getpid()}-{next(_profile_seq)}.prof"
+            profiler.dump_stats(os.path.join(_profile_dir, fname))
+            _trim_profiles()
+        except OSError as e:
+            print(f"[metrics] Could not write profile: {e}")
+
+
+def _trim_profiles() -> None:
+    dumps = sorted(
+        (
+            os.path.join(_profile_dir, fname)
+            for fname in os.listdir(_profile_dir)
+            if fname.endswith(".prof")
+        ),
+        key=os.path.getmtime,
+    )
+    for path in dumps[: max(0, len(dumps) - _profile_keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def profiled(name: str) -> Any:
+    """cProfile the block for a sampled fraction of calls (current thread only)."""
+    if _profile_rate > 0 and random.random() < _profile_rate:
+        return _profile(name)
+    return _NOOP
+
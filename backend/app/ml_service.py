@@ -2,8 +2,23 @@
 RAG bot service for PDF knowledge bases (Chroma + Gemini).
 
 - Index PDFs from a folder into a persisted Chroma vector store (one-time or on-demand)
+- Incremental re-indexing: a manifest of file hashes means only new/changed files
+  are embedded and chunks of removed files are deleted
+- Streaming, batched, resumable indexing with bounded memory (see indexing.py)
+- Parsed page text is cached by file hash, so rebuilds and chunking changes
+  don't parse PDFs again (see page_cache.py)
+- Near-duplicate chunks (boilerplate repeated across PDFs) are stored and
+  embedded once, listing every file and page they occur in (see dedup.py)
+- Vector, or hybrid BM25 + vector retrieval with rank fusion (see lexical.py)
+- Dense search through Chroma's HNSW, or exact flat / int8 search over
+  memory-mapped NumPy vectors (see flat_index.py)
+- Scoped retrieval: named collections and per-file filters (see scopes.py)
+- Token-budgeted context packing (dedup + merging neighbours, see context_packing.py)
 - Answer questions strictly from retrieved context
-- Safe rebuild for Docker volumes (does not delete the mount itself)
+- Zero-downtime rebuilds: each rebuild writes a new index generation and switches
+  to it atomically; older generations stay around for rollback (see generations.py)
+- Incremental updates are overlays on the active generation that only hold what
+  changed, so their cost doesn't grow with the corpus (see overlay.py)
 
 Usage:
     bot = EnhancedPDFRAGChatbot(
@@ -18,23 +33,70 @@ Usage:
 
     # Ask questions
     answer, sources = bot.chat("What are the main findings about X?", k=6)
+    # or, from async code (doesn't block the event loop)
+    answer, sources = await bot.achat("What are the main findings about X?", k=6)
+
+LangChain, Chroma, pypdf and the Gemini client are imported on first use, not
+at import time, so the API process starts quickly; warm_up() pays those costs
+(and opens the store) before the first request instead of on it.
 """
 
+from __future__ import annotations
+
 import os
 import re
-import uuid
-import shutil
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import random
+import asyncio
+import functools
+import contextvars
+import itertools
+import weakref
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import aclosing, contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (
+    List,
+    Dict,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.retrievers import BaseRetriever
-from langchain.prompts import ChatPromptTemplate
+from .kb_manifest import MANIFEST_FILE, IndexPlan, KBManifest
+from .indexing import Chunking, FileChunks, StreamingIndexer
+from .dedup import DedupIndex, remove_duplicates
+from .embedding_cache import CachedEmbeddings, open_cache
+from .page_cache import PageCache, Pages, open_page_cache
+from .chat_cache import RetrievalCache, SemanticAnswerCache
+from .admission import SingleFlight
+from . import metrics
+from .context_packing import pack_context
+from .scopes import DEFAULT_COLLECTION, Scope, chroma_name, collection_of
+from .generations import GenerationStore, IndexHandle, release_chroma_client
+from .overlay import LayeredStore
+from .embeddings import (
+    DEFAULT_MODELS,
+    EmbeddingMismatchError,
+    embed_queries,
+    embedding_tag,
+    make_embeddings,
+)
 
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+if TYPE_CHECKING:  # heavy; imported where they're used
+    from langchain.docstore.document import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_community.vectorstores import Chroma
+    from langchain.prompts import ChatPromptTemplate
 
 # Prefer the shared schema if present; otherwise define a local fallback
 try:  # pragma: no cover
@@ -60,24 +122,151 @@ class EnhancedPDFRAGChatbot:
         model: str = "gemini-2.0-flash-001",
         temperature: float = 0.2,
         max_output_tokens: int = 2048,
+        index_workers: int = 1,
+        index_batch_size: int = 128,
+        index_max_inflight: int = 0,
+        embedding_backend: str = "google",
+        embedding_model: Optional[str] = None,
+        embedding_batch_size: int = 64,
+        embedding_threads: int = 0,
+        embedding_cache_size: int = 200_000,
+        chat_threads: int = 16,
+        llm_concurrency: int = 16,
+        retrieval_cache_size: int = 1024,
+        retrieval_cache_ttl: float = 600.0,
+        answer_cache_size: int = 0,
+        answer_cache_threshold: float = 0.95,
+        generation_keep: int = 2,
+        generation_grace_seconds: float = 300.0,
+        reload_check_seconds: float = 1.0,
+        retrieval_mode: str = "vector",
+        lexical_fast_path_ratio: float = 3.0,
+        context_token_budget: int = 0,
+        context_dup_threshold: float = 0.8,
+        vector_engine: str = "chroma",
+        flat_rescore: int = 4,
+        chunk_size: int = 1500,
+        chunk_overlap: int = 200,
+        chunk_separators: Optional[List[str]] = None,
+        page_cache_mb: float = 512,
+        dedup_threshold: float = 0.9,
+        index_in_place: bool = False,
+        index_max_layers: int = 8,
+        index_max_hidden: int = 2000,
     ) -> None:
         self.persist_directory = persist_directory
+        self.index_workers = max(1, index_workers)
+        self.index_batch_size = index_batch_size
+        self.index_max_inflight = index_max_inflight
+        self.embedding_backend = embedding_backend
+        self.embedding_model = embedding_model or DEFAULT_MODELS[embedding_backend]
+        self.embedding_tag = embedding_tag(self.embedding_backend, self.embedding_model)
+        self.embedding_batch_size = embedding_batch_size
+        self.embedding_threads = embedding_threads
+        self.embedding_cache_size = embedding_cache_size
         self.GENAI_API_KEY = api_key or os.getenv("gem_api_key", "default_key")
+        if retrieval_mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode!r}")
+        self.retrieval_mode = retrieval_mode
+        if vector_engine not in ("chroma", "flat", "int8"):
+            raise ValueError(f"Unknown vector engine: {vector_engine!r}")
+        self.vector_engine = vector_engine
+        self.flat_rescore = flat_rescore
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("Need 0 <= chunk_overlap < chunk_size")
+        self.chunking = Chunking(chunk_size, chunk_overlap)
+        if chunk_separators:
+            self.chunking = self.chunking._replace(separators=tuple(chunk_separators))
+        self.lexical_fast_path_ratio = lexical_fast_path_ratio
+        # how each retrieval was served (for /stats)
+        self.retrieval_counts = {"vector": 0, "hybrid": 0, "lexical_fast_path": 0}
+        self.context_token_budget = context_token_budget
+        self.context_dup_threshold = context_dup_threshold
+        self.context_totals = {"requests": 0, "tokens_before": 0, "tokens_after": 0}
         os.makedirs(self.persist_directory, exist_ok=True)
+        # near-duplicate chunks are stored once at or above this MinHash
+        # similarity (0 disables, see dedup.py)
+        self.dedup_threshold = dedup_threshold
+        # parsed PDF pages, by file hash (see page_cache.py)
+        self.page_cache = open_page_cache(self.persist_directory, page_cache_mb)
+        self.generations = GenerationStore(
+            self.persist_directory, generation_keep, generation_grace_seconds
+        )
+        # incremental updates are overlays on the active generation, folded
+        # into one generation past index_max_layers layers or
+        # index_max_hidden hidden rows (see generations.py); below 2 layers
+        # every update copies the active generation instead
+        self.index_max_layers = index_max_layers
+        self.index_max_hidden = index_max_hidden
+        # incremental updates modify the active generation instead of a new
+        # one on top of it: queries can see a half-applied update and there
+        # is no rollback to the state before it. Single-worker deployments only.
+        self.index_in_place = index_in_place
 
-        # LLM
-        self.llm = ChatGoogleGenerativeAI(
+        # LLM (client created on first use, see the llm property)
+        self._llm_kwargs = dict(
             model=model,
             api_key=self.GENAI_API_KEY,
             temperature=temperature,
             top_p=0.95,
             max_output_tokens=max_output_tokens,
         )
+        self._llm = None
+        self._structured_llm = None
+        self._prompt: Optional[ChatPromptTemplate] = None
 
         # Lazy state
         self._embeddings = None
-        self._vectorstore: Optional[Chroma] = None
-        self._retriever: Optional[BaseRetriever] = None
+        self._embedding_cache = None
+        # Handle on the active generation, plus retired ones still being queried
+        self._handle: Optional[IndexHandle] = None
+        self._draining: List[IndexHandle] = []
+        self._handles_lock = threading.Lock()
+        # Other processes (server workers) publish new generations by
+        # rewriting ACTIVE; it is polled at most every reload_check_seconds
+        self.reload_check_seconds = reload_check_seconds
+        self._seen_marker = self.generations.marker()
+        self._next_marker_check = 0.0
+
+        # Async chat: blocking retrieval runs on a sized pool, LLM calls are capped
+        self._executor = ThreadPoolExecutor(
+            max_workers=chat_threads, thread_name_prefix="rag-chat"
+        )
+        # LLM call slots per event loop: an asyncio.Semaphore belongs to the
+        # loop it was first used on, and chat_batch runs each batch on a new one
+        self.llm_concurrency = llm_concurrency
+        self._llm_slots_by_loop: weakref.WeakKeyDictionary = (
+            weakref.WeakKeyDictionary()
+        )
+        # identical concurrent retrievals / answers share one run (admission.py)
+        self.flights = SingleFlight()
+
+        # Chat caches; entries are tagged with the index generation, which
+        # reload() bumps, so results from a previous index are never served
+        self.generation = 0
+        self.retrieval_cache = RetrievalCache(retrieval_cache_size, retrieval_cache_ttl)
+        self.answer_cache = SemanticAnswerCache(answer_cache_size, answer_cache_threshold)
+
+    # -------------------------------
+    # LLM
+    # -------------------------------
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            self._llm = ChatGoogleGenerativeAI(**self._llm_kwargs)
+        return self._llm
+
+    @llm.setter
+    def llm(self, value) -> None:
+        self._llm = value
+        self._structured_llm = None
+
+    def _structured(self):
+        if self._structured_llm is None:
+            self._structured_llm = self.llm.with_structured_output(AnswerWithSources)
+        return self._structured_llm
 
     # -------------------------------
     # Embeddings
@@ -85,116 +274,1066 @@ class EnhancedPDFRAGChatbot:
     @property
     def embeddings(self):
         if self._embeddings is None:
-            self._embeddings = GoogleGenerativeAIEmbeddings(
-                model="models/embedding-001", google_api_key=self.GENAI_API_KEY
+            base = make_embeddings(
+                self.embedding_backend,
+                self.embedding_model,
+                api_key=self.GENAI_API_KEY,
+                batch_size=self.embedding_batch_size,
+                num_threads=self.embedding_threads,
+            )
+            self._embedding_cache = open_cache(
+                self.persist_directory, self.embedding_cache_size
             )
+            if self._embedding_cache is None:
+                self._embeddings = base
+            else:
+                self._embeddings = CachedEmbeddings(
+                    base, self.embedding_tag, self._embedding_cache
+                )
         return self._embeddings
 
+    def embedding_cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self._embedding_cache.stats() if self._embedding_cache else None
+
     # -------------------------------
     # PDF Loading & Splitting
     # -------------------------------
     @staticmethod
-    def _load_and_split_pdf(file_path: str) -> List[Document]:
-        loader = PyPDFLoader(file_path)
-        pages = loader.load()
-
-        if pages:
-            file_name = os.path.basename(file_path)
-            for page in pages:
-                page.metadata.setdefault("source", file_path)
-                page.metadata.setdefault("file_name", file_name)
-
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1500,
-            chunk_overlap=200,
+    def _splitter(
+        chunking: Optional[Chunking] = None,
+    ) -> RecursiveCharacterTextSplitter:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+        chunking = chunking or Chunking()
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunking.chunk_size,
+            chunk_overlap=chunking.chunk_overlap,
             length_function=len,
-            separators=["\n\n", "\n", ".", " ", ""],
+            separators=list(chunking.separators),
+        )
+
+    @staticmethod
+    def _iter_pdf_pages(
+        file_path: str,
+        page_cache: Optional[PageCache] = None,
+        digest: Optional[str] = None,
+        pages: Optional[Pages] = None,
+    ) -> Iterator[Document]:
+        """Pages of one PDF: `pages` (already read from the page cache), or
+        from the page cache if it has the file's content, else parsed lazily
+        (and cached once the whole file has been read)."""
+        from langchain.docstore.document import Document
+
+        file_name = os.path.basename(file_path)
+        if pages is None and page_cache and digest:
+            pages = page_cache.get(digest)
+        if pages is not None:
+            for text, meta in pages:
+                meta = {**meta, "source": file_path, "file_name": file_name}
+                yield Document(page_content=text, metadata=meta)
+            return
+
+        from langchain_community.document_loaders import PyPDFLoader
+
+        loaded = PyPDFLoader(file_path).lazy_load()
+        seen: Pages = []
+        while True:
+            with metrics.stage("index_parse"):
+                page = next(loaded, None)
+            if page is None:
+                break
+            page.metadata.setdefault("source", file_path)
+            page.metadata.setdefault("file_name", file_name)
+            if page_cache and digest:
+                meta = {
+                    key: value
+                    for key, value in page.metadata.items()
+                    if key not in ("source", "file_name")
+                }
+                seen.append((page.page_content, meta))
+            yield page
+        if page_cache and digest:
+            page_cache.put(digest, seen)
+
+    @staticmethod
+    def _iter_pdf_chunks(
+        file_path: str,
+        chunking: Optional[Chunking] = None,
+        page_cache: Optional[PageCache] = None,
+        digest: Optional[str] = None,
+        pages: Optional[Pages] = None,
+    ) -> Iterator[Document]:
+        """Lazily parse (or read from the page cache) and split one PDF, a
+        page at a time. `digest` is the file's sha256, the page cache key."""
+        splitter = EnhancedPDFRAGChatbot._splitter(chunking)
+        source = EnhancedPDFRAGChatbot._iter_pdf_pages(
+            file_path, page_cache, digest, pages
+        )
+        for page in source:
+            with metrics.stage("index_split"):
+                chunks = splitter.split_documents([page])
+            yield from chunks
+
+    @staticmethod
+    def _load_and_split_pdf(
+        file_path: str,
+        chunking: Optional[Chunking] = None,
+        page_cache: Optional[PageCache] = None,
+        digest: Optional[str] = None,
+    ) -> List[Document]:
+        chunks = EnhancedPDFRAGChatbot._iter_pdf_chunks(
+            file_path, chunking, page_cache, digest
         )
-        return splitter.split_documents(pages)
+        return list(chunks)
+
+    @staticmethod
+    def _try_load_and_split_pdf(
+        file_path: str,
+        chunking: Optional[Chunking] = None,
+        page_cache: Optional[PageCache] = None,
+        digest: Optional[str] = None,
+    ) -> Tuple[List[Document], Optional[str]]:
+        """Like _load_and_split_pdf, but one unreadable PDF doesn't abort a batch."""
+        try:
+            chunks = EnhancedPDFRAGChatbot._load_and_split_pdf(
+                file_path, chunking, page_cache, digest
+            )
+            return chunks, None
+        except Exception as e:
+            return [], f"{type(e).__name__}: {e}"
+
+    @classmethod
+    def _iter_split_files(
+        cls,
+        file_paths: List[str],
+        workers: int = 1,
+        max_inflight: int = 0,
+        chunking: Optional[Chunking] = None,
+        page_cache: Optional[PageCache] = None,
+        digests: Optional[Dict[str, str]] = None,
+    ) -> Iterator[FileChunks]:
+        """Yield (path, chunks, error) for each file, in the order given.
+
+        Serially, chunks is a lazy per-page iterator (it may raise while being
+        consumed). With workers > 1 parsing fans out to a process pool with at
+        most `max_inflight` files (default 2 per worker) parsed ahead of the
+        consumer; results still come back in input order so chunk doc_ids are
+        identical to the serial path. Files found in `page_cache` (looked up
+        by their sha256 in `digests`) aren't parsed, only split, in this
+        process; parsed files are added to it.
+        """
+        digests = digests or {}
+        workers = min(workers, len(file_paths))
+        if workers <= 1:
+            for fpath in file_paths:
+                chunks = cls._iter_pdf_chunks(
+                    fpath, chunking, page_cache, digests.get(fpath)
+                )
+                yield fpath, chunks, None
+            return
+
+        max_inflight = max_inflight or workers * 2
+        # spawn, not fork: the server process holds gRPC/Chroma threads
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+
+            def submit(fpath: str) -> Tuple[str, Any]:
+                digest = digests.get(fpath)
+                cached = page_cache.get(digest) if page_cache and digest else None
+                if cached is not None:
+                    return fpath, cached
+                job = (cls._try_load_and_split_pdf, fpath, chunking, page_cache, digest)
+                return fpath, pool.submit(*job)
+
+            queued = iter(file_paths)
+            inflight: Deque[Tuple[str, Any]] = deque()
+            for fpath in itertools.islice(queued, max_inflight):
+                inflight.append(submit(fpath))
+            while inflight:
+                fpath, pending = inflight.popleft()
+                nxt = next(queued, None)
+                if nxt is not None:
+                    inflight.append(submit(nxt))
+                if not isinstance(pending, Future):  # pages from the page cache
+                    chunks = cls._iter_pdf_chunks(fpath, chunking, pages=pending)
+                    yield fpath, chunks, None
+                    continue
+                with metrics.stage("index_parse_wait"):
+                    chunks, error = pending.result()
+                yield fpath, chunks, error
 
     # -------------------------------
     # Vectorstore Building
     # -------------------------------
-    def _safe_clear_persist_dir(self) -> None:
-        """Clear contents of the persist directory without deleting the mount itself.
-        Useful for Docker volumes to avoid 'Device or resource busy'.
-        """
-        os.makedirs(self.persist_directory, exist_ok=True)
-        # Drop handles before clearing
-        self._vectorstore = None
-        self._retriever = None
-        for name in os.listdir(self.persist_directory):
-            path = os.path.join(self.persist_directory, name)
-            try:
-                if os.path.isdir(path) and not os.path.islink(path):
-                    shutil.rmtree(path, ignore_errors=True)
+    def _check_embedding_tag(self, manifest: KBManifest) -> None:
+        if manifest.embedding and manifest.embedding != self.embedding_tag:
+            raise EmbeddingMismatchError(
+                f"Index was built with embeddings '{manifest.embedding}' but "
+                f"'{self.embedding_tag}' is configured; rebuild the index."
+            )
+
+    def _make_store(self, path: str, collection: str = DEFAULT_COLLECTION) -> Chroma:
+        from langchain_community.vectorstores import Chroma
+
+        return Chroma(
+            collection_name=chroma_name(collection),
+            embedding_function=self.embeddings,
+            persist_directory=path,
+        )
+
+    def _layered_store(
+        self,
+        paths: List[str],
+        collection: str = DEFAULT_COLLECTION,
+        live: Optional[set] = None,
+        hidden: int = 0,
+        create: bool = False,
+    ) -> Optional[LayeredStore]:
+        """The collection across a generation's layers (paths top first, see
+        overlay.py), from the layers that have it; the top layer's is created
+        with `create`. None if no layer has it (named collections are not
+        created on read; every generation has the default one)."""
+        stores = []
+        for depth, path in enumerate(paths):
+            if collection == DEFAULT_COLLECTION or (create and depth == 0):
+                stores.append(self._make_store(path, collection))
+                continue
+            client = self._make_store(path)._client
+            names = {getattr(c, "name", c) for c in client.list_collections()}
+            if chroma_name(collection) in names:
+                stores.append(self._make_store(path, collection))
+        return LayeredStore(stores, live, hidden) if stores else None
+
+    def _store_for(self, handle: IndexHandle, scope: Scope) -> Optional[LayeredStore]:
+        """The handle's store for the scope's collection; None if the
+        generation has no such collection (it is not created on read)."""
+        if scope.collection == DEFAULT_COLLECTION or handle.vectorstore is None:
+            return handle.vectorstore
+        with self._handles_lock:
+            if scope.collection not in handle.collections:
+                handle.collections[scope.collection] = self._layered_store(
+                    self._layer_paths(handle.layers),
+                    scope.collection,
+                    handle.live,
+                    handle.hidden,
+                )
+            return handle.collections[scope.collection]
+
+    def _layer_paths(self, layers: List[str]) -> List[str]:
+        return [self.generations.path_for(gen_id) for gen_id in layers]
+
+    def _rows_in_scope(
+        self, handle: IndexHandle, index: Any, masks: Dict[Any, Any], scope: Scope
+    ) -> Any:
+        """Row mask of the scope in a BM25 or flat index (None: every row),
+        cached in `masks` (a dict on the handle)."""
+        if scope not in masks:
+            if len(masks) >= 256:
+                masks.clear()
+            _, aliased = self._scope_aliases(handle, scope)
+            kb_folder = self._scope_manifest(handle).kb_folder
+            masks[scope] = index.mask(lambda d: scope.contains(d, kb_folder, aliased))
+        return masks[scope]
+
+    @staticmethod
+    def _scope_manifest(handle: IndexHandle) -> IndexHandle:
+        """The handle, with what scoping needs from its manifest loaded."""
+        if handle.dup_of is None:
+            manifest = KBManifest.load(handle.path)
+            handle.kb_folder = manifest.kb_folder
+            handle.dup_of = {
+                fpath: manifest.dup_of(fpath)
+                for fpath in manifest.entries
+                if manifest.dup_of(fpath)
+            }
+        return handle
+
+    def _scope_aliases(
+        self, handle: IndexHandle, scope: Scope
+    ) -> Tuple[List[str], Any]:
+        """Scope.aliases() against the handle's manifest, cached on the handle."""
+        if not scope.files:
+            return [], frozenset()
+        if scope not in handle.scope_aliases:
+            self._scope_manifest(handle)
+            if len(handle.scope_aliases) >= 256:
+                handle.scope_aliases.clear()
+            handle.scope_aliases[scope] = scope.aliases(
+                handle.dup_of, handle.kb_folder
+            )
+        return handle.scope_aliases[scope]
+
+    def _acquire_index(self) -> IndexHandle:
+        with self._handles_lock:
+            if self._handle is None:
+                gen_id = self.generations.active_id()
+                if gen_id is None:
+                    self._handle = IndexHandle(None, "", None)
                 else:
-                    try:
-                        os.remove(path)
-                    except IsADirectoryError:
-                        shutil.rmtree(path, ignore_errors=True)
-            except Exception as e:
-                print(f"[persist clear] Skipped {path}: {e}")
+                    path = self.generations.path_for(gen_id)
+                    manifest = KBManifest.load(path)
+                    self._check_embedding_tag(manifest)
+                    layers = self.generations.layers(gen_id)
+                    paths = self._layer_paths(layers)
+                    # an overlay's lower layers still have deleted chunks
+                    live = None
+                    if len(layers) > 1:
+                        live = set(self._manifest_ids(manifest))
+                    hidden = self.generations.hidden_rows(gen_id)
+                    lexical = None
+                    if self.retrieval_mode == "hybrid":
+                        from .lexical import LexicalIndex
+
+                        lexical = LexicalIndex.load_layers(paths, live)
+                    self._handle = IndexHandle(
+                        gen_id,
+                        path,
+                        self._layered_store(paths, live=live, hidden=hidden),
+                        lexical,
+                    )
+                    self._handle.layers = layers
+                    self._handle.live = live
+                    self._handle.hidden = hidden
+                    if self.vector_engine != "chroma":
+                        self._handle.flat = self._load_flat(paths, live)
+            handle = self._handle
+            handle.refs += 1
+            return handle
+
+    def _release_index(self, handle: IndexHandle) -> None:
+        with self._handles_lock:
+            handle.refs -= 1
+            if handle.retired and handle.refs == 0:
+                self._close_index(handle)
+
+    def _close_index(self, handle: IndexHandle) -> None:
+        # caller holds _handles_lock; the active path's client is shared with
+        # the new handle, so only switched-away generations are released
+        self._draining.remove(handle)
+        if handle.flat is not None:
+            handle.flat.close()
+        if handle.vectorstore is not None:
+            active = self.generations.active_id()
+            in_use = set(self.generations.layers(active)) if active else set()
+            for gen_id in handle.layers:
+                if gen_id not in in_use:
+                    release_chroma_client(self.generations.path_for(gen_id))
+
+    def _load_flat(self, paths: List[str], live: Optional[set] = None) -> Any:
+        from .flat_index import FlatIndex, LayeredFlatIndex
+
+        quantized = self.vector_engine == "int8"
+        if len(paths) == 1:
+            flat = FlatIndex.load(paths[0], quantized=quantized)
+        else:
+            flat = LayeredFlatIndex.load(paths, live or set(), quantized=quantized)
+        if flat is None:
+            print(
+                f"[flat] No {self.vector_engine} index in {paths[0]} yet; searching "
+                "Chroma until the next index build"
+            )
+        return flat
+
+    def _sync_with_active(self) -> None:
+        """Lazily reload if another process switched the active generation."""
+        now = time.monotonic()
+        if now < self._next_marker_check:
+            return
+        self._next_marker_check = now + self.reload_check_seconds
+        if self.generations.marker() != self._seen_marker:
+            print("[generations] Active index changed in another process; reloading")
+            self.reload()
+
+    @contextmanager
+    def _using_index(self) -> Iterator[IndexHandle]:
+        """The active generation's handle, pinned until the block exits."""
+        handle = self._acquire_index()
+        try:
+            yield handle
+        finally:
+            self._release_index(handle)
 
     def build_vectorstore_from_folder(
-        self, kb_folder: str, reset: bool = False
-    ) -> None:
+        self,
+        kb_folder: str,
+        reset: bool = False,
+        workers: Optional[int] = None,
+        on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Incrementally sync the vector store with the PDFs in kb_folder.
+
+        Only new or changed files are parsed and embedded (files the page
+        cache has are only split); chunks of removed files are deleted. When
+        the splitter settings changed since the last build every file is split
+        again. Returns a report of what changed.
+        `workers` overrides the parser process count for this call.
+        `on_progress(event, data)` receives a "plan" event with files_total,
+        then one "file" event (file, chunks, error) per indexed file.
+        Chunks are embedded and upserted INDEX_BATCH_SIZE at a time and
+        progress is checkpointed, so an interrupted build resumes (see
+        app/indexing.py).
+        Changes are written to a new generation (empty with `reset`, else an
+        overlay on the active one, see generations.py) that only becomes
+        active once it is complete.
+        Only one process sharing PERSIST_DIR builds at a time; the others
+        wait, reporting a "waiting" event first.
+        """
+        notify = on_progress or (lambda event, data: None)
         if not os.path.isdir(kb_folder):
             raise FileNotFoundError(f"Knowledge base folder not found: {kb_folder}")
 
-        if reset:
-            self._safe_clear_persist_dir()
+        with self.generations.build_lock(on_wait=lambda: notify("waiting", {})):
+            return self._build_generation(kb_folder, reset, workers, notify)
 
-        all_chunks: List[Document] = []
+    def _build_generation(
+        self,
+        kb_folder: str,
+        reset: bool,
+        workers: Optional[int],
+        notify: Callable[[str, Dict[str, Any]], None],
+    ) -> Dict[str, Any]:
+        active = self.generations.active_id()
+        base_copy = None
+        if reset or active is None:
+            gen_id = self.generations.create()  # or resumes an unfinished rebuild
+            manifest = KBManifest.load(self.generations.path_for(gen_id))
+        else:
+            gen_id = active
+            manifest = KBManifest.load(self.generations.path_for(active))
+            self._check_embedding_tag(manifest)
+            if self._collections_moved(manifest, kb_folder):
+                # files would change collection: their chunks are in the wrong
+                # Chroma collections, so start over in a new generation
+                print(f"[index] Collections moved (KB folder {kb_folder}): rebuilding")
+                gen_id = self.generations.create()
+                manifest = KBManifest.load(self.generations.path_for(gen_id))
+            elif (
+                manifest.diff(kb_folder, self.chunking.tag()).has_changes
+                and not self.index_in_place
+            ):
+                # a new layer on the active generation, or a copy of it (all
+                # layers folded into one); resumes an interrupted update of the
+                # same base
+                if self._should_fold(active):
+                    gen_id = self._fold(active)
+                else:
+                    gen_id = self.generations.create(
+                        base=active, overlay=self.index_max_layers > 1
+                    )
+                base_copy = self.generations.last_copy
+                manifest = KBManifest.load(self.generations.path_for(gen_id))
+        gen_path = self.generations.path_for(gen_id)
+        paths = self._layer_paths(self.generations.layers(gen_id))
 
-        for root, _, files in os.walk(kb_folder):
-            for fname in files:
-                if fname.lower().endswith(".pdf"):
-                    fpath = os.path.join(root, fname)
-                    chunks = self._load_and_split_pdf(fpath)
-                    for i, ch in enumerate(chunks):
-                        base_id = f"{fpath}::{i}::{uuid.uuid5(uuid.NAMESPACE_URL, ch.page_content[:200])}"
-                        ch.metadata["doc_id"] = base_id
-                    all_chunks.extend(chunks)
+        if manifest.entries:
+            self._check_embedding_tag(manifest)
+        manifest.embedding = self.embedding_tag
+        chunking = self.chunking.tag()
+        plan = manifest.diff(kb_folder, chunking)
+        # different splitter settings: every file is split again
+        rechunk = bool(manifest.entries) and manifest.chunking not in (None, chunking)
+        manifest.chunking = chunking
+        manifest.kb_folder = kb_folder
+        # files whose duplicate chunks point at chunks deleted by this plan
+        orphaned = manifest.reindex_orphans(plan)
 
-        if not all_chunks:
+        if not plan.fingerprints and not manifest.entries:
             raise ValueError("No PDF content found to index.")
 
-        ids = [ch.metadata.get("doc_id", str(uuid.uuid4())) for ch in all_chunks]
+        report: Dict[str, Any] = {
+            "added": [p for p in plan.added if p not in plan.resume],
+            "resumed": list(plan.resume),
+            "updated": plan.updated,
+            "removed": plan.removed,
+            "unchanged": len(plan.unchanged),
+            "chunks_added": 0,
+            "chunks_removed": 0,
+            "chunks_deduplicated": 0,
+            "errors": [],
+            "generation": gen_id,
+            "layers": len(paths),
+            "rechunked": rechunk,
+            "reindexed_duplicates": orphaned,
+            # bytes linked / reflinked / copied from the base generation
+            "base_copy": base_copy,
+        }
+        notify("plan", {"files_total": len(plan.to_embed)})
+        self.embeddings  # opens the embedding cache so the report can diff it
+        cache_before = self.embedding_cache_stats()
+        pages_before = self.page_cache.stats() if self.page_cache else None
 
-        _ = Chroma.from_documents(
-            documents=all_chunks,
-            ids=ids,
-            embedding=self.embeddings,
-            persist_directory=self.persist_directory,
-        )
+        for fpath in plan.unchanged:
+            manifest.touch(fpath, plan.fingerprints[fpath])
+
+        dedup: Optional[DedupIndex] = None
+        # stored chunks whose duplicate_sources/pages changed (flat sidecar)
+        dup_changed: set = set()
+        stores: Dict[str, LayeredStore] = {}
+        try:
+            if plan.has_changes:
+                dedup = self._apply_plan(
+                    paths, manifest, plan, report, workers, notify, stores, dup_changed
+                )
+        finally:
+            # chunks this build deleted or copied up are hidden rows of the
+            # lower layers from now on (searches over-fetch by that many)
+            hidden = sum(store.new_hidden for store in stores.values())
+            if hidden:
+                self.generations.record_hidden(
+                    gen_id, self.generations.hidden_rows(gen_id) + hidden
+                )
+
+        manifest.save()
+        with metrics.stage("index_lexical"):
+            report["lexical"] = self._sync_lexical(paths, manifest)
+        if self.dedup_threshold > 0:
+            with metrics.stage("index_dedup"):
+                report["dedup"] = self._sync_dedup(paths, manifest, report, dedup)
+        if self.vector_engine != "chroma":
+            with metrics.stage("index_flat"):
+                report["flat"] = self._sync_flat(paths, manifest, dup_changed)
+        if gen_id != active or plan.has_changes:
+            # (an in-place update republishes the same id, so workers reload)
+            self.generations.activate(gen_id)
+
+        cache_after = self.embedding_cache_stats()
+        if cache_before and cache_after:
+            report["embedding_cache"] = {
+                "hits": cache_after["hits"] - cache_before["hits"],
+                "misses": cache_after["misses"] - cache_before["misses"],
+                "entries": cache_after["entries"],
+            }
+        if self.page_cache and pages_before:
+            # drop pages of files that left the knowledge base, then cap the size
+            digests = (entry["sha256"] for entry in manifest.entries.values())
+            pruned = self.page_cache.prune(digests)
+            report["page_cache"] = {
+                "hits": self.page_cache.hits - pages_before["hits"],
+                "misses": self.page_cache.misses - pages_before["misses"],
+                **pruned,
+                **self.page_cache.size_report(),
+            }
 
         # Reset cache so future queries use the new index
         self.reload()
+        self.collect_generations(lock_held=True)
+        return report
+
+    def _apply_plan(
+        self,
+        paths: List[str],
+        manifest: KBManifest,
+        plan: IndexPlan,
+        report: Dict[str, Any],
+        workers: Optional[int],
+        notify: Callable[[str, Dict[str, Any]], None],
+        stores: Dict[str, LayeredStore],
+        dup_changed: set,
+    ) -> Optional[DedupIndex]:
+        """Delete what the plan replaces and index what it adds into the
+        generation's top layer (paths top first). Opens its collections in
+        `stores` and collects chunks whose duplicate metadata changed in
+        `dup_changed`; returns the near-duplicate index it used."""
+        kb_folder = manifest.kb_folder
+
+        def store_for(fpath: str) -> LayeredStore:
+            collection = collection_of(fpath, kb_folder)
+            if collection not in stores:
+                stores[collection] = self._layered_store(paths, collection, create=True)
+            return stores[collection]
+
+        stores[DEFAULT_COLLECTION] = vectorstore = self._layered_store(
+            paths, create=True
+        )
+
+        stale: set = set()
+        for fpath in plan.updated + plan.removed:
+            stale_ids = manifest.doc_ids(fpath)
+            if stale_ids:
+                with metrics.stage("index_delete"):
+                    store_for(fpath).delete(ids=stale_ids)
+                report["chunks_removed"] += len(stale_ids)
+                stale.update(stale_ids)
+            dup_of = manifest.dup_of(fpath)
+            if dup_of:
+                with metrics.stage("index_delete"):
+                    dup_changed.update(
+                        remove_duplicates(store_for(fpath), list(dup_of.values()), fpath)
+                    )
+        for fpath in plan.removed:
+            manifest.remove(fpath)
+
+        dedup: Optional[DedupIndex] = None
+        if self.dedup_threshold > 0:
+            with metrics.stage("index_dedup"):
+                stored = [i for i in self._manifest_ids(manifest) if i not in stale]
+                dedup = self._load_dedup(paths, kb_folder, set(stored))
+                dedup.sync(stored, self._text_fetcher(paths, kb_folder))
+
+        parsed = self._iter_split_files(
+            plan.to_embed,
+            workers or self.index_workers,
+            max_inflight=self.index_max_inflight,
+            chunking=self.chunking,
+            page_cache=self.page_cache,
+            digests={p: plan.fingerprints[p]["sha256"] for p in plan.to_embed},
+        )
+        indexer = StreamingIndexer(
+            vectorstore,
+            manifest,
+            plan,
+            report,
+            batch_size=self.index_batch_size,
+            notify=notify,
+            store_for=store_for,
+            dedup=dedup,
+        )
+        try:
+            indexer.run(parsed)
+        finally:
+            dup_changed.update(indexer.duplicates_changed)
+        return dedup
+
+    def _sync_lexical(self, paths: List[str], manifest: KBManifest) -> Dict[str, int]:
+        """Bring the BM25 index of the generation's top layer (paths top
+        first) in line with the chunks it stores. Texts of new chunks are read
+        back from Chroma, so nothing is parsed again."""
+        from .lexical import LexicalIndex
+
+        lexical = LexicalIndex.load(paths[0])
+        is_new = lexical is None
+        lexical = lexical or LexicalIndex()
+        result = lexical.sync(
+            self._own_ids(paths, manifest),
+            self._text_fetcher(paths, manifest.kb_folder),
+        )
+        if is_new or result["added"] or result["removed"]:
+            lexical.save(paths[0])
+        return result
+
+    def _load_dedup(
+        self, paths: List[str], kb_folder: Optional[str], live: set
+    ) -> DedupIndex:
+        return DedupIndex.load_layers(
+            paths, live, self.dedup_threshold, kb_folder
+        ) or DedupIndex(threshold=self.dedup_threshold, kb_folder=kb_folder)
+
+    def _sync_dedup(
+        self,
+        paths: List[str],
+        manifest: KBManifest,
+        report: Dict[str, Any],
+        dedup: Optional[DedupIndex] = None,
+    ) -> Dict[str, Any]:
+        """Bring the generation's near-duplicate index (`dedup`: the one this
+        build used, else the saved one) in line with the manifest, save the
+        top layer's rows and report what deduplication saved."""
+        stored = self._manifest_ids(manifest)
+        dedup = dedup or self._load_dedup(paths, manifest.kb_folder, set(stored))
+        dedup.sync(stored, self._text_fetcher(paths, manifest.kb_folder))
+        own = set(self._own_ids(paths, manifest)) if len(paths) > 1 else None
+        dedup.save(paths[0], only=own)
+        aliases = sum(len(manifest.dup_of(fpath)) for fpath in manifest.entries)
+        return {
+            # chunks of this build that were not embedded or stored
+            "embeddings_saved": report["chunks_deduplicated"],
+            "stored_chunks": len(stored),
+            "duplicate_chunks": aliases,
+            "index_reduction": aliases / (len(stored) + aliases) if aliases else 0.0,
+        }
+
+    def _sync_flat(
+        self, paths: List[str], manifest: KBManifest, refresh: Iterable[str] = ()
+    ) -> Dict[str, int]:
+        """Bring the flat vector index of the generation's top layer in line
+        with the chunks it stores, from the vectors stored in Chroma (see
+        app/flat_index.py); rows of `refresh` are read again (their metadata
+        changed)."""
+        from .flat_index import FlatIndex
+
+        return FlatIndex.sync(
+            paths[0],
+            self._own_ids(paths, manifest),
+            self._chunk_fetcher(
+                paths, ["embeddings", "documents", "metadatas"], manifest.kb_folder
+            ),
+            quantized=self.vector_engine == "int8",
+            refresh=refresh,
+        )
+
+    def _own_ids(self, paths: List[str], manifest: KBManifest) -> List[str]:
+        """The manifest's chunks stored in the top layer's own Chroma store:
+        all of them unless the generation is an overlay."""
+        ids = self._manifest_ids(manifest)
+        if len(paths) == 1:
+            return ids
+        client = self._make_store(paths[0])._client
+        stored: set = set()
+        for c in client.list_collections():
+            collection = client.get_collection(getattr(c, "name", c))
+            stored.update(collection.get(include=[])["ids"])
+        return [i for i in ids if i in stored]
+
+    def _should_fold(self, active: str) -> bool:
+        """Whether an update of the active overlay chain should fold it into
+        one generation rather than stack another layer on it."""
+        layers = self.generations.layers(active)
+        return len(layers) > 1 and (
+            len(layers) >= self.index_max_layers
+            or self.generations.hidden_rows(active) > self.index_max_hidden
+        )
+
+    def _fold(self, active: str) -> str:
+        """A copy of the bottom generation of the active chain with the layers
+        above it applied (chunks not in the active manifest deleted, the
+        topmost copy of every other one written), and its BM25, flat and
+        dedup indexes synced: a single-layer generation to build the update
+        in. An interrupted fold is finished when the build resumes it."""
+        layers = self.generations.layers(active)
+        gen_id = self.generations.create(base=layers[-1])
+        if self.generations.is_folded(gen_id):
+            return gen_id
+        gen_path = self.generations.path_for(gen_id)
+        manifest = KBManifest.load(self.generations.path_for(active))
+        live = set(self._manifest_ids(manifest))
+        upper = self._layer_paths(layers[:-1])
+        collections = {DEFAULT_COLLECTION} | {
+            collection_of(fpath, manifest.kb_folder) for fpath in manifest.entries
+        }
+        written: set = set()
+        with metrics.stage("index_fold"):
+            for collection in sorted(collections):
+                target = self._make_store(gen_path, collection)._collection
+                taken: set = set()
+                for path in upper:
+                    layer = self._layered_store([path], collection)
+                    if layer is None:
+                        continue
+                    got = layer.top._collection.get(
+                        include=["embeddings", "documents", "metadatas"]
+                    )
+                    rows = [
+                        j
+                        for j, doc_id in enumerate(got["ids"])
+                        if doc_id in live and doc_id not in taken
+                    ]
+                    taken.update(got["ids"])
+                    for start in range(0, len(rows), self.index_batch_size):
+                        batch = rows[start : start + self.index_batch_size]
+                        target.upsert(
+                            ids=[got["ids"][j] for j in batch],
+                            embeddings=[got["embeddings"][j] for j in batch],
+                            documents=[got["documents"][j] for j in batch],
+                            metadatas=[got["metadatas"][j] for j in batch],
+                        )
+                    written.update(got["ids"][j] for j in rows)
+                dead = [i for i in target.get(include=[])["ids"] if i not in live]
+                for start in range(0, len(dead), 5000):
+                    target.delete(ids=dead[start : start + 5000])
+            manifest.path = os.path.join(gen_path, MANIFEST_FILE)
+            manifest.save()
+            paths = [gen_path]
+            self._sync_lexical(paths, manifest)
+            if self.dedup_threshold > 0:
+                self._sync_dedup(paths, manifest, {"chunks_deduplicated": 0})
+            if self.vector_engine != "chroma":
+                # rows copied up in a layer changed metadata since the base
+                self._sync_flat(paths, manifest, refresh=written)
+        self.generations.mark_folded(gen_id)
+        print(f"[index] Folded {len(layers)} layers into generation {gen_id}")
+        return gen_id
 
-    def rebuild_knowledge_base(self, kb_folder: str) -> None:
-        """Force rebuild (clear safely, then re-index)."""
-        self._safe_clear_persist_dir()
-        self.build_vectorstore_from_folder(kb_folder=kb_folder, reset=False)
+    def _text_fetcher(
+        self, paths: List[str], kb_folder: Optional[str]
+    ) -> Callable[[List[str]], Dict[str, str]]:
+        """fetch(doc_ids) -> {doc_id: chunk text}, read back from Chroma."""
+        fetch = self._chunk_fetcher(paths, ["documents"], kb_folder)
+
+        def fetch_texts(doc_ids: List[str]) -> Dict[str, str]:
+            got = fetch(doc_ids)
+            return dict(zip(got["ids"], got["documents"]))
+
+        return fetch_texts
+
+    @staticmethod
+    def _collections_moved(manifest: KBManifest, kb_folder: str) -> bool:
+        """Whether indexing from kb_folder puts some already indexed file in
+        another collection than the manifest's generation has it in."""
+        return any(
+            collection_of(fpath, manifest.kb_folder) != collection_of(fpath, kb_folder)
+            for fpath in manifest.entries
+        )
+
+    @staticmethod
+    def _manifest_ids(manifest: KBManifest) -> List[str]:
+        return [i for fpath in manifest.entries for i in manifest.doc_ids(fpath)]
+
+    def _chunk_fetcher(
+        self, paths: List[str], include: List[str], kb_folder: Optional[str]
+    ) -> Callable[[List[str]], Dict[str, List[Any]]]:
+        """fetch(doc_ids) -> Chroma get() result merged over the collections
+        the ids belong to (in no particular order), each chunk from the
+        topmost of the generation's layers (paths top first) that has it."""
+        stores: Dict[str, Optional[LayeredStore]] = {}
+
+        def fetch(doc_ids: List[str]) -> Dict[str, List[Any]]:
+            by_collection: Dict[str, List[str]] = {}
+            for doc_id in doc_ids:
+                collection = collection_of(doc_id.rsplit("::", 2)[0], kb_folder)
+                by_collection.setdefault(collection, []).append(doc_id)
+            out: Dict[str, List[Any]] = {key: [] for key in ["ids"] + include}
+            for collection, ids in by_collection.items():
+                if collection not in stores:
+                    stores[collection] = self._layered_store(paths, collection)
+                if stores[collection] is None:
+                    continue
+                got = stores[collection].get(ids, include=include)
+                for key in out:
+                    out[key].extend(got[key])
+            return out
+
+        return fetch
+
+    def rebuild_knowledge_base(
+        self,
+        kb_folder: str,
+        workers: Optional[int] = None,
+        on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Force rebuild into a new generation; the current index keeps serving
+        queries until the new one is complete and switched in."""
+        return self.build_vectorstore_from_folder(
+            kb_folder=kb_folder, reset=True, workers=workers, on_progress=on_progress
+        )
 
     # -------------------------------
-    # Retriever Setup
+    # Generations
     # -------------------------------
-    def _ensure_retriever(self, k: int = 6) -> BaseRetriever:
-        if self._vectorstore is None:
-            self._vectorstore = Chroma(
-                embedding_function=self.embeddings,
-                persist_directory=self.persist_directory,
-            )
-        if self._retriever is None:
-            self._retriever = self._vectorstore.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": k},
+    def list_generations(self) -> List[Dict[str, Any]]:
+        with self._handles_lock:
+            refs: Dict[str, int] = {}
+            for h in self._draining + ([self._handle] if self._handle else []):
+                if h.gen_id is not None:
+                    refs[h.gen_id] = refs.get(h.gen_id, 0) + h.refs
+        return self.generations.describe(refs)
+
+    def list_collections(self) -> Dict[str, Dict[str, int]]:
+        """Files and chunks per collection in the active generation."""
+        gen_id = self.generations.active_id()
+        if gen_id is None:
+            return {}
+        manifest = KBManifest.load(self.generations.path_for(gen_id))
+        out: Dict[str, Dict[str, int]] = {}
+        for fpath in manifest.entries:
+            collection = collection_of(fpath, manifest.kb_folder)
+            counts = out.setdefault(collection, {"files": 0, "chunks": 0})
+            counts["files"] += 1
+            counts["chunks"] += len(manifest.doc_ids(fpath))
+        return out
+
+    def activate_generation(self, gen_id: str) -> None:
+        """Switch queries to an existing, completely built generation (rollback)."""
+        if not self.generations.exists(gen_id) or self.generations.is_building(gen_id):
+            raise ValueError(f"No complete index generation '{gen_id}'")
+        self._check_embedding_tag(KBManifest.load(self.generations.path_for(gen_id)))
+        self.generations.activate(gen_id)
+        self.reload()
+        self.collect_generations()
+
+    def collect_generations(self, lock_held: bool = False) -> List[str]:
+        """Delete old generations past the grace period that nothing is querying
+        (unfinished builds only when no build is running; see GenerationStore.gc)."""
+        with self._handles_lock:
+            in_use = {h.gen_id for h in self._draining if h.gen_id is not None}
+        deleted = self.generations.gc(in_use, lock_held=lock_held)
+        if deleted:
+            print(f"[generations] Deleted {', '.join(deleted)}")
+        return deleted
+
+    # -------------------------------
+    # Retrieval
+    # -------------------------------
+    def _retrieve_with_vector(
+        self, question: str, k: int, scope: Optional[Scope] = None
+    ) -> Tuple[List[Document], List[float]]:
+        return self._retrieve_many([question], k, scope)[0]
+
+    def _retrieve_many(
+        self, questions: List[str], k: int, scope: Optional[Scope] = None
+    ) -> List[Tuple[List[Document], List[float]]]:
+        """(docs, query vector) per question. Questions not in the retrieval
+        cache are embedded in one call and searched in one store query."""
+        scope = scope or Scope()
+        self._sync_with_active()
+        keys = [RetrievalCache.key(self.generation, q, k, scope) for q in questions]
+        results = [self.retrieval_cache.get(key) for key in keys]
+        todo = [i for i, hit in enumerate(results) if hit is None]
+        if todo:
+            with metrics.profiled("retrieve"), metrics.stage("retrieve"):
+                with self._using_index() as handle:
+                    found = self._search_many(
+                        handle, [questions[i] for i in todo], k, scope
+                    )
+                # stored sources reference chunks by (generation, doc_id)
+                for docs, _ in found:
+                    for d in docs:
+                        d.metadata["generation"] = handle.gen_id
+            for i, hit in zip(todo, found):
+                results[i] = hit
+                self.retrieval_cache.put(keys[i], hit)
+        return results
+
+    def _search_many(
+        self, handle: IndexHandle, questions: List[str], k: int, scope: Scope
+    ) -> List[Tuple[List[Document], List[float]]]:
+        """Documents for each question plus its query vector ([] when the
+        lexical fast path answered, or the scope has no store to search,
+        without embedding the question)."""
+        vectorstore = self._store_for(handle, scope)
+        if vectorstore is None:  # nothing indexed in the scope's collection
+            return [([], []) for _ in questions]
+        lexical = handle.lexical
+        rows = None
+        if lexical is not None:
+            rows = self._rows_in_scope(handle, lexical, handle.lexical_masks, scope)
+        # chunk texts come from the flat index's sidecar when there is one
+        doc_source = handle.flat or vectorstore
+        results: List[Any] = [None] * len(questions)
+        hits: Dict[int, List[Tuple[str, float]]] = {}
+        for i, question in enumerate(questions):
+            hits[i] = []
+            if lexical is not None:
+                with metrics.stage("lexical"):
+                    hits[i] = lexical.search(question, k, rows)
+            if self._lexical_is_decisive(hits[i]):
+                self.retrieval_counts["lexical_fast_path"] += 1
+                doc_ids = [doc_id for doc_id, _ in hits[i]]
+                with metrics.stage("fuse"):
+                    results[i] = (self._docs_by_id(doc_source, doc_ids), [])
+
+        todo = [i for i, r in enumerate(results) if r is None]
+        if not todo:
+            return results
+        with metrics.stage("embed_query"):
+            if len(todo) == 1:
+                vectors = [self.embeddings.embed_query(questions[todo[0]])]
+            else:
+                vectors = embed_queries(self.embeddings, [questions[i] for i in todo])
+        with metrics.stage("vector_search"):
+            if handle.flat is not None:
+                flat_rows = self._rows_in_scope(
+                    handle, handle.flat, handle.flat_masks, scope
+                )
+                dense_lists = [
+                    self._docs_by_id(handle.flat, [doc_id for doc_id, _ in hits])
+                    for hits in handle.flat.search_many(
+                        vectors, k, flat_rows, self.flat_rescore
+                    )
+                ]
+            else:
+                alias_paths, _ = self._scope_aliases(handle, scope)
+                # straight similarity search rather than a shared retriever
+                # object whose search_kwargs would race between concurrent
+                # requests with different k
+                dense_lists = vectorstore.search_many(
+                    vectors, k, scope.where(alias_paths)
+                )
+
+        for i, vector, dense in zip(todo, vectors, dense_lists):
+            if lexical is None:
+                self.retrieval_counts["vector"] += 1
+                results[i] = (dense, vector)
+            else:
+                self.retrieval_counts["hybrid"] += 1
+                with metrics.stage("fuse"):
+                    results[i] = (self._fuse(doc_source, dense, hits[i], k), vector)
+        return results
+
+    def _fuse(
+        self,
+        vectorstore: Any,
+        dense: List[Document],
+        hits: List[Tuple[str, float]],
+        k: int,
+    ) -> List[Document]:
+        from .lexical import reciprocal_rank_fusion
+
+        by_id = {d.metadata.get("doc_id"): d for d in dense}
+        fused = reciprocal_rank_fusion(
+            [[d.metadata.get("doc_id") for d in dense], [doc_id for doc_id, _ in hits]]
+        )[:k]
+        missing = [doc_id for doc_id in fused if doc_id not in by_id]
+        if missing:
+            by_id.update(
+                (d.metadata["doc_id"], d) for d in self._docs_by_id(vectorstore, missing)
             )
-        else:
-            # keep retriever but allow k to change between calls
-            self._retriever.search_kwargs["k"] = k
-        return self._retriever
+        return [by_id[doc_id] for doc_id in fused if doc_id in by_id]
+
+    def _lexical_is_decisive(self, hits: List[Tuple[str, float]]) -> bool:
+        # the best keyword match beats the runner-up by lexical_fast_path_ratio;
+        # a lone hit proves nothing (one rare word can match a single chunk)
+        # and would leave the answer with one chunk, so dense search decides
+        if len(hits) < 2 or self.lexical_fast_path_ratio <= 0:
+            return False
+        return hits[0][1] >= self.lexical_fast_path_ratio * hits[1][1]
+
+    @staticmethod
+    def _docs_by_id(vectorstore: Any, doc_ids: List[str]) -> List[Document]:
+        """Chunks by id, in the given order (no embedding involved), from a
+        Chroma store or a FlatIndex."""
+        from langchain_core.documents import Document
+
+        got = vectorstore.get(ids=doc_ids, include=["documents", "metadatas"])
+        found = {
+            doc_id: Document(page_content=text, metadata=meta or {})
+            for doc_id, text, meta in zip(got["ids"], got["documents"], got["metadatas"])
+        }
+        return [found[doc_id] for doc_id in doc_ids if doc_id in found]
+
+    def retrieve(
+        self, question: str, k: int = 6, scope: Optional[Scope] = None
+    ) -> List[Document]:
+        return self._retrieve_with_vector(question, k, scope)[0]
+
+    async def _run_blocking(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """fn(*args) on the chat pool, in a copy of the caller's context (so
+        per-request stage timings are recorded for the calling request)."""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(ctx.run, fn, *args)
+        )
+
+    async def aretrieve_with_vector(
+        self, question: str, k: int = 6, scope: Optional[Scope] = None
+    ) -> Tuple[List[Document], List[float]]:
+        """Concurrent calls for the same question share one retrieval."""
+        return await self.coalesce(
+            "retrieve",
+            (question, k, scope or Scope()),
+            lambda: self._run_blocking(self._retrieve_with_vector, question, k, scope),
+        )
+
+    async def coalesce(
+        self, kind: str, key: Tuple[Any, ...], factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """await factory(), unless a call with the same kind and key is
+        already running against the current index generation: then share its
+        result. Coalescing ratios per kind are in coalescing_stats()."""
+        return await self.flights.run(kind, (self.generation,) + key, factory)
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        return {"in_flight": self.flights.in_flight(), **self.flights.stats()}
+
+    async def aretrieve(
+        self, question: str, k: int = 6, scope: Optional[Scope] = None
+    ) -> List[Document]:
+        return (await self.aretrieve_with_vector(question, k, scope))[0]
+
+    async def aretrieve_many(
+        self, questions: List[str], k: int = 6, scope: Optional[Scope] = None
+    ) -> List[Tuple[List[Document], List[float]]]:
+        return await self._run_blocking(self._retrieve_many, questions, k, scope)
 
     # -------------------------------
     # Prompt & Formatting
@@ -208,7 +1347,11 @@ class EnhancedPDFRAGChatbot:
         return "\n\n".join(parts)
 
     def _chat_prompt(self) -> ChatPromptTemplate:
-        return ChatPromptTemplate.from_template(
+        if self._prompt is not None:
+            return self._prompt
+        from langchain.prompts import ChatPromptTemplate
+
+        self._prompt = ChatPromptTemplate.from_template(
             (
                 "You are a helpful assistant that strictly answers from the provided context.\n"
                 "If the answer is not in the context, say you don't know. Cite sources.\n\n"
@@ -220,36 +1363,44 @@ class EnhancedPDFRAGChatbot:
                 "- Do not fabricate information.\n"
             )
         )
+        return self._prompt
 
     # -------------------------------
     # Chat
     # -------------------------------
-    def chat(
-        self,
-        question: str,
-        k: int = 6,
-        structured: bool = False,
-    ) -> Tuple[str, List[Dict[str, Any]]]:
-        retriever = self._ensure_retriever(k=k)
+    def _answer_chain(self, docs: List[Document], structured: bool):
+        from langchain_core.runnables import RunnablePassthrough
 
-        docs = retriever.get_relevant_documents(question)
         context = self._format_docs(docs)
-
-        prompt = self._chat_prompt()
         chain = {
             "context": lambda _: context,
             "question": RunnablePassthrough(),
-        } | prompt
+        } | self._chat_prompt()
+        if structured:
+            return chain | self._structured()
+        return chain | self.llm
+
+    def pack_context(
+        self, docs: List[Document]
+    ) -> Tuple[List[Document], Dict[str, int]]:
+        """Retrieved docs -> the docs to prompt with, plus a packing report."""
+        with metrics.stage("context_pack"):
+            packed, report = pack_context(
+                docs, self.context_token_budget, self.context_dup_threshold
+            )
+        self.context_totals["requests"] += 1
+        self.context_totals["tokens_before"] += report["tokens_before"]
+        self.context_totals["tokens_after"] += report["tokens_after"]
+        return packed, report
 
+    @staticmethod
+    def _answer_text(result: Any, structured: bool) -> str:
         if structured:
-            chain = chain | self.llm.with_structured_output(AnswerWithSources)
-            result: AnswerWithSources = chain.invoke(question)
-            answer_text = result.answer
-        else:
-            chain = chain | self.llm
-            result = chain.invoke(question)
-            answer_text = getattr(result, "content", str(result))
+            return result.answer
+        return getattr(result, "content", str(result))
 
+    @staticmethod
+    def sources_from_docs(docs: List[Document]) -> List[Dict[str, Any]]:
         source_list: List[Dict[str, Any]] = []
         for d in docs:
             source_list.append(
@@ -257,14 +1408,352 @@ class EnhancedPDFRAGChatbot:
                     "file_name": d.metadata.get("file_name"),
                     "source": d.metadata.get("source"),
                     "snippet": d.page_content[:500],
+                    "doc_id": d.metadata.get("doc_id"),
+                    "generation": d.metadata.get("generation"),
                 }
             )
+        return source_list
+
+    def answer(self, question: str, docs: List[Document], structured: bool = False) -> str:
+        with metrics.profiled("answer"), metrics.stage("llm"):
+            result = self._answer_chain(docs, structured).invoke(question)
+        return self._answer_text(result, structured)
+
+    def _llm_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._llm_slots_by_loop.get(loop)
+        if slots is None:
+            slots = asyncio.Semaphore(self.llm_concurrency)
+            self._llm_slots_by_loop[loop] = slots
+        return slots
+
+    async def aanswer(
+        self, question: str, docs: List[Document], structured: bool = False
+    ) -> str:
+        """Async LLM call; at most `llm_concurrency` of these are in flight."""
+        async with self._llm_slots():
+            with metrics.stage("llm"):
+                result = await self._answer_chain(docs, structured).ainvoke(question)
+        return self._answer_text(result, structured)
+
+    async def astream_answer(
+        self, question: str, docs: List[Document], structured: bool = False
+    ) -> AsyncIterator[str]:
+        """Yield answer text deltas as the LLM produces them.
+
+        Closing the iterator (e.g. the client went away) closes the upstream
+        stream, which cancels the in-flight LLM request. Structured answers
+        can't be streamed meaningfully and arrive as a single delta.
+        """
+        async with self._llm_slots():
+            if structured:
+                with metrics.stage("llm"):
+                    result = await self._answer_chain(docs, True).ainvoke(question)
+                yield self._answer_text(result, True)
+                return
+            chain = self._answer_chain(docs, False)
+            async with aclosing(chain.astream(question)) as stream:
+                # (includes the time the client takes to consume each delta)
+                with metrics.stage("llm_stream"):
+                    async for chunk in stream:
+                        text = getattr(chunk, "content", chunk)
+                        if text:
+                            yield text
+
+    # -------------------------------
+    # Semantic answer cache
+    # -------------------------------
+    def lookup_answer(
+        self,
+        query_vector: List[float],
+        k: int,
+        structured: bool,
+        scope: Optional[Scope] = None,
+    ) -> Optional[str]:
+        """Cached answer for a semantically equivalent question, if any.
+
+        Only meaningful for questions asked without chat history, since the
+        cached answer was generated from the bare question.
+        """
+        if not query_vector:  # lexical fast path: nothing to compare
+            return None
+        return self.answer_cache.get(
+            self.generation, k, structured, query_vector, scope or Scope()
+        )
+
+    def remember_answer(
+        self,
+        query_vector: List[float],
+        k: int,
+        structured: bool,
+        answer_text: str,
+        scope: Optional[Scope] = None,
+    ) -> None:
+        if query_vector:
+            self.answer_cache.put(
+                self.generation,
+                k,
+                structured,
+                query_vector,
+                answer_text,
+                scope or Scope(),
+            )
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "retrieval": self.retrieval_cache.stats(),
+            "answer": self.answer_cache.stats(),
+            "embedding": self.embedding_cache_stats(),
+            "pages": self.page_cache.stats() if self.page_cache else None,
+        }
+
+    def retrieval_stats(self) -> Dict[str, Any]:
+        counts = dict(self.retrieval_counts)
+        total = sum(counts.values())
+        ctx = dict(self.context_totals)
+        ctx["tokens_saved"] = ctx["tokens_before"] - ctx["tokens_after"]
+        return {
+            "mode": self.retrieval_mode,
+            "counts": counts,
+            "lexical_fast_path_rate": (
+                counts["lexical_fast_path"] / total if total else 0.0
+            ),
+            "context": ctx,
+        }
+
+    def chat(
+        self,
+        question: str,
+        k: int = 6,
+        structured: bool = False,
+        scope: Optional[Scope] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        docs, vector = self._retrieve_with_vector(question, k, scope)
+        answer_text = self.lookup_answer(vector, k, structured, scope)
+        if answer_text is None:
+            context_docs, _ = self.pack_context(docs)
+            answer_text = self.answer(question, context_docs, structured=structured)
+            self.remember_answer(vector, k, structured, answer_text, scope)
+        return answer_text, self.sources_from_docs(docs)
+
+    async def achat(
+        self,
+        question: str,
+        k: int = 6,
+        structured: bool = False,
+        prompt_question: Optional[str] = None,
+        scope: Optional[Scope] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Non-blocking chat. Retrieval uses `question`; the LLM is asked
+        `prompt_question` (e.g. the question enriched with chat history).
+        Identical concurrent calls share one retrieval and one LLM call."""
+        docs, vector = await self.aretrieve_with_vector(question, k, scope)
+        answer_text, _ = await self.aanswer_for(
+            question, docs, vector, k, structured, prompt_question, scope
+        )
+        return answer_text, self.sources_from_docs(docs)
+
+    async def aanswer_for(
+        self,
+        question: str,
+        docs: List[Document],
+        query_vector: List[float],
+        k: int = 6,
+        structured: bool = False,
+        prompt_question: Optional[str] = None,
+        scope: Optional[Scope] = None,
+    ) -> Tuple[str, Optional[Dict[str, int]]]:
+        """(answer, context packing report) for docs retrieved for `question`:
+        from the semantic answer cache if the LLM is asked the bare question,
+        else one (coalesced) LLM call. The report is None for cached answers."""
+        cacheable = prompt_question in (None, question)
+        if cacheable:
+            answer_text = self.lookup_answer(query_vector, k, structured, scope)
+            if answer_text is not None:
+                return answer_text, None
+
+        async def generate() -> Tuple[str, Dict[str, int]]:
+            context_docs, packing = self.pack_context(docs)
+            answer_text = await self.aanswer(
+                prompt_question or question, context_docs, structured=structured
+            )
+            if cacheable:
+                self.remember_answer(query_vector, k, structured, answer_text, scope)
+            return answer_text, packing
+
+        # docs are determined by (generation, question, k, scope) and the
+        # prompt contains the question, so equal keys mean equal answers
+        key = (prompt_question or question, question, k, structured, scope or Scope())
+        return await self.coalesce("answer", key, generate)
+
+    # -------------------------------
+    # Batch chat
+    # -------------------------------
+    @staticmethod
+    async def _with_retries(
+        call: Callable[[], Awaitable[Any]], max_retries: int, base_delay: float = 0.5
+    ) -> Any:
+        """await call(), retrying failures with exponential backoff and jitter."""
+        for attempt in itertools.count():
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= max_retries:
+                    raise
+                delay = base_delay * 2**attempt * (0.5 + random.random())
+                print(f"[batch] {type(e).__name__}: {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def achat_batch(
+        self,
+        questions: List[str],
+        k: int = 6,
+        structured: bool = False,
+        concurrency: int = 8,
+        max_retries: int = 3,
+        retrieval_batch: int = 256,
+        scope: Optional[Scope] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer many independent questions, yielding each result as soon as
+        it is ready (not in input order; results carry their "index").
+
+        Questions are retrieved `retrieval_batch` at a time (one embedding
+        call and one store query per batch) and answered with at most
+        `concurrency` LLM calls of this batch in flight, on top of the global
+        llm_concurrency cap. A question whose retrieval or LLM call still
+        fails after `max_retries` retries comes back with "error" set.
+        """
+        slots = asyncio.Semaphore(max(1, concurrency))
+
+        def empty_result(index: int, question: str) -> Dict[str, Any]:
+            return {
+                "index": index,
+                "question": question,
+                "answer": None,
+                "sources": [],
+                "context": None,
+                "cached": False,
+                "error": None,
+            }
+
+        async def answer_one(
+            index: int, question: str, docs: List[Document], vector: List[float]
+        ) -> Dict[str, Any]:
+            result = empty_result(index, question)
+            result["sources"] = self.sources_from_docs(docs)
+            try:
+                answer_text = self.lookup_answer(vector, k, structured, scope)
+                result["cached"] = answer_text is not None
+                if answer_text is None:
+                    context_docs, result["context"] = self.pack_context(docs)
+                    async with slots:
+                        answer_text = await self._with_retries(
+                            lambda: self.aanswer(question, context_docs, structured),
+                            max_retries,
+                        )
+                    self.remember_answer(vector, k, structured, answer_text, scope)
+                result["answer"] = answer_text
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            return result
+
+        pending: set = set()
+        try:
+            for start in range(0, len(questions), max(1, retrieval_batch)):
+                chunk = questions[start : start + max(1, retrieval_batch)]
+                try:
+                    found = await self._with_retries(
+                        lambda: self.aretrieve_many(chunk, k, scope), max_retries
+                    )
+                except Exception as e:
+                    for i, question in enumerate(chunk, start):
+                        result = empty_result(i, question)
+                        result["error"] = f"{type(e).__name__}: {e}"
+                        yield result
+                    continue
+                for i, (docs, vector) in enumerate(found, start):
+                    task = answer_one(i, questions[i], docs, vector)
+                    pending.add(asyncio.create_task(task))
+                # hand back what finished while this chunk was being retrieved
+                for task in [t for t in pending if t.done()]:
+                    pending.discard(task)
+                    yield task.result()
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def chat_batch(
+        self, questions: List[str], k: int = 6, structured: bool = False, **kwargs: Any
+    ) -> List[Dict[str, Any]]:
+        """Blocking achat_batch (for scripts, not from inside an event loop);
+        results are returned in input order."""
+
+        async def collect() -> List[Dict[str, Any]]:
+            batch = self.achat_batch(questions, k, structured, **kwargs)
+            async with aclosing(batch) as results:
+                return [r async for r in results]
+
+        return sorted(asyncio.run(collect()), key=lambda r: r["index"])
+
+    def warm_up(self, probe: str = "warm-up") -> Dict[str, Any]:
+        """Do the first query's one-time work ahead of it: import and open the
+        embedding client and the active store, load its HNSW segment with a
+        probe search, and build the prompt and LLM chains.
+
+        Returns per-step timings (ms) and the errors of steps that failed;
+        a failed step just leaves that work to the first request.
+        """
+        timings: Dict[str, float] = {}
+        errors: Dict[str, str] = {}
+        vector: List[float] = []
+
+        def step(name: str, fn: Callable[[], Any]) -> None:
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                errors[name] = f"{type(e).__name__}: {e}"
+                print(f"[warm-up] {name} failed: {errors[name]}")
+            timings[name] = round((time.perf_counter() - t0) * 1000, 1)
 
-        return answer_text, source_list
+        def search() -> None:
+            with self._using_index() as handle:
+                if handle.flat is not None and vector:
+                    handle.flat.search_many([vector], 1)  # pages in the vectors
+                elif handle.vectorstore is not None and vector:
+                    handle.vectorstore.search_many([vector], 1)
+                if handle.lexical is not None:
+                    handle.lexical.search(probe, 1)  # builds the BM25 weights
+
+        step("embeddings", lambda: vector.extend(self.embeddings.embed_query(probe)))
+        step("vectorstore", search)
+        step("chains", lambda: [self._answer_chain([], st) for st in (False, True)])
+        return {"ms": timings, "errors": errors}
 
     def reload(self) -> None:
-        self._vectorstore = None
-        self._retriever = None
+        """Retire the store handle and start a new cache generation.
+
+        Queries already holding the old handle finish on it; the next query
+        opens whichever generation is active now.
+        """
+        with self._handles_lock:
+            self._seen_marker = self.generations.marker()
+            old, self._handle = self._handle, None
+            if old is not None:
+                old.retired = True
+                self._draining.append(old)
+                if old.refs == 0:
+                    self._close_index(old)
+        self.generation += 1
+        self.retrieval_cache.clear()
+        self.answer_cache.clear()
 
     # -------------------------------
     # Optional helper
@@ -0,0 +1,156 @@
+"""
+One Chroma collection across the layers of an overlay generation.
+
+A layer is one generation's own Chroma store (see generations.py); the stack
+is ordered top first. Writes only go to the top layer: adds and deletes
+directly, while a metadata update of a chunk that lives in a lower layer
+first copies it up (with its stored embedding, nothing is embedded again).
+A read takes each chunk from the topmost layer that has it, and with `live`
+(the chunk ids the generation's manifest lists) only counts those.
+
+Deleted and replaced chunks are not removed from lower layers: they are
+hidden rows, which a search has to skip. Every layer is therefore asked for
+k plus the number of hidden rows, which leaves at least k candidates per
+query once they are filtered out; hits of all layers are merged by distance.
+A single-layer store is queried exactly like a plain Chroma collection.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:  # heavy; imported where it's used
+    from langchain_core.documents import Document
+
+
+class LayeredStore:
+    def __init__(
+        self, layers: List[Any], live: Optional[Set[str]] = None, hidden: int = 0
+    ) -> None:
+        self.layers = layers  # LangChain Chroma stores, top (writable) first
+        self.live = live  # None: every stored row counts (single layer)
+        self.hidden = hidden
+        # rows this store hid in lower layers (added to the generation's
+        # LAYERS count at the end of a build), and ids deleted meanwhile,
+        # which reads must not find in lower layers any more
+        self.new_hidden = 0
+        self._deleted: Set[str] = set()
+        self._shadows: Optional[List[Set[str]]] = None
+
+    @property
+    def top(self) -> Any:
+        return self.layers[0]
+
+    # -------------------------------
+    # Writes (top layer only)
+    # -------------------------------
+    def add_documents(self, docs: List[Document], ids: List[str]) -> None:
+        self.top.add_documents(docs, ids=ids)
+        self._deleted.difference_update(ids)
+
+    def delete(self, ids: List[str]) -> None:
+        self.top.delete(ids=ids)
+        if len(self.layers) > 1:
+            self.new_hidden += len(ids)
+            self._deleted.update(ids)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of stored chunks (None values delete keys)."""
+        in_top = set(self.top.get(ids=list(ids), include=[])["ids"]) if ids else set()
+        own = [(i, m) for i, m in zip(ids, metadatas) if i in in_top]
+        if own:
+            self.top._collection.update(
+                ids=[i for i, _ in own], metadatas=[m for _, m in own]
+            )
+        lower = {i: m for i, m in zip(ids, metadatas) if i not in in_top}
+        if lower:
+            got = self.get(list(lower), include=["embeddings", "documents"])
+            if got["ids"]:
+                self.top._collection.upsert(
+                    ids=got["ids"],
+                    embeddings=got["embeddings"],
+                    documents=got["documents"],
+                    metadatas=[lower[i] for i in got["ids"]],
+                )
+                self.new_hidden += len(got["ids"])
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    def get(self, ids: Iterable[str], include: Iterable[str] = ()) -> Dict[str, Any]:
+        """Same shape as Chroma's collection.get, for the given ids."""
+        include = list(include)
+        out: Dict[str, List[Any]] = {key: [] for key in ["ids"] + include}
+        todo = list(ids)
+        for depth, layer in enumerate(self.layers):
+            if depth == 1:
+                todo = [i for i in todo if i not in self._deleted]
+            if not todo:
+                break
+            got = layer.get(ids=todo, include=include)
+            for key in out:
+                out[key].extend(got[key])
+            found = set(got["ids"])
+            todo = [i for i in todo if i not in found]
+        return out
+
+    def _shadowed(self) -> List[Set[str]]:
+        """Per layer, the ids stored in the layers above it."""
+        if self._shadows is None:
+            above: Set[str] = set()
+            self._shadows = []
+            for layer in self.layers:
+                self._shadows.append(set(above))
+                if layer is not self.layers[-1]:
+                    above.update(layer.get(include=[])["ids"])
+        return self._shadows
+
+    def search_many(
+        self,
+        vectors: List[List[float]],
+        k: int,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Document]]:
+        """Nearest k chunks per query vector, best first."""
+        from langchain_core.documents import Document
+
+        if len(self.layers) == 1 and self.live is None:
+            if len(vectors) == 1:
+                top = self.top.similarity_search_by_vector(vectors[0], k=k, filter=where)
+                return [top]
+            # the LangChain wrapper has no multi-query search; Chroma does
+            got = self.top._collection.query(
+                query_embeddings=vectors,
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas"],
+            )
+            return [
+                [Document(page_content=t, metadata=m or {}) for t, m in zip(texts, metas)]
+                for texts, metas in zip(got["documents"], got["metadatas"])
+            ]
+
+        hits: List[List[Any]] = [[] for _ in vectors]
+        for layer, shadowed in zip(self.layers, self._shadowed()):
+            got = layer._collection.query(
+                query_embeddings=vectors,
+                n_results=k + self.hidden,
+                where=where,
+                include=["documents", "metadatas", "distances"],
+            )
+            for found, ids, texts, metas, dists in zip(
+                hits, got["ids"], got["documents"], got["metadatas"], got["distances"]
+            ):
+                for doc_id, text, meta, dist in zip(ids, texts, metas, dists):
+                    if doc_id in shadowed or (
+                        self.live is not None and doc_id not in self.live
+                    ):
+                        continue
+                    found.append((dist, text, meta))
+        return [
+            [
+                Document(page_content=text, metadata=meta or {})
+                for _, text, meta in sorted(found, key=lambda h: h[0])[:k]
+            ]
+            for found in hits
+        ]
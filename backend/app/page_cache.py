@@ -0,0 +1,250 @@
+"""
+Persistent cache of the page text and metadata PyPDFLoader extracts from PDFs.
+
+Parsing is the slowest CPU step of indexing, and its output only depends on
+the file's bytes and the parser, not on how pages are split into chunks.
+Pages are therefore cached under PERSIST_DIR/page_cache, one gzipped JSONL
+file per PDF:
+
+    <sha256 of the PDF>.jsonl.gz
+        {"parser": "pypdf-6.0.0/1", "pages": 12, "chars": 48213}   header
+        {"text": "...", "metadata": {"page": 0, ...}}               one per page
+
+so rebuilding, or re-chunking with new splitter settings, only splits and
+embeds (and the embedding cache covers chunks whose text didn't change).
+
+Invalidation:
+- the key is the content hash: an edited PDF misses, a renamed or moved one
+  hits (its source/file_name metadata are filled in from the current path)
+- entries written by another pypdf version (or cache format) are misses,
+  and are overwritten when the file is parsed again
+- unreadable entries are misses and are deleted
+- after every build, entries of PDFs that are no longer in the knowledge base
+  are deleted, then the least recently used ones until the cache fits
+  PAGE_CACHE_MAX_MB
+"""
+
+import os
+import gzip
+import json
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+PAGE_CACHE_DIR = "page_cache"
+_FORMAT = 1
+_SUFFIX = ".jsonl.gz"
+# (text, metadata without source/file_name) per page
+Pages = List[Tuple[str, Dict[str, Any]]]
+
+_parser_tag: Optional[str] = None
+
+
+def parser_tag() -> str:
+    """Version of the parser the cached text came from."""
+    global _parser_tag
+    if _parser_tag is None:
+        from importlib.metadata import PackageNotFoundError, version
+
+        try:
+            _parser_tag = f"pypdf-{version('pypdf')}/{_FORMAT}"
+        except PackageNotFoundError:
+            _parser_tag = f"pypdf-unknown/{_FORMAT}"
+    return _parser_tag
+
+
+class PageCache:
+    """Directory of per-PDF page files with hit/miss counters.
+
+    Entries are written to a temp file and renamed into place, so parser
+    processes can fill the cache concurrently and readers never see a
+    partial entry. Instances are cheap to pickle (only paths and counters)
+    and are handed to the parser pool as-is.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes  # 0 = no size limit
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}{_SUFFIX}")
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # -------------------------------
+    # Entries
+    # -------------------------------
+    def get(self, digest: str) -> Optional[Pages]:
+        path = self._path(digest)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fh:
+                header = json.loads(fh.readline())
+                if header.get("parser") != parser_tag():
+                    self._count(False)
+                    return None
+                pages = []
+                for line in fh:
+                    item = json.loads(line)
+                    pages.append((item["text"], item["metadata"]))
+        except FileNotFoundError:
+            self._count(False)
+            return None
+        except (OSError, ValueError, KeyError, EOFError) as e:
+            print(f"[page_cache] Dropping unreadable entry {path}: {e}")
+            self._remove(path)
+            self._count(False)
+            return None
+        if len(pages) != header.get("pages"):
+            self._remove(path)
+            self._count(False)
+            return None
+        self._count(True)
+        try:
+            os.utime(path)  # recency for LRU eviction
+        except OSError:
+            pass
+        return pages
+
+    def put(self, digest: str, pages: Pages) -> None:
+        path = self._path(digest)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        header = {
+            "parser": parser_tag(),
+            "pages": len(pages),
+            "chars": sum(len(text) for text, _ in pages),
+        }
+        try:
+            # level 6: most of level 9's size at a fraction of the time
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as fh:
+                fh.write(json.dumps(header) + "\n")
+                for text, meta in pages:
+                    fh.write(json.dumps({"text": text, "metadata": meta}) + "\n")
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:  # (or unserializable metadata)
+            print(f"[page_cache] Could not write {path}: {e}")
+            self._remove(tmp)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self) -> List[Tuple[str, os.stat_result]]:
+        """(path, stat) of every entry."""
+        out = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    try:
+                        out.append((entry.path, entry.stat()))
+                    except OSError:
+                        pass
+        return out
+
+    # -------------------------------
+    # Invalidation
+    # -------------------------------
+    def prune(self, keep: Iterable[str]) -> Dict[str, int]:
+        """Delete entries of digests not in `keep`, then least recently used
+        entries until the cache fits max_bytes."""
+        keep = set(keep)
+        removed = freed = 0
+        kept = []
+        for path, st in self._entries():
+            digest = os.path.basename(path)[: -len(_SUFFIX)]
+            if digest in keep:
+                kept.append((path, st))
+            else:
+                self._remove(path)
+                removed += 1
+                freed += st.st_size
+        # stale temp files of writers that died mid-write
+        cutoff = time.time() - 3600
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime < cutoff:
+                    self._remove(entry.path)
+        total = sum(st.st_size for _, st in kept)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            for path, st in sorted(kept, key=lambda e: e[1].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= st.st_size
+                removed += 1
+                freed += st.st_size
+        return {"removed": removed, "bytes_freed": freed}
+
+    # -------------------------------
+    # Reporting
+    # -------------------------------
+    def stats(self) -> Dict[str, Any]:
+        """Counters and on-disk size (cheap: no entry is opened)."""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(st.st_size for _, st in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def size_report(self) -> Dict[str, Any]:
+        """What the cache holds, read from the entry headers."""
+        entries = self._entries()
+        size = sum(st.st_size for _, st in entries)
+        pages = chars = stale = 0
+        for path, _ in entries:
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as fh:
+                    header = json.loads(fh.readline())
+            except (OSError, ValueError, EOFError):
+                stale += 1
+                continue
+            if header.get("parser") != parser_tag():
+                stale += 1
+            pages += header.get("pages", 0)
+            chars += header.get("chars", 0)
+        return {
+            "entries": len(entries),
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "pages": pages,
+            "text_chars": chars,
+            # other parser versions or unreadable: re-parsed when next needed
+            "stale_entries": stale,
+            # extracted characters per byte on disk
+            "compression_ratio": (chars / size) if size else 0.0,
+        }
+
+
+def open_page_cache(persist_directory: str, max_mb: float) -> Optional[PageCache]:
+    """Cache living in the persist dir (kept across rebuilds); None if disabled."""
+    if max_mb <= 0:
+        return None
+    return PageCache(
+        os.path.join(persist_directory, PAGE_CACHE_DIR), int(max_mb * 1024 * 1024)
+    )
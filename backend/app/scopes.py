@@ -0,0 +1,138 @@
+"""
+Scoped retrieval: named collections and per-file filters.
+
+PDFs under KB_FOLDER/collections/<name>/ are indexed into a Chroma collection
+of their own (in the same generation as everything else), which only
+questions scoped to that collection search; all other PDFs make up the
+"default" collection that unscoped questions search. A question can be
+narrowed further to some files of its collection, which becomes a Chroma
+`where` filter on the chunks' file_name. A chunk that was stored once for
+several files (near-duplicate dedup, see dedup.py) belongs to each of them:
+the filter also matches chunks whose duplicate_sources list a scoped file.
+
+The BM25 index covers the chunks of every collection; scoped keyword search
+masks it down to the rows of the scope (doc_ids start with the file path, so
+a chunk's collection and file are known without a lookup). Collections are
+taken from the path relative to the KB folder the generation was built from,
+which its manifest records.
+"""
+
+import os
+import re
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+
+COLLECTIONS_DIR = "collections"
+DEFAULT_COLLECTION = "default"
+# Chroma collection names: LangChain's default for the default collection, so
+# stores built before collections existed are the default collection as-is
+_CHROMA_DEFAULT = "langchain"
+_CHROMA_PREFIX = "kb-"
+_NAME = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,58}[A-Za-z0-9])?$")
+
+
+def validate_collection_name(name: str) -> str:
+    if not _NAME.match(name or ""):
+        raise ValueError(
+            f"Invalid collection name {name!r}: use 1-60 letters, digits, '-' or '_'"
+        )
+    return name
+
+
+def collection_of(fpath: str, kb_folder: Optional[str]) -> str:
+    """Collection of an indexed file: <name> for
+    <kb_folder>/collections/<name>/.../<file>, else the default collection.
+
+    kb_folder None is a generation built before manifests recorded it: those
+    were split by the last three parts of the path, which queries against
+    them have to keep doing."""
+    if kb_folder is None:
+        parts = os.path.normpath(fpath).split(os.sep)
+        if len(parts) >= 3 and parts[-3] == COLLECTIONS_DIR and _NAME.match(parts[-2]):
+            return parts[-2]
+        return DEFAULT_COLLECTION
+    parts = os.path.relpath(fpath, kb_folder).split(os.sep)
+    if len(parts) >= 3 and parts[0] == COLLECTIONS_DIR and _NAME.match(parts[1]):
+        return parts[1]
+    return DEFAULT_COLLECTION
+
+
+def chroma_name(collection: str) -> str:
+    if collection == DEFAULT_COLLECTION:
+        return _CHROMA_DEFAULT
+    return f"{_CHROMA_PREFIX}{collection}"
+
+
+def collection_dir(kb_folder: str, collection: str) -> str:
+    """Where uploads to `collection` go."""
+    if collection == DEFAULT_COLLECTION:
+        return kb_folder
+    name = validate_collection_name(collection)
+    return os.path.join(kb_folder, COLLECTIONS_DIR, name)
+
+
+class Scope(NamedTuple):
+    """What a question searches: one collection, optionally only some files."""
+
+    collection: str = DEFAULT_COLLECTION
+    files: Tuple[str, ...] = ()
+
+    @classmethod
+    def of(cls, collection: Optional[str] = None, files: Any = None) -> "Scope":
+        """Validated, normalized scope (so equal scopes hash equal in caches)."""
+        name = DEFAULT_COLLECTION
+        if collection:
+            name = validate_collection_name(collection)
+        return cls(name, tuple(sorted({os.path.basename(f) for f in files or ()})))
+
+    def where(self, alias_sources: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+        """Chroma filter; alias_sources are the paths of the scoped files that
+        have duplicate chunks stored for another file."""
+        if not self.files:
+            return None
+        if len(self.files) == 1:
+            by_name: Dict[str, Any] = {"file_name": self.files[0]}
+        else:
+            by_name = {"file_name": {"$in": list(self.files)}}
+        aliases = [{"duplicate_sources": {"$contains": p}} for p in alias_sources]
+        return {"$or": [by_name] + aliases} if aliases else by_name
+
+    def contains(
+        self,
+        doc_id: str,
+        kb_folder: Optional[str],
+        aliased: AbstractSet[str] = frozenset(),
+    ) -> bool:
+        """Whether the chunk is in scope; `aliased` are stored chunks that
+        duplicate chunks of the scoped files."""
+        fpath = doc_id.rsplit("::", 2)[0]
+        if collection_of(fpath, kb_folder) != self.collection:
+            return False
+        if not self.files or os.path.basename(fpath) in self.files:
+            return True
+        return doc_id in aliased
+
+    def aliases(
+        self, dup_of: Dict[str, Dict[str, str]], kb_folder: Optional[str]
+    ) -> Tuple[List[str], FrozenSet[str]]:
+        """(paths of scoped files with duplicates, stored chunks they alias),
+        from the manifest's {fpath: {doc_id: stored doc_id}}."""
+        if not self.files:
+            return [], frozenset()
+        paths = sorted(
+            fpath
+            for fpath in dup_of
+            if os.path.basename(fpath) in self.files
+            and collection_of(fpath, kb_folder) == self.collection
+        )
+        return paths, frozenset(i for p in paths for i in dup_of[p].values())
@@ -0,0 +1,12 @@
+"""
+Cheap token estimates for prompt budgeting.
+
+Gemini doesn't expose a local tokenizer; ~4 characters per token is close
+enough for English text to size context windows without a network call.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
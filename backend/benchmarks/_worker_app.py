@@ -0,0 +1,17 @@
+"""
+The real FastAPI app with fake embeddings and a fake, sleeping LLM, for
+bench_workers. Each uvicorn worker imports this module on its own.
+"""
+
+import os
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.main import app, bot  # noqa: F401
+from benchmarks.bench_chat_concurrency import _SlowFakeLLM
+
+
+bot._embeddings = DeterministicFakeEmbedding(size=64)
+bot.llm = _SlowFakeLLM(
+    responses=["ok"], delay=float(os.getenv("BENCH_LLM_DELAY", "0.2"))
+)
@@ -0,0 +1,109 @@
+"""
+Chat latency vs concurrency: blocking `chat` on the event loop vs `achat`.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_concurrency --llm-delay 0.2 --levels 1 4 16 64
+
+Uses fake embeddings and a fake chat model that sleeps --llm-delay seconds,
+so it measures the serving path (event loop, thread pool, LLM semaphore),
+not Gemini. The sample knowledge base is indexed into a temp dir first.
+Every level runs in its own event loop, like /chat/batch batches do, so the
+per-loop LLM semaphore is exercised; --llm-concurrency below the highest
+level makes it queue calls (default: no limit below the highest level).
+"""
+
+import time
+import asyncio
+import argparse
+import itertools
+import tempfile
+import statistics
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.ml_service import EnhancedPDFRAGChatbot
+
+
+class _SlowFakeLLM(FakeListChatModel):
+    """Sleeps like a network call: blocking in invoke, non-blocking in ainvoke."""
+
+    delay: float = 0.2
+
+    def _call(self, *args, **kwargs) -> str:
+        time.sleep(self.delay)
+        return "ok"
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+_asked = itertools.count()
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _one(bot, mode: str, arrived: float) -> float:
+    # a different question every time: identical concurrent chats would share
+    # one LLM call (and retrieval), which is not what this measures
+    question = f"What projects has Saugat built? (#{next(_asked)})"
+    if mode == "blocking":
+        # what /chat used to do: a sync call straight on the event loop
+        bot.chat(question, k=4)
+    else:
+        await bot.achat(question, k=4)
+    return time.perf_counter() - arrived
+
+
+async def _level(bot, mode: str, concurrency: int, rounds: int):
+    # all requests of a round arrive together; latency counts queueing time too
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(rounds):
+        arrived = time.perf_counter()
+        latencies += await asyncio.gather(
+            *[_one(bot, mode, arrived) for _ in range(concurrency)]
+        )
+    return latencies, time.perf_counter() - start
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", default="data/knowledge_base")
+    ap.add_argument("--llm-delay", type=float, default=0.2)
+    ap.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--llm-concurrency", type=int, default=0)
+    args = ap.parse_args()
+
+    bot = EnhancedPDFRAGChatbot(
+        persist_directory=tempfile.mkdtemp(prefix="bench_chroma_"),
+        api_key="bench",
+        embedding_cache_size=0,
+        chat_threads=max(args.levels),
+        llm_concurrency=args.llm_concurrency or max(args.levels),
+    )
+    bot._embeddings = DeterministicFakeEmbedding(size=64)
+    bot.llm = _SlowFakeLLM(responses=["ok"], delay=args.llm_delay)
+    bot.build_vectorstore_from_folder(args.folder)
+
+    for mode in ("blocking", "async"):
+        for level in args.levels:
+            lat, took = asyncio.run(_level(bot, mode, level, args.rounds))
+            print(
+                f"{mode:<8} c={level:<3} {len(lat) / took:7.1f} chats/s "
+                f"p50={statistics.median(lat) * 1000:8.1f}ms "
+                f"p95={_percentile(lat, 95) * 1000:8.1f}ms "
+                f"p99={_percentile(lat, 99) * 1000:8.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
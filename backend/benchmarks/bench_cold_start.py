@@ -0,0 +1,100 @@
+"""
+Cold start: `import app.main` time and first-query latency, with and without
+the startup warm-up.
+
+Usage (from backend/):
+    python -m benchmarks.bench_cold_start --runs 3
+
+Every measurement runs in a fresh interpreter. The sample knowledge base is
+indexed into a temp PERSIST_DIR first; fake embeddings keep the numbers about
+imports and opening the store rather than the embedding API. "first query" is
+retrieval plus building the answer chain, i.e. everything before the LLM call.
+"readyz" is the time from the start of the import until /readyz answers 200
+with the warm-up on (app startup in a TestClient); init_mongo is replaced so
+it runs without MongoDB, and a real deployment adds the time to connect.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.ml_service import EnhancedPDFRAGChatbot
+
+
+_CHILD = """
+import sys, time, json
+t0 = time.perf_counter()
+import app.main as m
+imported = time.perf_counter() - t0
+from langchain_community.embeddings import DeterministicFakeEmbedding
+m.bot._embeddings = DeterministicFakeEmbedding(size=64)
+if sys.argv[1] == "readyz":
+    from fastapi.testclient import TestClient
+
+    async def init_mongo():
+        return object()
+
+    m.init_mongo = init_mongo
+    with TestClient(m.app) as client:
+        while client.get("/readyz").status_code != 200:
+            time.sleep(0.005)
+        ready = time.perf_counter() - t0
+    print(json.dumps({"import": imported, "readyz": ready}))
+    sys.exit(0)
+warm = 0.0
+if sys.argv[1] == "warm":
+    t0 = time.perf_counter()
+    m.bot.warm_up()
+    warm = time.perf_counter() - t0
+t0 = time.perf_counter()
+m.bot.retrieve("What projects has Saugat built?", k=4)
+m.bot._answer_chain([], False)
+first = time.perf_counter() - t0
+print(json.dumps({"import": imported, "warm_up": warm, "first": first}))
+"""
+
+
+def _run(mode: str, env) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD, mode],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", default="data/knowledge_base")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    persist_dir = tempfile.mkdtemp(prefix="bench_chroma_")
+    bot = EnhancedPDFRAGChatbot(persist_directory=persist_dir, api_key="bench")
+    bot._embeddings = DeterministicFakeEmbedding(size=64)
+    bot.build_vectorstore_from_folder(args.folder)
+    env = dict(os.environ, PERSIST_DIR=persist_dir, KB_FOLDER=args.folder)
+
+    for mode in ("cold", "warm"):
+        runs = [_run(mode, env) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+        print(
+            f"{mode:<5} import={med['import']:7.0f}ms  warm-up={med['warm_up']:7.0f}ms  "
+            f"first query={med['first']:7.1f}ms"
+        )
+    env = dict(env, WARMUP="1", MIGRATE_INLINE_SOURCES="0")
+    runs = [_run("readyz", env) for _ in range(args.runs)]
+    med = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+    print(f"readyz import={med['import']:7.0f}ms  ready after {med['readyz']:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Embedding backend throughput: chunks/sec for indexing and per-query latency.
+
+Usage (from backend/):
+    python -m benchmarks.bench_embeddings --backends local google --batch-sizes 32 128
+
+The chunks come from the sample knowledge base, repeated with --repeat to
+give a stable workload. The "google" backend needs gem_api_key and network
+access, so it is skipped if the key isn't set. The "local" backend needs
+sentence-transformers and the model weights (downloaded on first use).
+"""
+
+import os
+import time
+import argparse
+import statistics
+
+from app.kb_manifest import iter_pdf_files
+from app.embeddings import DEFAULT_MODELS, make_embeddings
+from app.ml_service import EnhancedPDFRAGChatbot
+
+
+QUERIES = [
+    "What programming languages does Saugat know?",
+    "Where did Saugat study?",
+    "What projects involve machine learning?",
+    "What are Saugat's future goals?",
+]
+
+
+def _chunks(folder: str, repeat: int):
+    texts = []
+    for fpath in iter_pdf_files(folder):
+        texts += [d.page_content for d in EnhancedPDFRAGChatbot._load_and_split_pdf(fpath)]
+    # distinct strings so no layer below can dedupe them away
+    return [f"{t} [{n}]" for n in range(repeat) for t in texts]
+
+
+def _bench(backend: str, model: str, batch_size: int, texts, threads: int) -> None:
+    emb = make_embeddings(
+        backend,
+        model,
+        api_key=os.getenv("gem_api_key"),
+        batch_size=batch_size,
+        num_threads=threads,
+    )
+    emb.embed_query("warm-up")  # model load / connection setup
+
+    start = time.perf_counter()
+    emb.embed_documents(texts)
+    rate = len(texts) / (time.perf_counter() - start)
+
+    latencies = []
+    for q in QUERIES * 5:
+        t0 = time.perf_counter()
+        emb.embed_query(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    print(
+        f"{backend:<7} batch={batch_size:<4} {rate:9.1f} chunks/s  "
+        f"query p50={statistics.median(latencies):7.1f}ms max={max(latencies):7.1f}ms"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", default="data/knowledge_base")
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--backends", nargs="+", default=["local", "google"])
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 128])
+    ap.add_argument("--threads", type=int, default=0)
+    args = ap.parse_args()
+
+    texts = _chunks(args.folder, args.repeat)
+    print(f"{len(texts)} chunks")
+    for backend in args.backends:
+        if backend == "google" and not os.getenv("gem_api_key"):
+            print("google  skipped (gem_api_key not set)")
+            continue
+        for bs in args.batch_sizes:
+            _bench(backend, DEFAULT_MODELS[backend], bs, texts, args.threads)
+
+
+if __name__ == "__main__":
+    main()
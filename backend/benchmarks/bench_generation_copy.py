@@ -0,0 +1,113 @@
+"""
+Cost of copying the active generation, which an incremental update does when
+it folds an overlay chain or runs with INDEX_MAX_LAYERS < 2 (overlay updates
+are timed by bench_incremental_ingest).
+
+Usage (from backend/):
+    python -m benchmarks.bench_generation_copy --n 50000 --dim 384
+
+Builds a generation with n chunks (Chroma collection + flat index) under a
+temp dir, then times GenerationStore.create(base=...) (hard links for the
+files that are only replaced whole, reflink-or-copy for Chroma's) against a
+plain copy of every file.
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+from app.flat_index import FlatIndex
+from app.generations import GenerationStore, release_chroma_client
+from app.kb_manifest import MANIFEST_FILE
+
+
+def _du(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=50_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--dir", default=None, help="where to build (filesystem matters)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import chromadb
+
+    root = tempfile.mkdtemp(prefix="bench_gencopy_", dir=args.dir)
+    store = GenerationStore(root)
+    gen_id = store.create()
+    path = store.path_for(gen_id)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.n, args.dim)).astype(np.float32)
+    ids = [f"bench.pdf::{i}::x" for i in range(args.n)]
+    texts = [f"chunk {i} " + "lorem ipsum " * 100 for i in range(args.n)]
+
+    col = chromadb.PersistentClient(path=path).create_collection("langchain")
+    for start in range(0, args.n, 5000):
+        stop = start + 5000
+        col.add(
+            ids=ids[start:stop],
+            embeddings=vectors[start:stop].tolist(),
+            documents=texts[start:stop],
+        )
+
+    def fetch(batch):
+        rows = [int(doc_id.split("::")[1]) for doc_id in batch]
+        return {
+            "ids": batch,
+            "embeddings": vectors[rows],
+            "documents": [texts[r] for r in rows],
+            "metadatas": [{} for _ in rows],
+        }
+
+    FlatIndex.sync(path, ids, fetch)
+    with open(os.path.join(path, MANIFEST_FILE), "w") as fh:
+        fh.write("{}")
+    store.activate(gen_id)
+
+    del col
+    release_chroma_client(path)  # Chroma done writing before anything is timed
+
+    size = _du(path)
+    full_s, copied = float("inf"), None
+    for _ in range(args.repeat):
+        # each timing includes flushing what it wrote, so one doesn't pay for
+        # the other's dirty pages
+        os.sync()
+        t0 = time.perf_counter()
+        shutil.copytree(path, os.path.join(root, "full_copy"))
+        os.sync()
+        full_s = min(full_s, time.perf_counter() - t0)
+        shutil.rmtree(os.path.join(root, "full_copy"))
+
+        os.sync()
+        t0 = time.perf_counter()
+        new_id = store.create(base=gen_id)
+        os.sync()
+        took = time.perf_counter() - t0
+        if copied is None or took < copied["seconds"]:
+            copied = dict(store.last_copy, seconds=took)
+        shutil.rmtree(store.path_for(new_id))
+    print(f"n={args.n} dim={args.dim} generation {size / 1e6:.1f} MB in {root}")
+    print(f"full copy        {full_s:7.3f}s  {size / 1e6:8.1f} MB written")
+    print(
+        f"create(base)     {copied['seconds']:7.3f}s  "
+        f"{copied['copy'] / 1e6:8.1f} MB copied, "
+        f"{copied['reflink'] / 1e6:.1f} MB reflinked, "
+        f"{copied['link'] / 1e6:.1f} MB hard-linked"
+    )
+    print(f"in place         {0:7.3f}s  {0:8.1f} MB")
+    shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
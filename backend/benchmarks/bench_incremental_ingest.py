@@ -0,0 +1,196 @@
+"""
+Cost of a one-file incremental update as the corpus grows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_incremental_ingest --sizes 5000 50000
+
+For each size, builds an active generation of n synthetic chunks (Chroma
+collection, BM25 and dedup indexes, and a manifest over n / 50 placeholder
+files that the update leaves alone), then times build_vectorstore_from_folder
+after one real PDF was added to the folder: as an overlay on the active
+generation (the default) and with INDEX_MAX_LAYERS=0, which copies the active
+generation first like every update did before overlays. The update is rolled
+back between runs. Embeddings are DeterministicFakeEmbedding and the PDF's
+pages come from the page cache after a warm-up run, so what is timed is the
+indexing work around them. Works offline.
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.dedup import DedupIndex
+from app.flat_index import FlatIndex
+from app.generations import release_chroma_client
+from app.kb_manifest import KBManifest, file_sha256
+from app.lexical import LexicalIndex
+from app.ml_service import EnhancedPDFRAGChatbot
+from app.scopes import DEFAULT_COLLECTION, chroma_name
+
+_CHUNKS_PER_FILE = 50
+
+
+def _du(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def _make_bot(persist: str, args: argparse.Namespace, max_layers: int):
+    bot = EnhancedPDFRAGChatbot(
+        persist_directory=persist,
+        api_key="bench",
+        vector_engine=args.vector_engine,
+        generation_keep=100,  # runs roll back to the base generation
+        generation_grace_seconds=3600,
+        index_max_layers=max_layers,
+    )
+    bot._embeddings = DeterministicFakeEmbedding(size=args.dim)
+    return bot
+
+
+def _build_base(n: int, kb: str, persist: str, args: argparse.Namespace) -> str:
+    """An active generation with n chunks over placeholder files in kb."""
+    import chromadb
+
+    bot = _make_bot(persist, args, max_layers=8)
+    store = bot.generations
+    gen_id = store.create()
+    path = store.path_for(gen_id)
+    rng = np.random.default_rng(0)
+    words = [f"term{i}" for i in range(20_000)]
+    random.seed(0)
+
+    manifest = KBManifest.load(path)
+    manifest.embedding = bot.embedding_tag
+    manifest.chunking = bot.chunking.tag()
+    manifest.kb_folder = kb
+    ids, texts, metas = [], [], []
+    for f in range(n // _CHUNKS_PER_FILE):
+        fpath = os.path.join(kb, f"synthetic_{f:06d}.pdf")
+        with open(fpath, "wb") as fh:
+            fh.write(f"%PDF-1.4 placeholder {f}\n".encode())
+        st = os.stat(fpath)
+        file_ids = [f"{fpath}::{i}::synthetic" for i in range(_CHUNKS_PER_FILE)]
+        fingerprint = {
+            "sha256": file_sha256(fpath),
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+        }
+        manifest.record(fpath, fingerprint, file_ids)
+        for i, doc_id in enumerate(file_ids):
+            ids.append(doc_id)
+            texts.append(" ".join(random.choices(words, k=220)))
+            metas.append({"doc_id": doc_id, "source": fpath, "page": i // 5})
+    manifest.save()
+
+    vectors = rng.standard_normal((len(ids), args.dim)).astype(np.float32)
+    col = chromadb.PersistentClient(path=path).get_or_create_collection(
+        chroma_name(DEFAULT_COLLECTION)
+    )
+    for start in range(0, len(ids), 5000):
+        stop = start + 5000
+        col.add(
+            ids=ids[start:stop],
+            embeddings=vectors[start:stop].tolist(),
+            documents=texts[start:stop],
+            metadatas=metas[start:stop],
+        )
+    del col
+    release_chroma_client(path)
+
+    text_of = dict(zip(ids, texts))
+    lexical = LexicalIndex()
+    lexical.sync(ids, lambda batch: {d: text_of[d] for d in batch})
+    lexical.save(path)
+    # random signatures: no synthetic chunk is a near-duplicate of another
+    sigs = rng.integers(0, 2**32, size=(len(ids), 64), dtype=np.uint32)
+    DedupIndex(ids, sigs, kb_folder=kb).save(path)
+    if args.vector_engine != "chroma":
+        row_of = {doc_id: i for i, doc_id in enumerate(ids)}
+
+        def fetch(batch):
+            rows = [row_of[d] for d in batch]
+            return {
+                "ids": batch,
+                "embeddings": vectors[rows],
+                "documents": [texts[r] for r in rows],
+                "metadatas": [metas[r] for r in rows],
+            }
+
+        FlatIndex.sync(
+            path, ids, fetch, quantized=args.vector_engine == "int8"
+        )
+    store.activate(gen_id)
+    return gen_id
+
+
+def _run(bot, kb: str, pdf: str, base: str) -> dict:
+    """Index `pdf` as a new file of kb, then roll back to `base`."""
+    added = os.path.join(kb, "added.pdf")
+    shutil.copy(pdf, added)
+    os.sync()
+    t0 = time.perf_counter()
+    report = bot.build_vectorstore_from_folder(kb)
+    os.sync()
+    took = time.perf_counter() - t0
+    os.remove(added)
+    bot.activate_generation(base)
+    return dict(report, seconds=took)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[5_000, 50_000])
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument(
+        "--vector-engine", default="chroma", choices=["chroma", "flat", "int8"]
+    )
+    ap.add_argument("--pdf", default="data/knowledge_base/projects.pdf")
+    ap.add_argument("--dir", default=None, help="where to build (filesystem matters)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    rows = []
+    for n in args.sizes:
+        root = tempfile.mkdtemp(prefix="bench_ingest_", dir=args.dir)
+        kb, persist = os.path.join(root, "kb"), os.path.join(root, "persist")
+        os.makedirs(kb)
+        t0 = time.perf_counter()
+        base = _build_base(n, kb, persist, args)
+        size = _du(os.path.join(persist, "generations", base))
+        print(f"n={n}: base generation {size / 1e6:.0f} MB, built in "
+              f"{time.perf_counter() - t0:.0f}s")
+        overlay = _make_bot(persist, args, max_layers=8)
+        copy = _make_bot(persist, args, max_layers=0)
+        _run(overlay, kb, args.pdf, base)  # warm-up: parse into the page cache
+        best = {}
+        for _ in range(args.repeat):
+            for name, bot in (("overlay", overlay), ("copy", copy)):
+                got = _run(bot, kb, args.pdf, base)
+                if name not in best or got["seconds"] < best[name]["seconds"]:
+                    best[name] = got
+        for name, got in best.items():
+            written = got["base_copy"] or {}
+            rows.append((n, name, got, written))
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{'chunks':>8} {'update':>8} {'seconds':>8} {'layers':>6} "
+          f"{'copied MB':>10} {'linked MB':>10} {'chunks added':>12}")
+    for n, name, got, written in rows:
+        print(
+            f"{n:>8} {name:>8} {got['seconds']:>8.3f} {got['layers']:>6} "
+            f"{(written.get('copy', 0) + written.get('reflink', 0)) / 1e6:>10.1f} "
+            f"{written.get('link', 0) / 1e6:>10.1f} {got['chunks_added']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
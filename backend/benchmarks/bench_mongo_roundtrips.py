@@ -0,0 +1,82 @@
+"""
+Mongo round trips per chat turn: per-message writes vs save_turn.
+
+Usage (from backend/, needs a reachable mongod):
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_mongo_roundtrips --turns 50
+
+Counts the commands the driver sends (pymongo CommandListener) for the
+persistence part of a /chat turn.
+Uses a throwaway database that is dropped afterwards.
+"""
+
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import settings
+from app.db import mongo_repo as repo
+
+
+class _CommandCounter(monitoring.CommandListener):
+    def __init__(self) -> None:
+        self.commands: Counter = Counter()
+
+    def started(self, event) -> None:
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+
+async def _old_turn(db, session_id):
+    # the pre-batching sequence: save user, read history, save assistant
+    oid = await repo.get_or_create_session(db, session_id)
+    await repo.save_message(db, oid, "user", "question")
+    await repo.fetch_history_pairs(db, oid, 8)
+    await repo.save_message(db, oid, "assistant", "answer", [], question="question")
+
+
+async def _new_turn(db, session_id):
+    oid = await repo.get_or_create_session(db, session_id)
+    await repo.fetch_history_pairs(db, oid, 8)
+    await repo.save_turn(db, oid, "question", "answer", [])
+
+
+async def _measure(label, turn, db, counter, turns, session_key):
+    await turn(db, session_key)  # session creation isn't part of a steady-state turn
+    counter.commands.clear()
+    start = time.perf_counter()
+    for _ in range(turns):
+        await turn(db, session_key)
+    elapsed = time.perf_counter() - start
+    total = sum(counter.commands.values())
+    print(
+        f"{label:<24} {total / turns:5.2f} round trips/turn  "
+        f"{elapsed / turns * 1000:6.2f} ms/turn  {dict(counter.commands)}"
+    )
+
+
+async def main(turns: int) -> None:
+    counter = _CommandCounter()
+    client = AsyncIOMotorClient(settings.MONGO_URI, event_listeners=[counter])
+    db = client["bench_roundtrips"]
+    await repo.ensure_indexes(db)
+    try:
+        await _measure("per-message writes", _old_turn, db, counter, turns, "bench-old")
+        await _measure("save_turn", _new_turn, db, counter, turns, "bench-new")
+    finally:
+        await client.drop_database("bench_roundtrips")
+        client.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=50)
+    asyncio.run(main(ap.parse_args().turns))
@@ -0,0 +1,96 @@
+"""
+Serial vs process-pool PDF parsing/splitting throughput.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pdf_parsing --folder data/knowledge_base --repeat 20 --workers 1 2 4
+    python -m benchmarks.bench_pdf_parsing --page-cache --workers 1 4
+
+--repeat copies the folder's PDFs N times into a temp dir so small corpora
+give stable numbers. Nothing is embedded; this measures parse + split only.
+--page-cache runs every worker count twice against a fresh page cache: cold
+(parse + store pages) and warm (read pages + split, i.e. a re-chunk).
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+from app.kb_manifest import file_sha256, iter_pdf_files
+from app.ml_service import EnhancedPDFRAGChatbot
+from app.page_cache import PageCache
+
+
+def _make_corpus(folder: str, repeat: int) -> str:
+    tmp = tempfile.mkdtemp(prefix="bench_kb_")
+    for n in range(repeat):
+        for src in iter_pdf_files(folder):
+            dst = os.path.join(tmp, f"{n:04d}_{os.path.basename(src)}")
+            shutil.copy(src, dst)
+            # copies would share one page cache entry; make every file unique
+            with open(dst, "ab") as fh:
+                fh.write(f"\n% copy {n}\n".encode())
+    return tmp
+
+
+def _run(files, workers: int, page_cache=None, digests=None):
+    start = time.perf_counter()
+    chunks = 0
+    parsed = EnhancedPDFRAGChatbot._iter_split_files(
+        files, workers, page_cache=page_cache, digests=digests
+    )
+    for _, docs, _err in parsed:
+        chunks += sum(1 for _ in docs)
+    return time.perf_counter() - start, chunks
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", default="data/knowledge_base")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--page-cache", action="store_true")
+    args = ap.parse_args()
+
+    corpus = _make_corpus(args.folder, args.repeat)
+    try:
+        files = iter_pdf_files(corpus)
+        print(f"{len(files)} files, cpu_count={os.cpu_count()}")
+        if args.page_cache:
+            _compare_page_cache(files, args.workers)
+            return
+        baseline = None
+        for w in args.workers:
+            elapsed, chunks = _run(files, w)
+            rate = len(files) / elapsed
+            baseline = baseline or rate
+            print(
+                f"workers={w:<3} {elapsed:7.2f}s  {rate:8.1f} files/s  "
+                f"{chunks} chunks  x{rate / baseline:.2f}"
+            )
+    finally:
+        shutil.rmtree(corpus, ignore_errors=True)
+
+
+def _compare_page_cache(files, workers_list) -> None:
+    digests = {f: file_sha256(f) for f in files}
+    for w in workers_list:
+        cache_dir = tempfile.mkdtemp(prefix="bench_pages_")
+        try:
+            cache = PageCache(cache_dir)
+            cold, chunks = _run(files, w, cache, digests)
+            warm, _ = _run(files, w, cache, digests)
+            size = cache.size_report()
+            print(
+                f"workers={w:<3} cold {cold:7.2f}s  warm {warm:7.2f}s  "
+                f"x{cold / warm:.1f}  {chunks} chunks  "
+                f"cache {size['bytes'] / 1024:.0f}KiB for "
+                f"{size['text_chars'] / 1024:.0f}K chars"
+            )
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
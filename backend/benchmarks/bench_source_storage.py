@@ -0,0 +1,165 @@
+"""
+Storage of chat sources: snippets inline in every assistant message vs chunk
+references (mongo_repo: source_gen/source_ids + the deduplicated `chunks`
+collection).
+
+Usage (from backend/):
+    python -m benchmarks.bench_source_storage --turns 10000 --chunks 3000
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bench_source_storage --mongo
+
+Simulates --turns answered questions citing k chunks each, drawn with a Zipf
+popularity from a knowledge base of --chunks chunks, with --rebuilds index
+rebuilds spread over the turns (chunks cited again after a rebuild get the
+new generation added). Reports BSON bytes per layout, scaled to 10k turns.
+With --mongo both layouts are also written to a throwaway database (dropped
+afterwards) to report on-disk collection + index sizes and the time to read
+a 200-message page with its sources.
+"""
+
+import time
+import random
+import asyncio
+import argparse
+import datetime
+
+import bson
+from bson import ObjectId
+
+from app.db import mongo_repo as repo
+from app.indexing import chunk_id
+
+
+_WORDS = (
+    "model data training results project system learning network analysis "
+    "performance research method design experience team student university "
+    "application python deep image language evaluation baseline dataset"
+).split()
+
+
+def _corpus(n: int, rng: random.Random):
+    chunks = []
+    for i in range(n):
+        fname = f"doc_{i // 40:03d}.pdf"
+        path = f"/app/data/knowledge_base/{fname}"
+        text = " ".join(rng.choice(_WORDS) for _ in range(90))
+        chunks.append(
+            {
+                "file_name": fname,
+                "source": path,
+                "snippet": text[:500],
+                "doc_id": chunk_id(path, i % 40, text),
+            }
+        )
+    return chunks
+
+
+def _turns(args):
+    rng = random.Random(0)
+    chunks = _corpus(args.chunks, rng)
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(len(chunks))]
+    session = ObjectId()
+    start = datetime.datetime(2026, 1, 1)
+    gens = [
+        (start + datetime.timedelta(days=g)).strftime("%Y%m%dT%H%M%S%f") + "-1a2b3c"
+        for g in range(args.rebuilds + 1)
+    ]
+    for t in range(args.turns):
+        gen = gens[t * len(gens) // args.turns]
+        cited = rng.choices(chunks, weights, k=args.k)
+        sources = [dict(c, generation=gen) for c in cited]
+        message = {
+            "session_id": session,
+            "role": "assistant",
+            "content": " ".join(rng.choice(_WORDS) for _ in range(120)),
+            "created_at": start + datetime.timedelta(seconds=t),
+        }
+        yield message, sources
+
+
+def _bson_sizes(args):
+    inline = refs = 0
+    store = {}  # chunk key -> chunk document
+    for message, sources in _turns(args):
+        inline += len(bson.encode(dict(message, sources=sources)))
+        fields, chunks = repo._source_refs(sources)
+        refs += len(bson.encode(dict(message, **fields)))
+        for key, (gen, chunk) in chunks.items():
+            doc = store.setdefault(key, dict(chunk, _id=key, gens=[]))
+            if gen not in doc["gens"]:
+                doc["gens"].append(gen)
+    chunk_bytes = sum(len(bson.encode(doc)) for doc in store.values())
+    return inline, refs, chunk_bytes, len(store)
+
+
+async def _mongo(args) -> None:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from app.config import settings
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    try:
+        for layout in ("inline", "refs"):
+            db = client[f"bench_sources_{layout}"]
+            await client.drop_database(db.name)
+            await repo.ensure_indexes(db)
+            batch = []
+            for message, sources in _turns(args):
+                if layout == "inline":
+                    batch.append(dict(message, sources=sources))
+                else:
+                    refs = await repo._store_sources(db, sources)
+                    batch.append(dict(message, **refs))
+                if len(batch) >= 1000:
+                    await db["messages"].insert_many(batch)
+                    batch = []
+            if batch:
+                await db["messages"].insert_many(batch)
+            on_disk = 0
+            for name in ("messages", "chunks"):
+                st = await db.command("collStats", name)
+                on_disk += st.get("storageSize", 0) + st.get("totalIndexSize", 0)
+            session = str(message["session_id"])
+            t0 = time.perf_counter()
+            for _ in range(20):
+                await repo.get_session_messages(db, session, limit=200)
+            page_ms = (time.perf_counter() - t0) / 20 * 1000
+            print(
+                f"mongo {layout:<6} on disk {on_disk / 1e6:8.2f} MB  "
+                f"200-message page {page_ms:6.2f} ms"
+            )
+            await client.drop_database(db.name)
+    finally:
+        client.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=10_000)
+    ap.add_argument("--chunks", type=int, default=3000)
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--zipf", type=float, default=1.0)
+    ap.add_argument("--rebuilds", type=int, default=3)
+    ap.add_argument("--mongo", action="store_true")
+    args = ap.parse_args()
+
+    inline, refs, chunk_bytes, stored = _bson_sizes(args)
+    scale = 10_000 / args.turns
+    print(
+        f"turns={args.turns} k={args.k} kb_chunks={args.chunks} "
+        f"rebuilds={args.rebuilds} (sizes per 10k turns, BSON)"
+    )
+    print(f"inline sources   messages {inline * scale / 1e6:8.2f} MB")
+    print(
+        f"references       messages {refs * scale / 1e6:8.2f} MB + chunk store "
+        f"{chunk_bytes * scale / 1e6:6.2f} MB ({stored} chunk documents)"
+    )
+    saved = inline - refs - chunk_bytes
+    print(
+        f"saved            {saved * scale / 1e6:8.2f} MB "
+        f"({saved / inline:.0%} of the messages collection)"
+    )
+    if args.mongo:
+        asyncio.run(_mongo(args))
+
+
+if __name__ == "__main__":
+    main()
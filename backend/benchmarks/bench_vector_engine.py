@@ -0,0 +1,167 @@
+"""
+Dense search engines: Chroma (HNSW) vs the flat float32 and int8 indexes of
+app/flat_index.py, on the same vectors.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_engine --n 100000 --dim 768 --k 6
+
+Synthetic unit vectors drawn around a few hundred cluster centres (so top-k
+neighbourhoods are meaningful), queries are perturbed dataset vectors.
+Reports per-query latency (p50/p95, one query at a time), latency per query
+when --batch queries are searched together, the process RSS after loading
+the index and running the queries (and the anonymous part of it: the rest
+is mapped index files, reclaimable page cache), and recall@k against exact
+cosine top-k.
+Every engine runs in a fresh interpreter so RSS numbers don't mix.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from app.flat_index import FlatIndex
+
+
+_CHILD = """
+import sys, time, json
+import numpy as np
+engine, path, k, batch = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+
+def rss_mb(field="VmRSS"):
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+queries = np.load(f"{path}/queries.npy")
+t0 = time.perf_counter()
+if engine == "chroma":
+    import chromadb
+    col = chromadb.PersistentClient(path=f"{path}/chroma").get_collection("bench")
+    def search(qs):
+        return col.query(query_embeddings=qs.tolist(), n_results=k, include=[])["ids"]
+else:
+    from app.flat_index import FlatIndex
+    index = FlatIndex.load(f"{path}/flat", quantized=engine == "int8")
+    def search(qs):
+        return [[d for d, _ in hits] for hits in index.search_many(qs, k)]
+search(queries[:1])  # open / page in
+load = time.perf_counter() - t0
+
+single, found = [], []
+for q in queries:
+    t0 = time.perf_counter()
+    found += search(q[None, :])
+    single.append(time.perf_counter() - t0)
+t0 = time.perf_counter()
+for start in range(0, len(queries), batch):
+    search(queries[start : start + batch])
+batched = (time.perf_counter() - t0) / len(queries)
+print(json.dumps({
+    "load": load, "single": single, "batched": batched,
+    "rss": rss_mb(), "anon": rss_mb("RssAnon"), "found": found,
+}))
+"""
+
+
+def _dataset(n: int, dim: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, n // 300), dim)).astype(np.float32)
+    vectors = centres[rng.integers(len(centres), size=n)]
+    vectors += 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(n, size=n_queries)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def _exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    out = []
+    for start in range(0, len(queries), 64):
+        scores = vectors @ queries[start : start + 64].T
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        out.append(top.T)
+    return np.concatenate(out)
+
+
+def _build(path: str, vectors: np.ndarray, engines) -> None:
+    ids = [f"bench.pdf::{i}::x" for i in range(len(vectors))]
+
+    def fetch(batch):
+        rows = [int(doc_id.split("::")[1]) for doc_id in batch]
+        return {
+            "ids": batch,
+            "embeddings": vectors[rows],
+            "documents": ["" for _ in rows],
+            "metadatas": [{} for _ in rows],
+        }
+
+    if "flat" in engines or "int8" in engines:
+        os.makedirs(f"{path}/flat")
+        t0 = time.perf_counter()
+        FlatIndex.sync(f"{path}/flat", ids, fetch, quantized="int8" in engines)
+        print(f"built flat index in {time.perf_counter() - t0:.1f}s")
+    if "chroma" in engines:
+        import chromadb
+
+        t0 = time.perf_counter()
+        col = chromadb.PersistentClient(path=f"{path}/chroma").create_collection("bench")
+        for start in range(0, len(ids), 5000):
+            stop = start + 5000
+            col.add(ids=ids[start:stop], embeddings=vectors[start:stop].tolist())
+        print(f"built chroma collection in {time.perf_counter() - t0:.1f}s")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--k", type=int, default=6)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--engines", nargs="+", default=["chroma", "flat", "int8"])
+    args = ap.parse_args()
+
+    path = tempfile.mkdtemp(prefix="bench_engines_")
+    vectors, queries = _dataset(args.n, args.dim, args.queries)
+    np.save(f"{path}/queries.npy", queries)
+    truth = _exact_top_k(vectors, queries, args.k)
+    _build(path, vectors, args.engines)
+    del vectors
+
+    print(f"n={args.n} dim={args.dim} k={args.k} queries={args.queries}")
+    for engine in args.engines:
+        out = subprocess.run(
+            [sys.executable, "-c", _CHILD, engine, path, str(args.k), str(args.batch)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        single = np.asarray(r["single"]) * 1000
+        recall = np.mean(
+            [
+                len({int(d.split("::")[1]) for d in found} & set(exact)) / args.k
+                for found, exact in zip(r["found"], truth)
+            ]
+        )
+        print(
+            f"{engine:<7} load={r['load'] * 1000:7.0f}ms  "
+            f"p50={np.percentile(single, 50):6.2f}ms  "
+            f"p95={np.percentile(single, 95):6.2f}ms  "
+            f"batched={r['batched'] * 1000:6.2f}ms/q  "
+            f"rss={r['rss']:6.0f}MB (anon {r['anon']:4.0f}MB)  "
+            f"recall@{args.k}={recall:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+/chat throughput with 1..N uvicorn worker processes.
+
+Usage (from backend/, with MongoDB reachable at MONGO_URI):
+    python -m benchmarks.bench_workers --workers 1 2 4 --concurrency 32 --seconds 20
+
+Each level starts `uvicorn --workers N` on the real app (benchmarks/_worker_app.py
+swaps in fake embeddings and an LLM that sleeps --llm-delay seconds), so what
+scales is the per-request CPU work: request parsing, retrieval, Mongo
+round-trips and serialization. The sample knowledge base is indexed once into
+a temp PERSIST_DIR that all workers share. The load generator is a thread
+pool in this process; run it on a machine with more cores than the largest
+worker count or it becomes the bottleneck itself.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.embeddings import DeterministicFakeEmbedding
+
+from app.ml_service import EnhancedPDFRAGChatbot
+from benchmarks.bench_chat_concurrency import _percentile
+
+
+def _post_chat(base: str, i: int) -> float:
+    body = json.dumps({"question": f"What projects has Saugat built? ({i})", "k": 4})
+    req = urllib.request.Request(
+        f"{base}/chat",
+        data=body.encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        resp.read()
+    return time.perf_counter() - t0
+
+
+def _wait_ready(base: str, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base}/stats", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"server at {base} did not come up")
+
+
+def _run_level(workers: int, args, env) -> None:
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "benchmarks._worker_app:app",
+            "--workers",
+            str(workers),
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+    )
+    try:
+        _wait_ready(base)
+        # warm every worker (first request opens Chroma, Mongo, ...)
+        with ThreadPoolExecutor(workers * 4) as pool:
+            list(pool.map(lambda i: _post_chat(base, i), range(workers * 8)))
+
+        latencies = []
+        end = time.perf_counter() + args.seconds
+
+        def client(offset: int) -> None:
+            i = offset
+            while time.perf_counter() < end:
+                latencies.append(_post_chat(base, i))
+                i += args.concurrency
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(client, range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        print(
+            f"workers={workers:<3} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50={statistics.median(latencies) * 1000:7.1f}ms "
+            f"p99={_percentile(latencies, 99) * 1000:7.1f}ms"
+        )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", default="data/knowledge_base")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seconds", type=float, default=20.0)
+    ap.add_argument("--llm-delay", type=float, default=0.05)
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    persist_dir = tempfile.mkdtemp(prefix="bench_chroma_")
+    bot = EnhancedPDFRAGChatbot(persist_directory=persist_dir, api_key="bench")
+    bot._embeddings = DeterministicFakeEmbedding(size=64)
+    bot.build_vectorstore_from_folder(args.folder)
+
+    env = dict(
+        os.environ,
+        PERSIST_DIR=persist_dir,
+        KB_FOLDER=os.path.abspath(args.folder),
+        DB_NAME=os.getenv("DB_NAME", "ragdb_bench"),
+        BENCH_LLM_DELAY=str(args.llm_delay),
+    )
+    print(f"MongoDB: {env.get('MONGO_URI', 'mongodb://mongo:27017')} db={env['DB_NAME']}")
+    for workers in args.workers:
+        _run_level(workers, args, env)
+
+
+if __name__ == "__main__":
+    main()
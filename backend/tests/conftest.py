@@ -0,0 +1,84 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+# settings are read at import time: point them at a scratch dir first
+_tmp = tempfile.mkdtemp(prefix="rag_tests_")
+os.environ.setdefault("PERSIST_DIR", os.path.join(_tmp, "persist"))
+os.environ.setdefault("KB_FOLDER", os.path.join(_tmp, "kb"))
+os.environ.setdefault("WARMUP", "0")
+os.environ.setdefault("MIGRATE_INLINE_SOURCES", "0")
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_HERE))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """app.main with Mongo replaced by in-memory stand-ins; saved messages
+    are recorded in api.saved."""
+    import app.main as m
+
+    saved = []
+
+    async def get_or_create_session(db, session_id):
+        return "0" * 24
+
+    async def fetch_history_pairs(db, session_oid, limit):
+        return []
+
+    async def save_turn(db, session_oid, question, answer, sources, asked_at=None):
+        saved.append(("turn", question, answer))
+
+    async def save_message(db, session_oid, role, content, *args, **kwargs):
+        saved.append((role, content))
+
+    monkeypatch.setattr(m, "a_sync_db", object())
+    monkeypatch.setattr(m, "get_or_create_session", get_or_create_session)
+    monkeypatch.setattr(m, "fetch_history_pairs", fetch_history_pairs)
+    monkeypatch.setattr(m, "save_turn", save_turn)
+    monkeypatch.setattr(m, "save_message", save_message)
+    m.saved = saved
+    return m
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    """A copy of the sample knowledge base; bots embed with fake embeddings."""
+    import app.ml_service as ms
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    monkeypatch.setattr(
+        ms, "make_embeddings", lambda *a, **kw: DeterministicFakeEmbedding(size=16)
+    )
+    folder = tmp_path / "kb"
+    sample = os.path.join(os.path.dirname(_HERE), "data", "knowledge_base")
+    shutil.copytree(sample, folder)
+    return str(folder)
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory Motor database (mongomock-motor; skipped without it)."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.collection
+    from pymongo.results import BulkWriteResult
+
+    # mongomock can't run pymongo's bulk operation objects; the repo only
+    # bulk-writes UpdateOne, so apply those one by one
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        upserted, matched = [], 0
+        for index, op in enumerate(requests):
+            result = self.update_one(op._filter, op._doc, upsert=op._upsert)
+            matched += result.matched_count
+            if result.upserted_id is not None:
+                upserted.append({"index": index, "_id": result.upserted_id})
+        return BulkWriteResult(
+            {"nMatched": matched, "nUpserted": len(upserted), "upserted": upserted},
+            True,
+        )
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+    return mongomock_motor.AsyncMongoMockClient()["tests"]
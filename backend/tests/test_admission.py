@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.admission import AdmissionQueue, Overloaded
+
+
+def test_full_queue_and_wait_timeout_are_rejected():
+    async def run():
+        queue = AdmissionQueue(max_active=1, max_queue=1, max_wait=0.05)
+        await queue.acquire()
+        waiter = asyncio.ensure_future(queue.acquire())
+        await asyncio.sleep(0)
+        assert queue.waiting == 1
+        with pytest.raises(Overloaded) as full:
+            await queue.acquire()
+        assert full.value.reason == "queue full"
+        assert full.value.retry_after == 2  # 1 waiting + 1, one slot held ~1s
+
+        with pytest.raises(Overloaded) as timed_out:
+            await waiter
+        assert timed_out.value.reason == "queue wait timed out"
+        assert queue.waiting == 0 and queue.active == 1
+        assert queue.rejected == {"queue_full": 1, "timeout": 1}
+
+        # a released slot passes to the next waiter
+        waiter = asyncio.ensure_future(queue.acquire())
+        await asyncio.sleep(0)
+        queue.release(held=1.0)
+        await waiter
+        assert queue.active == 1 and queue.admitted == 2
+        queue.release()
+        assert queue.active == 0
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_overloaded_chats_get_429_with_retry_after(api, monkeypatch, path):
+    monkeypatch.setattr(api, "admission", AdmissionQueue(1, 0, 0.05))
+    api.admission.active = 1  # the only slot is taken
+    client = TestClient(api.app)
+    r = client.post(path, json={"question": "hi"})
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "1"
+    assert "queue full" in r.json()["detail"]
+
+    # room to wait, but the slot isn't freed in time
+    api.admission.max_queue = 1
+    r = client.post(path, json={"question": "hi"})
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "1"
+    assert "timed out" in r.json()["detail"]
+    assert api.admission.rejected == {"queue_full": 1, "timeout": 1}
+    assert api.admission.active == 1 and api.admission.waiting == 0
@@ -0,0 +1,110 @@
+import json
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.admission import AdmissionQueue
+
+
+def _events(body: str):
+    """Event names of an SSE body, in order."""
+    blocks = [b for b in body.split("\n\n") if b]
+    return [b.split("\n", 1)[0][len("event: ") :] for b in blocks]
+
+
+def test_retrieval_failure_is_an_error_event(api, monkeypatch):
+    async def failing_retrieve(question, k=6, scope=None):
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(api.bot, "aretrieve", failing_retrieve)
+    r = TestClient(api.app).post("/chat/stream", json={"question": "hi"})
+    assert r.status_code == 200
+    assert _events(r.text) == ["error"]
+    assert "store unavailable" in r.text
+    assert api.saved == [("user", "hi")]
+
+
+def test_failed_streams_release_their_admission_slot(api, monkeypatch):
+    async def failing_retrieve(question, k=6, scope=None):
+        raise RuntimeError("store unavailable")
+
+    async def failing_save(*args, **kwargs):
+        raise RuntimeError("mongo down")
+
+    monkeypatch.setattr(api.bot, "aretrieve", failing_retrieve)
+    monkeypatch.setattr(api.admission, "max_active", 2)
+    client = TestClient(api.app, raise_server_exceptions=False)
+    for _ in range(3):
+        r = client.post("/chat/stream", json={"question": "hi"})
+        assert r.status_code == 200
+    # cleanup itself failing must not leak the slot either
+    monkeypatch.setattr(api, "save_message", failing_save)
+    for _ in range(3):
+        client.post("/chat/stream", json={"question": "hi"})
+    assert api.admission.active == 0
+    assert api.admission.stats()["rejected"]["queue_full"] == 0
+
+
+def test_monotonic_metrics_are_counters(api):
+    text = TestClient(api.app).get("/metrics").text
+    types = dict(
+        line.split()[2:4] for line in text.splitlines() if line.startswith("# TYPE")
+    )
+    assert types["rag_cache_hits_total"] == "counter"
+    assert types["rag_admission_rejected_total"] == "counter"
+    assert types["rag_admission_requests"] == "gauge"
+    assert all(k != "counter" or n.endswith("_total") for n, k in types.items())
+
+
+def test_client_disconnect_mid_stream_releases_the_slot(api, monkeypatch):
+    async def retrieve(question, k=6, scope=None):
+        return []
+
+    async def endless_answer(question, docs, structured=False):
+        while True:
+            yield "token "
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(api.bot, "aretrieve", retrieve)
+    monkeypatch.setattr(api.bot, "astream_answer", endless_answer)
+    monkeypatch.setattr(api, "admission", AdmissionQueue(2, 0, 1.0))
+
+    async def run():
+        tokens = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                body = json.dumps({"question": "hi"}).encode()
+                return {"type": "http.request", "body": body, "more_body": False}
+            await tokens.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            assert api.admission.active == 1
+            if message.get("body", b"").startswith(b"event: token"):
+                tokens.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/chat/stream",
+            "raw_path": b"/chat/stream",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        await asyncio.wait_for(api.app(scope, receive, send), 5)
+        assert tokens.is_set()
+
+    asyncio.run(run())
+    assert api.admission.active == 0
+    # the partial answer is still saved
+    assert [kind for kind, *_ in api.saved] == ["turn"]
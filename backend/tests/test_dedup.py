@@ -0,0 +1,31 @@
+import os
+
+from app.dedup import BANDS_FILE, DedupIndex
+
+TEXT = " ".join(f"word{i}" for i in range(200))
+
+
+def test_layers_match_through_saved_band_hashes(tmp_path):
+    base, top = tmp_path / "base", tmp_path / "top"
+    base.mkdir()
+    top.mkdir()
+    index = DedupIndex()
+    assert index.match("/kb/a.pdf::0::x", TEXT) is None
+    assert index.match("/kb/b.pdf::0::y", "something else entirely") is None
+    index.save(str(base))
+
+    # a top layer replacing a.pdf's chunk; b.pdf's is no longer in the manifest
+    layered = DedupIndex.load_layers([str(top), str(base)], {"/kb/a.pdf::0::x"})
+    assert len(layered) == 1
+    assert layered.match("/kb/c.pdf::0::z", TEXT + " extra") == "/kb/a.pdf::0::x"
+    assert layered.match("/kb/d.pdf::0::w", "something else entirely") is None
+    layered.save(str(top), only={"/kb/d.pdf::0::w"})
+    assert len(DedupIndex.load(str(top))) == 1
+
+    # written before band hashes were saved: they are computed on load
+    os.remove(base / BANDS_FILE)
+    legacy = DedupIndex.load(str(base))
+    assert legacy.match("/kb/c.pdf::0::z", TEXT + " extra") == "/kb/a.pdf::0::x"
+    # chunks only match within their collection
+    other = DedupIndex.load(str(base), kb_folder="/kb")
+    assert other.match("/kb/collections/x/c.pdf::0::z", TEXT) is None
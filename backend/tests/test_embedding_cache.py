@@ -0,0 +1,21 @@
+from app.embedding_cache import EmbeddingCache
+
+
+def test_writes_track_the_row_count_and_evict_lru(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=3)
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+
+    cache.put_many("m", {"a": [1.0], "b": [2.0]})
+    cache.put_many("m", {"b": [2.0]})  # stored meanwhile by another writer
+    assert not any("COUNT" in s for s in statements)
+    assert cache.stats()["entries"] == 2
+
+    cache.get_many("m", ["a"])  # "b" is now the least recently used
+    cache.put_many("m", {"c": [3.0], "d": [4.0]})
+    assert sorted(cache.get_many("m", ["a", "b", "c", "d"])) == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+    # a second process opening the file counts its rows
+    assert EmbeddingCache(path, max_entries=3)._count == 3
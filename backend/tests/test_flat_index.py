@@ -0,0 +1,34 @@
+import numpy as np
+
+from app.flat_index import FlatIndex
+
+
+def _store(meta):
+    vectors = {f"a.pdf::{i}::x": np.eye(4, dtype=np.float32)[i] for i in range(3)}
+
+    def fetch(ids):
+        return {
+            "ids": ids,
+            "embeddings": [vectors[i] for i in ids],
+            "documents": [f"text {i}" for i in ids],
+            "metadatas": [dict(meta.get(i, {})) for i in ids],
+        }
+
+    return list(vectors), fetch
+
+
+def test_sync_rereads_rows_whose_metadata_changed(tmp_path):
+    meta = {}
+    ids, fetch = _store(meta)
+    assert FlatIndex.sync(str(tmp_path), ids, fetch)["added"] == 3
+
+    meta[ids[1]] = {"duplicate_sources": ["/kb/b.pdf"], "duplicate_pages": [0]}
+    # same ids: nothing is re-read unless asked to
+    assert FlatIndex.sync(str(tmp_path), ids, fetch)["refreshed"] == 0
+    result = FlatIndex.sync(str(tmp_path), ids, fetch, refresh=[ids[1], "gone"])
+    assert (result["added"], result["refreshed"]) == (0, 1)
+
+    index = FlatIndex.load(str(tmp_path))
+    got = index.get([ids[1]], include=["metadatas"])
+    index.close()
+    assert got["metadatas"][0]["duplicate_sources"] == ["/kb/b.pdf"]
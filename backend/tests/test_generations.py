@@ -0,0 +1,44 @@
+from app.generations import GenerationStore
+
+
+def test_gc_keeps_running_builds(tmp_path):
+    store = GenerationStore(str(tmp_path), keep=0, grace_seconds=0)
+    old = store.create()
+    store.activate(old)
+    store.activate(store.create())  # `old` is now retired
+    building = store.create()
+
+    with store.build_lock():  # a build is running (here, or in another worker)
+        assert store.gc() == [old]
+    assert store.exists(building)
+
+    # no build running: an unfinished generation is abandoned
+    assert store.gc() == [building]
+
+
+def test_gc_from_the_build_itself_collects_abandoned_builds(tmp_path):
+    store = GenerationStore(str(tmp_path), keep=0, grace_seconds=0)
+    store.activate(store.create())
+    abandoned = store.create(base=store.active_id())
+    with store.build_lock():
+        assert store.gc() == []
+        assert store.gc(lock_held=True) == [abandoned]
+
+
+def test_overlay_keeps_its_lower_layers_until_unneeded(tmp_path):
+    store = GenerationStore(str(tmp_path), keep=0, grace_seconds=0)
+    base = store.create()
+    store.activate(base)
+    top = store.create(base=base, overlay=True)
+    assert store.layers(top) == [top, base]
+    store.record_hidden(top, 3)
+    store.activate(top)
+
+    # `base` is retired, but the active generation still reads it
+    assert store.gc() == []
+    assert store.exists(base)
+    unfinished = store.create(base=top, overlay=True)
+    assert store.hidden_rows(unfinished) == 3
+
+    store.activate(store.create())  # e.g. a fold: the chain is unneeded now
+    assert sorted(store.gc()) == sorted([base, top, unfinished])
@@ -0,0 +1,110 @@
+import os
+import shutil
+
+import pytest
+
+import app.ml_service as ms
+from app.kb_manifest import KBManifest
+
+
+def _fingerprint(path, sha256="0" * 64):
+    st = os.stat(path)
+    return {"sha256": sha256, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def test_diff_finds_added_changed_removed_and_interrupted_files(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    for name in ("same", "touched", "changed", "partial"):
+        (kb / f"{name}.pdf").write_bytes(f"%PDF {name}".encode())
+    manifest = KBManifest.load(str(tmp_path / "persist"))
+    plan = manifest.diff(str(kb))
+    assert [os.path.basename(p) for p in plan.added] == [
+        "changed.pdf", "partial.pdf", "same.pdf", "touched.pdf"
+    ]
+    for path in plan.added:
+        manifest.record(path, plan.fingerprints[path], [f"{path}::0::x"])
+    manifest.record(
+        str(kb / "partial.pdf"),
+        plan.fingerprints[str(kb / "partial.pdf")],
+        ["p0"],
+        complete=False,
+    )
+    manifest.record(str(kb / "gone.pdf"), _fingerprint(kb / "same.pdf"), ["g0"])
+    manifest.save()
+
+    (kb / "changed.pdf").write_bytes(b"%PDF changed, longer")
+    os.utime(kb / "touched.pdf", (1, 1))  # new mtime, same content
+    (kb / "new.pdf").write_bytes(b"%PDF new")
+    manifest = KBManifest.load(str(tmp_path / "persist"))
+    plan = manifest.diff(str(kb), chunking=manifest.chunking)
+    name = os.path.basename
+    assert [name(p) for p in plan.added] == ["new.pdf", "partial.pdf"]
+    assert [name(p) for p in plan.updated] == ["changed.pdf"]
+    assert [name(p) for p in plan.removed] == ["gone.pdf"]
+    assert sorted(name(p) for p in plan.unchanged) == ["same.pdf", "touched.pdf"]
+    assert plan.resume == {str(kb / "partial.pdf"): ["p0"]}
+    assert plan.fingerprints[str(kb / "touched.pdf")]["mtime"] == 1
+
+    # other splitter settings: every indexed file is split again
+    manifest.chunking = "recursive:1000:100:x"
+    plan = manifest.diff(str(kb), chunking="recursive:1500:200:x")
+    assert sorted(name(p) for p in plan.updated) == [
+        "changed.pdf", "partial.pdf", "same.pdf", "touched.pdf"
+    ]
+
+
+def _bot(tmp_path, name="p"):
+    return ms.EnhancedPDFRAGChatbot(
+        persist_directory=str(tmp_path / name), api_key="x", index_batch_size=2
+    )
+
+
+def _indexed(bot):
+    manifest = KBManifest.load(bot.generations.path_for(bot.generations.active_id()))
+    return {
+        os.path.basename(p): (e["doc_ids"], e["complete"])
+        for p, e in manifest.entries.items()
+    }
+
+
+def test_interrupted_build_resumes_from_its_checkpoint(kb, tmp_path, monkeypatch):
+    from app.indexing import StreamingIndexer
+
+    commit, commits = StreamingIndexer._commit, []
+
+    def failing_commit(self):
+        if len(commits) == 2:
+            raise KeyboardInterrupt
+        commits.append(len(self._batch))
+        commit(self)
+
+    monkeypatch.setattr(StreamingIndexer, "_commit", failing_commit)
+    bot = _bot(tmp_path)
+    with pytest.raises(KeyboardInterrupt):
+        bot.build_vectorstore_from_folder(kb)
+    assert bot.generations.active_id() is None
+    monkeypatch.setattr(StreamingIndexer, "_commit", commit)
+
+    report = bot.build_vectorstore_from_folder(kb)
+    assert report["resumed"]
+    fresh = _bot(tmp_path, "fresh")
+    expected = fresh.build_vectorstore_from_folder(kb)
+    assert report["chunks_added"] == expected["chunks_added"] - sum(commits)
+    assert _indexed(bot) == _indexed(fresh)
+    store = bot._make_store(bot.generations.path_for(report["generation"]))
+    assert store._collection.count() == expected["chunks_added"]
+
+
+def test_unchanged_folder_keeps_the_generation(kb, tmp_path):
+    bot = _bot(tmp_path)
+    first = bot.build_vectorstore_from_folder(kb)
+    generations = bot.generations.ids()
+    os.utime(os.path.join(kb, sorted(os.listdir(kb))[0]))  # touched only
+
+    report = bot.build_vectorstore_from_folder(kb)
+    assert report["generation"] == first["generation"]
+    assert bot.generations.active_id() == first["generation"]
+    assert bot.generations.ids() == generations
+    assert report["chunks_added"] == report["chunks_removed"] == 0
+    assert report["unchanged"] == len(os.listdir(kb))
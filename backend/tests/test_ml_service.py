@@ -0,0 +1,54 @@
+import asyncio
+
+
+def test_llm_slots_work_on_successive_event_loops(api):
+    """chat_batch runs each batch under its own asyncio.run()."""
+    bot = api.bot
+    in_flight = []
+
+    async def contend():
+        async def call():
+            async with bot._llm_slots():
+                in_flight.append(None)
+                assert len(in_flight) <= bot.llm_concurrency
+                await asyncio.sleep(0.01)
+                in_flight.pop()
+
+        await asyncio.gather(*(call() for _ in range(bot.llm_concurrency + 2)))
+
+    asyncio.run(contend())
+    asyncio.run(contend())
+
+
+def test_lexical_fast_path_needs_a_runner_up_to_beat(api):
+    bot = api.bot
+    ratio = bot.lexical_fast_path_ratio
+    assert not bot._lexical_is_decisive([])
+    # one hit: nothing to compare with, dense search decides
+    assert not bot._lexical_is_decisive([("a", 12.0)])
+    assert bot._lexical_is_decisive([("a", ratio * 2.0), ("b", 2.0)])
+    assert not bot._lexical_is_decisive([("a", ratio * 2.0 - 0.1), ("b", 2.0)])
+
+
+def test_single_keyword_hit_goes_to_dense_search(kb, tmp_path):
+    import app.ml_service as ms
+
+    bot = ms.EnhancedPDFRAGChatbot(
+        persist_directory=str(tmp_path / "p"), api_key="x", retrieval_mode="hybrid"
+    )
+    bot.build_vectorstore_from_folder(kb)
+    docs = bot.retrieve("mentoring", k=4)  # the word is in one chunk only
+    assert len(docs) == 4
+    assert bot.retrieval_counts["lexical_fast_path"] == 0
+
+
+def test_missing_collection_is_not_embedded_for(kb, tmp_path, monkeypatch):
+    import app.ml_service as ms
+    from app.scopes import Scope
+
+    bot = ms.EnhancedPDFRAGChatbot(persist_directory=str(tmp_path / "p"), api_key="x")
+    bot.build_vectorstore_from_folder(kb)
+    embedded = []
+    monkeypatch.setattr(bot.embeddings, "embed_query", embedded.append)
+    assert bot.retrieve("education", scope=Scope.of("nope")) == []
+    assert embedded == []
@@ -0,0 +1,318 @@
+import json
+import base64
+import asyncio
+import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.db import mongo_repo as repo
+
+
+def test_write_behind_never_delays_the_history_window(mongo, monkeypatch):
+    async def run():
+        await repo.ensure_indexes(mongo)
+        buffer = repo.SessionActivityBuffer(mongo, interval=3600)
+        monkeypatch.setattr(repo, "_activity_buffer", buffer)
+        oid = await repo.get_or_create_session(mongo, "s1")
+        await repo.save_turn(mongo, oid, "q1", "a1")
+
+        # what another worker (without this process's buffer) reads
+        monkeypatch.setattr(repo, "_activity_buffer", None)
+        assert await repo.fetch_history_pairs(mongo, oid, 4) == [("q1", "a1")]
+        turn_at = (await mongo["sessions"].find_one({"_id": oid}))["last_activity_at"]
+
+        # a message without an answer only bumps the activity time, buffered
+        monkeypatch.setattr(repo, "_activity_buffer", buffer)
+        await asyncio.sleep(0.002)  # Mongo keeps milliseconds
+        await repo.save_message(mongo, oid, "user", "q2")
+        session = await mongo["sessions"].find_one({"_id": oid})
+        assert session["last_activity_at"] == turn_at
+        await buffer.close()
+        session = await mongo["sessions"].find_one({"_id": oid})
+        assert session["last_activity_at"] > turn_at
+        assert len(session["recent_pairs"]) == 1
+
+    asyncio.run(run())
+
+
+SOURCES = [
+    {
+        "file_name": "resume.pdf",
+        "source": "/kb/resume.pdf",
+        "snippet": "BSc in computer science",
+        "doc_id": "/kb/resume.pdf::0::a1",
+        "generation": "g1",
+    },
+    {
+        "file_name": "projects.pdf",
+        "source": "/kb/projects.pdf",
+        "snippet": "a chess engine in Rust",
+        "doc_id": "/kb/projects.pdf::3::b2",
+        "generation": "g1",
+    },
+]
+# as stored before chunks had ids
+LEGACY = [{k: s[k] for k in ("file_name", "source", "snippet")} for s in SOURCES]
+
+
+@pytest.fixture
+def db(mongo):
+    repo._stored_chunks.clear()
+    yield mongo
+    repo._stored_chunks.clear()
+
+
+async def _messages(db):
+    rows = await db["messages"].find({"role": "assistant"}).sort("_id", 1).to_list(None)
+    await repo.resolve_sources(db, rows)
+    return rows
+
+
+def test_sources_round_trip_through_the_chunk_store(db):
+    async def run():
+        oid = await repo.get_or_create_session(db, "s1")
+        await repo.save_turn(db, oid, "q1", "a1", SOURCES)
+        await repo.save_turn(db, oid, "q2", "a2", SOURCES[:1])  # chunk stored once
+        await repo.save_turn(db, oid, "q3", "a3", LEGACY)
+        assert await db["chunks"].count_documents({}) == 4
+
+        first, second, legacy = await _messages(db)
+        assert first["sources"] == SOURCES
+        assert second["sources"] == SOURCES[:1]
+        assert "source_ids" not in first
+        assert legacy["sources"] == [
+            dict(s, doc_id=None, generation=None) for s in LEGACY
+        ]
+
+    asyncio.run(run())
+
+
+def test_store_chunks_keeps_inserts_of_an_attempt_that_raced(db, monkeypatch):
+    """The first bulk_write inserts all but one chunk, which another writer
+    inserted meanwhile; the retry only updates, yet all of ours are new."""
+    import mongomock.collection
+    from pymongo.errors import BulkWriteError
+
+    real = mongomock.collection.Collection.bulk_write
+    calls = []
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        calls.append(len(requests))
+        if len(calls) > 1:
+            return real(self, requests, ordered=ordered, **kwargs)
+        *ours, theirs = requests
+        self.update_one(theirs._filter, theirs._doc, upsert=True)
+        details = real(self, ours, ordered=ordered).bulk_api_result
+        details["writeErrors"] = [{"index": len(ours), "code": 11000}]
+        raise BulkWriteError(details)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", bulk_write)
+
+    async def run():
+        _, chunks = repo._source_refs(SOURCES + [dict(SOURCES[0], doc_id="x::0::c")])
+        added = await repo._store_chunks(db, chunks)
+        assert calls == [3, 3]
+        assert [c["doc_id"] for c in added] == [s["doc_id"] for s in SOURCES]
+        assert await db["chunks"].count_documents({}) == 3
+
+    asyncio.run(run())
+
+
+def test_migrate_inline_sources(db):
+    async def run():
+        oid = await repo.get_or_create_session(db, "s1")
+        await db["messages"].insert_many(
+            [
+                {"session_id": oid, "role": "assistant", "content": "a1", "sources": SOURCES},
+                {"session_id": oid, "role": "assistant", "content": "a2", "sources": LEGACY},
+                {"session_id": oid, "role": "assistant", "content": "a3", "sources": SOURCES},
+            ]
+        )
+        dry = await repo.migrate_inline_sources(db, batch_size=2, dry_run=True)
+        assert await db["chunks"].count_documents({}) == 0
+        report = await repo.migrate_inline_sources(db, batch_size=2)
+        assert dry == dict(report, dry_run=True)
+        assert report["messages"] == 3
+        assert report["chunks_added"] == 4
+        assert report["bytes_saved"] == report["bytes_before"] - report["bytes_after"]
+
+        rows = await db["messages"].find({}).sort("_id", 1).to_list(None)
+        assert all("sources" not in m for m in rows)
+        assert rows[0]["source_gen"] == "g1" and rows[1]["source_gen"] == repo.INLINE_GEN
+        first, legacy, third = await _messages(db)
+        assert first["sources"] == third["sources"] == SOURCES
+        assert [s["snippet"] for s in legacy["sources"]] == [s["snippet"] for s in LEGACY]
+
+        again = await repo.migrate_inline_sources(db)
+        assert again["messages"] == again["chunks_added"] == 0
+
+    asyncio.run(run())
+
+
+def test_gc_chunks_under_the_maintenance_lock(db):
+    async def run():
+        oid = await repo.get_or_create_session(db, "s1")
+        await repo.save_turn(db, oid, "q1", "a1", SOURCES)
+        await repo.save_turn(db, oid, "q2", "a2", [dict(SOURCES[0], generation="g0")])
+        # the second turn is deleted; its chunk was cited from another generation
+        await db["messages"].delete_many({"content": {"$in": ["q2", "a2"]}})
+        await repo._store_chunks(db, repo._source_refs(LEGACY)[1])  # save failed
+        assert await db["chunks"].count_documents({}) == 4
+        await repo.save_turn(db, oid, "q3", "a3", [dict(SOURCES[1], doc_id="x::0::c")])
+        # ... all of it long ago, except the unreferenced chunk of a3's turn
+        fresh = {"doc_id": "x::0::c"}
+        await db["messages"].delete_many({"content": {"$in": ["q3", "a3"]}})
+        await db["chunks"].update_many(
+            {"doc_id": {"$ne": "x::0::c"}},
+            {"$set": {"stored_at": datetime.datetime(2020, 1, 1)}},
+        )
+        await db["chunks"].update_one(
+            {"doc_id": SOURCES[0]["doc_id"]}, {"$unset": {"stored_at": ""}}
+        )
+
+        with pytest.raises(ValueError):
+            await repo.gc_chunks(db, grace_seconds=60)
+        async with repo.maintenance_lock(db, "gc-chunks") as held:
+            assert held
+            async with repo.maintenance_lock(db, "gc-chunks") as other:
+                assert not other
+            dry = await repo.gc_chunks(db, dry_run=True)
+            assert await db["chunks"].count_documents({}) == 5
+            report = await repo.gc_chunks(db)
+        assert dry == dict(report, dry_run=True)
+        assert report == {"dry_run": False, "referenced": 2, "scanned": 4, "deleted": 2}
+        # the lock is free again
+        async with repo.maintenance_lock(db, "gc-chunks") as held:
+            assert held
+
+        left = await db["chunks"].find({}, {"doc_id": 1, "gens": 1}).to_list(None)
+        assert sorted((c["doc_id"], c["gens"]) for c in left) == sorted(
+            [
+                (SOURCES[0]["doc_id"], ["g1", "g0"]),
+                (SOURCES[1]["doc_id"], ["g1"]),
+                (fresh["doc_id"], ["g1"]),
+            ]
+        )
+        (first,) = await _messages(db)
+        assert first["sources"] == SOURCES
+
+    asyncio.run(run())
+
+
+T0 = datetime.datetime(2026, 1, 1)
+
+
+async def _seed_pages(db):
+    """7 sessions and 7 messages of one session, with ties in the sort keys;
+    returns both in the order the API lists them."""
+    minutes = [3, 3, 3, 1, 2, 2, 0]
+    sessions = [{"_id": ObjectId(), "last_activity_at": T0} for _ in minutes]
+    for s, m in zip(sessions, minutes):
+        s["last_activity_at"] = T0 + datetime.timedelta(minutes=m)
+    await db["sessions"].insert_many(sessions)
+    oid = sessions[0]["_id"]
+    messages = [
+        {
+            "_id": ObjectId(),
+            "session_id": oid,
+            "role": "user",
+            "content": f"m{i}",
+            "sources": [],
+            "created_at": T0 + datetime.timedelta(minutes=m),
+        }
+        for i, m in enumerate(minutes)
+    ]
+    await db["messages"].insert_many(messages)
+    by_activity = sorted(sessions, key=lambda s: (s["last_activity_at"], s["_id"]))
+    by_time = sorted(messages, key=lambda m: (m["created_at"], m["_id"]))
+    return (
+        str(oid),
+        [str(s["_id"]) for s in reversed(by_activity)],
+        [m["content"] for m in by_time],
+    )
+
+
+def test_keyset_pages_cover_ties_exactly_once(db):
+    async def pages(fetch, key):
+        seen, cursor = [], None
+        while True:
+            items, cursor = await fetch(cursor)
+            assert 1 <= len(items) <= 3
+            seen.extend(item[key] for item in items)
+            if cursor is None:
+                return seen
+
+    async def run():
+        sid, sessions, messages = await _seed_pages(db)
+        assert await pages(
+            lambda c: repo.list_sessions(db, limit=3, cursor=c), "session_id"
+        ) == sessions
+        assert await pages(
+            lambda c: repo.get_session_messages(db, sid, limit=3, cursor=c), "content"
+        ) == messages
+
+        # a cursor resumes right after its row, inside a run of ties
+        rows = [row async for row in repo.iter_session_messages(db, sid)]
+        (_, cursor) = rows[4]  # the first of three at minute 3
+        assert repo.decode_cursor(cursor)[0] == T0 + datetime.timedelta(minutes=3)
+        rest = [m["content"] async for m, _ in repo.iter_session_messages(db, sid, cursor)]
+        assert rest == messages[5:]
+
+    asyncio.run(run())
+
+
+BAD_CURSORS = [
+    "not a cursor!",
+    base64.urlsafe_b64encode(b"{not json").decode(),
+    base64.urlsafe_b64encode(b'{"t": "2026-01-01T00:00:00"}').decode(),
+    base64.urlsafe_b64encode(b'{"t": "yesterday", "id": "0"}').decode(),
+    base64.urlsafe_b64encode(b'{"t": "2026-01-01T00:00:00", "id": "xyz"}').decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+]
+
+
+@pytest.mark.parametrize("cursor", BAD_CURSORS)
+def test_invalid_cursors_are_rejected(db, cursor):
+    async def run():
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            await repo.list_sessions(db, cursor=cursor)
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            repo.iter_session_messages(db, "0" * 24, cursor)
+
+    asyncio.run(run())
+
+
+def test_sessions_api_pages_and_exports(db, api, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    sid, sessions, messages = asyncio.run(_seed_pages(db))
+    monkeypatch.setattr(api, "a_sync_db", db)
+    client = TestClient(api.app)
+
+    r = client.get("/sessions", params={"limit": 4})
+    assert [s["session_id"] for s in r.json()] == sessions[:4]
+    r = client.get("/sessions", params={"limit": 4, "cursor": r.headers["X-Next-Cursor"]})
+    assert [s["session_id"] for s in r.json()] == sessions[4:]
+    assert "X-Next-Cursor" not in r.headers
+
+    # a tampered cursor: the same JSON with a byte flipped
+    cursor = client.get("/sessions", params={"limit": 1}).headers["X-Next-Cursor"]
+    tampered = cursor[:5] + ("A" if cursor[5] != "A" else "B") + cursor[6:]
+    for path in ("/sessions", f"/sessions/{sid}/messages"):
+        for fmt in ("json", "ndjson"):
+            r = client.get(path, params={"cursor": tampered, "format": fmt})
+            assert r.status_code == 400, (path, fmt)
+
+    asyncio.run(repo.save_turn(db, ObjectId(sid), "q", "a", SOURCES))
+    r = client.get(f"/sessions/{sid}/messages", params={"format": "ndjson"})
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [m["content"] for m in rows] == messages + ["q", "a"]
+    assert rows[-1]["sources"] == SOURCES
+    r = client.get(
+        f"/sessions/{sid}/messages",
+        params={"format": "ndjson", "include_sources": "false", "limit": 1},
+    )
+    assert all("sources" not in json.loads(line) for line in r.text.splitlines())
+    assert len(r.text.splitlines()) == len(messages) + 2  # limit: pages only
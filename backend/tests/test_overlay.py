@@ -0,0 +1,50 @@
+import os
+import shutil
+
+import pytest
+
+import app.ml_service as ms
+
+QUERIES = ["education degree", "python projects", "future goals", "skills"]
+
+
+def _results(bot):
+    return [
+        (d.metadata.get("doc_id"), tuple(d.metadata.get("duplicate_sources") or ()))
+        for q in QUERIES
+        for d in bot.retrieve(q, k=8)
+    ]
+
+
+@pytest.mark.parametrize(
+    "options", [{}, {"vector_engine": "flat", "retrieval_mode": "hybrid"}]
+)
+def test_overlay_updates_match_a_fresh_build(kb, tmp_path, options):
+    bot = ms.EnhancedPDFRAGChatbot(
+        persist_directory=str(tmp_path / "p"), api_key="x", index_max_layers=3, **options
+    )
+    bot.build_vectorstore_from_folder(kb)
+    pdfs = sorted(os.listdir(kb))
+
+    def check(layers):
+        report = bot.build_vectorstore_from_folder(kb)
+        assert report["layers"] == layers
+        fresh = ms.EnhancedPDFRAGChatbot(
+            persist_directory=str(tmp_path / f"fresh{len(os.listdir(tmp_path))}"),
+            api_key="x",
+            **options,
+        )
+        fresh.build_vectorstore_from_folder(kb)
+        bot.reload()
+        assert _results(bot) == _results(fresh)
+        return report
+
+    shutil.copy(os.path.join(kb, pdfs[0]), os.path.join(kb, "zz.pdf"))  # duplicates
+    report = check(layers=2)
+    assert report["chunks_deduplicated"] > 0
+    assert report["base_copy"]["copy"] == 0  # only the manifest, hard-linked
+
+    shutil.copy(os.path.join(kb, pdfs[1]), os.path.join(kb, "zz.pdf"))  # changed
+    check(layers=3)
+    os.remove(os.path.join(kb, "zz.pdf"))
+    check(layers=1)  # 3 layers: folded into one generation first
@@ -0,0 +1,40 @@
+from app.scopes import Scope, collection_of
+
+KB = "/data/knowledge_base"
+
+
+def test_file_scope_includes_chunks_stored_for_a_duplicate():
+    dup_of = {
+        f"{KB}/copy.pdf": {f"{KB}/copy.pdf::0::u": f"{KB}/orig.pdf::0::u"},
+        f"{KB}/collections/team/copy.pdf": {"x": "y"},  # other collection
+    }
+    scope = Scope.of(None, ["copy.pdf"])
+    paths, aliased = scope.aliases(dup_of, KB)
+    assert paths == [f"{KB}/copy.pdf"]
+    assert aliased == {f"{KB}/orig.pdf::0::u"}
+
+    assert scope.contains(f"{KB}/orig.pdf::0::u", KB, aliased)
+    assert not scope.contains(f"{KB}/orig.pdf::1::v", KB, aliased)
+    assert scope.where(paths) == {
+        "$or": [
+            {"file_name": "copy.pdf"},
+            {"duplicate_sources": {"$contains": f"{KB}/copy.pdf"}},
+        ]
+    }
+
+
+def test_unscoped_and_alias_free_filters_are_unchanged():
+    assert Scope().where() is None
+    assert Scope.of(None, ["a.pdf"]).where() == {"file_name": "a.pdf"}
+    assert Scope().aliases({"/kb/a.pdf": {"x": "y"}}, "/kb") == ([], frozenset())
+
+
+def test_collections_are_relative_to_the_kb_folder():
+    kb = "/srv/collections/kb"
+    assert collection_of(f"{kb}/cv.pdf", kb) == "default"
+    assert collection_of(f"{kb}/collections/team/x.pdf", kb) == "team"
+    assert collection_of(f"{kb}/collections/team/sub/x.pdf", kb) == "team"
+    assert collection_of(f"{kb}/collections/x.pdf", kb) == "default"
+    assert collection_of(f"{kb}/old/collections/team/x.pdf", kb) == "default"
+    # generations whose manifest predates the recorded KB folder
+    assert collection_of(f"{kb}/cv.pdf", None) == "kb"